@@ -4,6 +4,7 @@ import json
 import sys
 import math
 import os
+import traceback
 
 '''
 Floorplan to Blender
@@ -33,18 +34,102 @@ This code is tested on Windows 10, Blender 2.79, in January 2019.
 Our helpful functions
 '''
 
-def read_from_file(file_path):
+def read_from_file(file_path, arrays=False):
     '''
     Read from file
-    read verts data from file
+    read verts data from file, binary file is used if there is one
     @Param file_path, path to file
+    @Param arrays, read innermost lists of binary file as numpy arrays, see binary_to_list
     @Return data
     '''
+    if os.path.isfile(file_path+'.bin'):
+        values, levels = read_from_binary_file(file_path)
+        return binary_to_list(values, levels, arrays)
+
     #Now read the file back into a Python list object
     with open(file_path+'.txt', 'r') as f:
         data = json.loads(f.read())
     return data
 
+'''
+Binary format, same as IO.read_from_binary_file in FloorplanToBlenderLib
+'''
+binary_magic = b'F2B3'
+binary_version = 1
+binary_value_types = [np.dtype('<f4'), np.dtype('<i4')]
+
+def read_from_binary_file(file_path):
+    '''
+    Read from binary file
+    The arrays are memory mapped views of the file, nothing is copied.
+    @Param file_path, path to file
+    @Return values, levels as list of uniform size or offsets array per level
+    '''
+    buffer = np.memmap(file_path+'.bin', dtype=np.uint8, mode='r')
+    if bytes(buffer[:4]) != binary_magic:
+        raise ValueError("Not a floorplan binary file : " + file_path + ".bin")
+
+    version = int(buffer[4:6].view('<u2')[0])
+    if version > binary_version:
+        raise ValueError("Unsupported floorplan binary version " + str(version) + " : " + file_path + ".bin")
+
+    value_type = binary_value_types[buffer[6]]
+    depth = int(buffer[7])
+    sizes = np.frombuffer(buffer, '<i8', depth*2 + 1, 8)
+
+    offset = 8 + sizes.nbytes
+    levels = []
+    for i in range(depth):
+        if sizes[i*2] < 0:
+            levels.append(np.frombuffer(buffer, '<i8', sizes[i*2+1], offset))
+            offset += levels[-1].nbytes
+        else:
+            levels.append(int(sizes[i*2]))
+
+    values = np.frombuffer(buffer, value_type, sizes[-1], offset)
+    return values, levels
+
+def binary_to_list(values, levels, arrays=False):
+    '''
+    Binary to list
+    Rebuild nested lists, same as json data, from binary format arrays
+    @Param values, flat values
+    @Param levels, list of uniform size or offsets array per level
+    @Param arrays, keep innermost uniform levels as numpy array views instead of lists
+    @Return data
+    '''
+    # amount of lists on each level
+    amounts = [1]
+    for level in levels:
+        if isinstance(level, np.ndarray):
+            amounts.append(int(level[-1]))
+        else:
+            amounts.append(amounts[-1] * level)
+
+    # innermost uniform levels are reshaped by numpy
+    inner = len(levels)
+    while inner > 0 and not isinstance(levels[inner-1], np.ndarray):
+        inner -= 1
+    nodes = np.asarray(values).reshape([amounts[inner]] + levels[inner:])
+    if not arrays:
+        nodes = nodes.tolist()
+
+    for depth in reversed(range(inner)):
+        level = levels[depth]
+        if isinstance(level, np.ndarray):
+            nodes = [nodes[start:end] for start, end in zip(level[:-1], level[1:])]
+        else:
+            nodes = [nodes[i*level:(i+1)*level] for i in range(amounts[depth])]
+    return nodes[0]
+
+def file_exists(file_path):
+    '''
+    Check if data file exist, binary or json
+    @Param file_path, path to file without ending
+    @Return boolean
+    '''
+    return os.path.isfile(file_path+'.bin') or os.path.isfile(file_path+'.txt')
+
 def init_object(name):
     # Create new blender object and return references to mesh and object
     mymesh = bpy.data.meshes.new(name)
@@ -52,40 +137,69 @@ def init_object(name):
     bpy.context.collection.objects.link(myobject)
     return myobject, mymesh
 
-def average(lst): 
-    return sum(lst) / len(lst) 
-
 def get_mesh_center(verts):
     # Calculate center location of a mesh from verts
-    x=[]
-    y=[]
-    z=[]
-
-    for vert in verts:
-        x.append(vert[0])
-        y.append(vert[1])
-        z.append(vert[2])
-
-    return [average(x), average(y), average(z)]
+    return np.mean(verts, axis=0)
 
 def subtract_center_verts(verts1, verts2):
     # Remove verts1 from all verts in verts2, return result, verts1 & verts2 must have same shape!
-    for i in range(0, len(verts2)):
-        verts2[i][0] -= verts1[0]
-        verts2[i][1] -= verts1[1]
-        verts2[i][2] -= verts1[2]
-    return verts2
+    return verts2 - verts1
+
+def faces_to_loops(faces):
+    '''
+    Faces to loops
+    Convert faces to the flat buffers blender stores polygons in
+    @Param faces, list of faces or (faces, corners) numpy array of vert indices
+    @Return vert index of each loop, loop start of each face, loop amount of each face
+    '''
+    if isinstance(faces, np.ndarray) and faces.ndim == 2:
+        loop_totals = np.full(len(faces), faces.shape[1], dtype=np.int32)
+        loops = faces.reshape(-1)
+    elif len(faces) > 0:
+        loop_totals = np.array([len(face) for face in faces], dtype=np.int32)
+        loops = np.concatenate([np.asarray(face).reshape(-1) for face in faces])
+    else:
+        loop_totals = np.zeros(0, dtype=np.int32)
+        loops = np.zeros(0, dtype=np.int32)
+
+    loop_starts = np.cumsum(loop_totals, dtype=np.int32) - loop_totals
+    return loops.astype(np.int32), loop_starts, loop_totals
+
+def create_mesh_data(mymesh, verts, faces):
+    '''
+    Fill mesh with verts and faces, from numpy buffers without python loops
+    @Param mymesh, empty blender mesh
+    @Param verts, (verts, 3) numpy array
+    @Param faces, faces to use, see faces_to_loops
+    '''
+    loops, loop_starts, loop_totals = faces_to_loops(faces)
+
+    mymesh.vertices.add(len(verts))
+    mymesh.vertices.foreach_set("co", verts.astype(np.float32).reshape(-1))
+
+    mymesh.loops.add(len(loops))
+    mymesh.loops.foreach_set("vertex_index", loops)
+
+    mymesh.polygons.add(len(loop_starts))
+    mymesh.polygons.foreach_set("loop_start", loop_starts)
+    try:
+        mymesh.polygons.foreach_set("loop_total", loop_totals)
+    except (AttributeError, TypeError):
+        # read only since blender 4.0, it follows from loop_start
+        pass
 
 def create_custom_mesh(objname, verts, faces, pos = None, rot = None, mat = None, cen = None):
     '''
     @Param objname, name of new mesh
     @Param pos, object position [x, y, z]
-    @Param vertex, corners
+    @Param vertex, corners, list or numpy array
     @Param faces, buildorder
     '''
     # Create mesh and object
     myobject, mymesh = init_object(objname)
 
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+
     # Rearrange verts to put pivot point in center of mesh
     # Find center of verts
     center = get_mesh_center(verts)
@@ -93,7 +207,7 @@ def create_custom_mesh(objname, verts, faces, pos = None, rot = None, mat = None
     proper_verts = subtract_center_verts(center,verts)
 
     # Generate mesh data
-    mymesh.from_pydata(proper_verts, [], faces)
+    create_mesh_data(mymesh, proper_verts, faces)
     # Calculate the edges
     mymesh.update(calc_edges=True)
 
@@ -119,17 +233,41 @@ def create_custom_mesh(objname, verts, faces, pos = None, rot = None, mat = None
     #pivot = myobject.constraints.new(type='PIVOT')
     
     # add material
-    if mat is None: # add random color
-        myobject.data.materials.append(create_mat(np.array([0.2, 0.3, 0.8, 1]))) #add the material to the object
+    if mat is None: # add default color
+        myobject.data.materials.append(get_mat("Material", default_color)) #add the material to the object
     else:
         myobject.data.materials.append(mat) #add the material to the object
     return myobject
 
-def create_mat(rgb_color):
-    mat = bpy.data.materials.new(name="MaterialName") #set new material to variable
+def create_mat(rgb_color, name="MaterialName"):
+    mat = bpy.data.materials.new(name=name) #set new material to variable
     mat.diffuse_color = rgb_color #change to random color
     return mat
 
+'''
+Materials
+One material per semantic class (wall, floor, room, window, door) and color,
+shared by all objects instead of a new material for every mesh.
+'''
+default_color = (0.2, 0.3, 0.8, 1)
+wall_color = default_color
+room_color = default_color
+floor_color = (40, 1, 1, 1)
+
+materials = {}
+
+def get_mat(name, rgb_color):
+    '''
+    Get material from registry, created first time it is used
+    @Param name, semantic class of material
+    @Param rgb_color, color of material
+    @Return material
+    '''
+    key = (name, tuple(float(c) for c in rgb_color))
+    if key not in materials:
+        materials[key] = create_mat(rgb_color, name)
+    return materials[key]
+
 '''
 Main functionallity here!
 '''
@@ -140,12 +278,13 @@ def main(argv):
     Therefore we split data into two files
     '''
 
+    # Arguments after -- are ignored by blender, used to start a worker
+    if "--" in argv and argv[argv.index("--")+1:argv.index("--")+2] == ["worker"]:
+        worker()
+        exit(0)
+
     # Remove starting objects
-    # Select all
-    objs = bpy.data.objects
-    objs.remove(objs["Cube"], do_unlink=True)
-    objs.remove(objs['Camera'], do_unlink=True)
-    objs.remove(objs['Light'], do_unlink=True)
+    reset_scene()
 
     if(len(argv) > 6): # Note YOU need 7 arguments!
         program_path = argv[5]
@@ -153,43 +292,115 @@ def main(argv):
     else:
         exit(0)
 
+    build(program_path, output_path, argv[7:])
+
+    '''
+    Send correct exit code
+    '''
+    exit(0)
+
+def reset_scene():
+    '''
+    Remove all objects, meshes and materials, starting objects too
+    '''
+    for collection in [bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.cameras, bpy.data.lights]:
+        for block in list(collection):
+            collection.remove(block)
+    materials.clear()
+
+def build(program_path, output_path, data_paths, formats=("gltf", "blend")):
+    '''
+    Create 3d model of floorplans and save it
+    @Param program_path, path to FloorplanToBlender3d
+    @Param output_path, folder to put output in
+    @Param data_paths, list of paths to generated data, relative to program_path
+    @Param formats, any of gltf, glb, obj and blend
+    @Return list of created files
+    '''
+
     '''
     Instantiate
     '''
-    for i in range(7, len(argv)):
-        base_path = argv[i]
-        create_floorplan(base_path, program_path, i)
+    merged_walls = True
+    # names as when data paths started at argv[7]
+    for i, base_path in enumerate(data_paths, 7):
+        merged_walls &= create_floorplan(base_path, program_path, i)
 
     '''
     Save to file
-    TODO add several save modes here!
     '''
 
     # Join all the parts of the 3d-model in one mesh
+    # Not needed when walls already are one mesh per floorplan
+    if not merged_walls:
+        scene = bpy.context.scene
 
-    scene = bpy.context.scene
-
-    obs = []
-    for ob in scene.objects:
-        if ob.type == 'MESH':
-            obs.append(ob)
+        obs = []
+        for ob in scene.objects:
+            if ob.type == 'MESH':
+                obs.append(ob)
 
-    ctx = bpy.context.copy()
+        ctx = bpy.context.copy()
 
-    # one of the objects to join
-    ctx['active_object'] = obs[0]
+        # one of the objects to join
+        ctx['active_object'] = obs[0]
 
-    ctx['selected_editable_objects'] = obs
-    bpy.ops.object.join(ctx)
+        ctx['selected_editable_objects'] = obs
+        bpy.ops.object.join(ctx)
 
     filepath = output_path + os.path.sep + 'floorplan'
-    bpy.ops.export_scene.gltf(export_format='GLTF_EMBEDDED', filepath=f'{filepath}.gltf')
-    bpy.ops.wm.save_as_mainfile(filepath=f'{filepath}.blend')
+    files = []
+    for extension in formats:
+        file = filepath + '.' + extension
+        if extension == 'gltf':
+            bpy.ops.export_scene.gltf(export_format='GLTF_EMBEDDED', filepath=file)
+        elif extension == 'glb':
+            bpy.ops.export_scene.gltf(export_format='GLB', filepath=file)
+        elif extension == 'obj':
+            # export_scene.obj was removed in blender 4, wm.obj_export replaces it since 3.2
+            if "obj_export" in dir(bpy.ops.wm):
+                bpy.ops.wm.obj_export(filepath=file)
+            else:
+                bpy.ops.export_scene.obj(filepath=file)
+        elif extension == 'blend':
+            bpy.ops.wm.save_as_mainfile(filepath=file)
+        else:
+            raise ValueError("Unknown format " + extension)
+        files.append(file)
+    return files
 
-    '''
-    Send correct exit code
-    '''
-    exit(0)
+'''
+Worker
+Keeps blender running and builds one model per job, see FloorplanToBlenderLib/worker.py
+Start with: blender --background --python floorplan_to_3dObject_in_blender.py -- worker
+
+Each job is one line of json on stdin:
+    {"program_path": ..., "output_path": ..., "data_paths": [...], "formats": [...]}
+Each reply is one line on stdout starting with worker_reply, blender prints other lines too:
+    {"ok": true, "files": [...]} or {"ok": false, "error": ...}
+A ready reply is sent at start, the worker stops at end of stdin or {"quit": true}.
+'''
+worker_reply = "FLOORPLAN_WORKER_REPLY "
+
+def send_reply(reply):
+    print(worker_reply + json.dumps(reply), flush=True)
+
+def worker():
+    send_reply({"ok": True, "ready": True})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            if job.get("quit"):
+                break
+
+            reset_scene()
+            files = build(job["program_path"], job["output_path"], job["data_paths"], job.get("formats", ["gltf", "blend"]))
+            send_reply({"ok": True, "files": files})
+        except Exception:
+            send_reply({"ok": False, "error": traceback.format_exc()})
 
 def create_floorplan(base_path,program_path, name=0):
 
@@ -200,6 +411,9 @@ def create_floorplan(base_path,program_path, name=0):
     path_to_wall_faces_file = data_path + "wall_faces"
     path_to_wall_verts_file = data_path + "wall_verts"
 
+    path_to_wall_mesh_faces_file = data_path + "wall_mesh_faces"
+    path_to_wall_mesh_verts_file = data_path + "wall_mesh_verts"
+
     path_to_floor_faces_file = data_path + "floor_faces"
     path_to_floor_verts_file = data_path + "floor_verts"
 
@@ -233,59 +447,71 @@ def create_floorplan(base_path,program_path, name=0):
     '''
     Create Walls
     '''
-    # get image wall data
-    verts = read_from_file(path_to_wall_verts_file)
-    faces = read_from_file(path_to_wall_faces_file)
+    merged_walls = file_exists(path_to_wall_mesh_verts_file)
+    if merged_walls:
+        # get image wall data, all walls in one mesh
+        verts = read_from_file(path_to_wall_mesh_verts_file, arrays=True)
+        faces = read_from_file(path_to_wall_mesh_faces_file, arrays=True)
+
+        # Create mesh from data
+        obj = create_custom_mesh("Walls", verts, faces, pos=pos, rot=rot, mat=get_mat("Wall", wall_color), cen=cen)
+        obj.parent = parent
+    else:
+        # get image wall data
+        verts = read_from_file(path_to_wall_verts_file, arrays=True)
+        faces = read_from_file(path_to_wall_faces_file, arrays=True)
 
-    # Create mesh from data
-    boxcount = 0
-    wallcount = 0
+        # Create mesh from data
+        boxcount = 0
+        wallcount = 0
 
-    # Create parent
-    wall_parent, wall_parent_mesh = init_object("Walls")
+        # Create parent
+        wall_parent, wall_parent_mesh = init_object("Walls")
 
-    for box in verts:
-        boxname="Box"+str(boxcount)
-        for wall in box:
-            wallname = "Wall"+str(wallcount)
+        for box in verts:
+            boxname="Box"+str(boxcount)
+            for wall in box:
+                wallname = "Wall"+str(wallcount)
 
-            obj = create_custom_mesh(boxname + wallname, wall, faces, pos=pos, rot=rot, cen=cen)
-            obj.parent = wall_parent
+                obj = create_custom_mesh(boxname + wallname, wall, faces, pos=pos, rot=rot, mat=get_mat("Wall", wall_color), cen=cen)
+                obj.parent = wall_parent
 
-            wallcount += 1
-        boxcount += 1
+                wallcount += 1
+            boxcount += 1
 
-    wall_parent.parent = parent
+        wall_parent.parent = parent
    
     '''
     Create Floor
     '''
     # get image wall data
-    verts = read_from_file(path_to_floor_verts_file)
-    faces = read_from_file(path_to_floor_faces_file)
+    verts = read_from_file(path_to_floor_verts_file, arrays=True)
+    faces = read_from_file(path_to_floor_faces_file, arrays=True)
 
     # Create mesh from data
     cornername="Floor"
-    obj = create_custom_mesh(cornername, verts, [faces], pos=pos, mat=create_mat((40,1,1,1)), cen=cen)
+    obj = create_custom_mesh(cornername, verts, [faces], pos=pos, mat=get_mat("Floor", floor_color), cen=cen)
     obj.parent = parent
 
     '''
     Create rooms
     '''
     # get image wall data
-    verts = read_from_file(path_to_rooms_verts_file)
-    faces = read_from_file(path_to_rooms_faces_file)
+    verts = read_from_file(path_to_rooms_verts_file, arrays=True)
+    faces = read_from_file(path_to_rooms_faces_file, arrays=True)
 
     # Create parent
     room_parent, room_parent_mesh = init_object("Rooms")
 
     for i in range(0,len(verts)):
         roomname="Room"+str(i)
-        obj = create_custom_mesh(roomname, verts[i], faces[i], pos=pos, rot=rot, cen=cen)
+        obj = create_custom_mesh(roomname, verts[i], faces[i], pos=pos, rot=rot, mat=get_mat("Room", room_color), cen=cen)
         obj.parent = room_parent
 
     room_parent.parent = parent
 
+    return merged_walls
+
 # Start
 if __name__ == "__main__":
     main(sys.argv)
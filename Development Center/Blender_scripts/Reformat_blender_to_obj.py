@@ -2,6 +2,7 @@ from subprocess import check_output
 
 """
 If we want to use the floorplan in for instance blender we can use this script to format the .blender file as .obj to fetch it in unity!
+Generated data can also be exported to .obj, .ply or .stl without blender, see FloorplanToBlenderLib/export.py
 """
 
 blender_install_path = "C:\\Program Files\\Blender Foundation\\Blender\\blender.exe"
@@ -1 +1,28 @@
-# TODO detect approx wall size and compare to a good value!
+import cv2
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__))+"/../..")
+from FloorplanToBlenderLib import * # floorplan to blender lib
+
+example_image_path = os.path.dirname(os.path.realpath(__file__))+"/../../Images/example.png"
+
+# Detect approx wall size and compare to a good value!
+gray = IO.read_image(example_image_path)
+
+thickness = detect.estimate_wall_thickness(gray)
+factor = detect.wall_thickness_factor(thickness)
+
+print("Wall thickness", thickness, "pixels, canonical", detect.canonical_wall_thickness, "pixels")
+print("Resample by", factor)
+
+# rescale to canonical wall thickness
+rescaled = detect.resample(gray, factor)
+
+# Show result
+cv2.imshow("origin", gray)
+cv2.imshow("rescaled", rescaled)
+cv2.waitKey(0)
+
+# Save to file
+cv2.imwrite(os.path.dirname(os.path.realpath(__file__))+"/rescaled.png", rescaled)
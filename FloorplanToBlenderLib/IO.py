@@ -1,9 +1,14 @@
+import contextlib
+import cv2
 import numpy as np
 import json
 import os
 from shutil import which
 import configparser
 import shutil
+import tempfile
+
+from . import profiling
 
 '''
 IO
@@ -52,30 +57,265 @@ def config_get_default():
             config['DEFAULT']['file_structure'],
             config['DEFAULT']['mode'])
 
-def save_to_file(file_path, data):
+# cv2.imread flags of each reduce factor, jpeg images are decoded at reduced size directly
+reduced_gray_flags = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                      4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+reduced_color_flags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                       4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+def image_name(source):
+    '''
+    Name of image for messages
+    @Param source, path to image, encoded image bytes or numpy array, see read_image
+    @Return path, or type and size of image in memory
+    '''
+    if isinstance(source, np.ndarray):
+        return "image array " + str(source.shape)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return "image bytes " + str(len(source))
+    return str(source)
+
+@profiling.profile
+def read_image(source, grayscale=True, reduce=1):
+    '''
+    Read image
+    Decode image straight to grayscale, without a full color image in between,
+    and at reduced size if reduce is more than 1
+    @Param source, path to image, encoded image bytes or already decoded image as numpy array
+    @Param grayscale, decode to grayscale, BGR otherwise
+    @Param reduce, integer factor to reduce width and height by
+    @Return image as numpy array
+    '''
+    flags = reduced_gray_flags if grayscale else reduced_color_flags
+    flag = flags.get(reduce, flags[1])
+
+    if isinstance(source, np.ndarray):
+        img = source
+        if grayscale and img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+        elif not grayscale and img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        flag = flags[1]
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        img = cv2.imdecode(np.frombuffer(source, np.uint8), flag)
+    else:
+        img = cv2.imread(str(source), flag)
+
+    if img is None:
+        raise ValueError("Can't read image : " + image_name(source))
+
+    # reduced by decoder
+    if flag != flags[1]:
+        return img
+    if reduce != 1:
+        img = cv2.resize(img, (img.shape[1] // reduce, img.shape[0] // reduce), interpolation=cv2.INTER_AREA)
+    return img
+
+@contextlib.contextmanager
+def open_new_file(file_path, mode):
+    '''
+    Open new file
+    Write to a temp file and replace file_path with it when done, an existing file is never
+    truncated, so files hard linked to it, such as cache entries, keep their content
+    @Param file_path, path to file
+    @Param mode, 'w' or 'wb'
+    @Return file object, use as context manager
+    '''
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+@profiling.profile
+def save_to_file(file_path, data, binary=False):
     '''
     Save to file
     Saves our resulting array as json in file.
     @Param file_path, path to outputfile
     @Param data, data to write to file
+    @Param binary, save verts or faces data in binary format instead, see save_to_binary_file
     '''
-    with open(file_path+'.txt', 'w') as f:
-        f.write(json.dumps(data))
+    if binary:
+        return save_to_binary_file(file_path, data)
+
+    with open_new_file(file_path+'.txt', 'w') as f:
+        f.write(json.dumps(data, default=to_json))
 
     print("Created file : " + file_path + ".txt")
 
-def read_from_file(file_path):
+def to_json(obj):
+    '''
+    Convert numpy arrays and numbers, that json can't handle, to lists and numbers
+    @Param obj, object to convert
+    @Return converted object
+    '''
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError("Object of type " + type(obj).__name__ + " is not JSON serializable")
+
+@profiling.profile
+def read_from_file(file_path, arrays=False):
     '''
     Read from file
-    read verts data from file
+    read verts data from file, binary file is used if there is one
     @Param file_path, path to file
+    @Param arrays, read innermost lists of binary file as numpy arrays, see binary_to_list
     @Return data
     '''
+    if os.path.isfile(file_path+'.bin'):
+        values, levels = read_from_binary_file(file_path)
+        return binary_to_list(values, levels, arrays)
+
     #Now read the file back into a Python list object
     with open(file_path+'.txt', 'r') as f:
         data = json.loads(f.read())
     return data
 
+'''
+Binary format
+Verts and faces are nested lists of numbers, such as [box][wall][vert][xyz].
+They are stored flat, each nesting level is either uniform (every list has the same
+size) or ragged (offsets into next level are stored).
+
+Layout, little endian, every array starts at a multiple of 8 bytes:
+    magic         4 bytes  b'F2B3'
+    version       uint16
+    value type    uint8    0 = float32, 1 = int32
+    depth         uint8    number of nesting levels
+    levels        depth * (int64 size, int64 offsets amount), size -1 = ragged
+    value amount  int64
+    offsets       int64 arrays of ragged levels, outermost first
+    values        float32 or int32 array
+'''
+binary_magic = b'F2B3'
+binary_version = 1
+binary_value_types = [np.dtype('<f4'), np.dtype('<i4')]
+
+def flatten_to_binary(data):
+    '''
+    Flatten nested data to binary format arrays
+    @Param data, nested lists or numpy arrays of numbers, same depth everywhere
+    @Return values, levels as list of uniform size or offsets array per level
+    '''
+    levels = []
+    nodes = [data]
+    while len(nodes) > 0 and isinstance(nodes[0], (list, tuple, np.ndarray)):
+        sizes = [len(node) for node in nodes]
+        if len(set(sizes)) == 1:
+            levels.append(sizes[0])
+        else:
+            levels.append(np.concatenate(([0], np.cumsum(sizes))))
+
+        if all(isinstance(node, np.ndarray) for node in nodes):
+            # the remaining levels of numpy arrays are uniform
+            array = np.concatenate(nodes)
+            levels.extend(array.shape[1:])
+            return array.reshape(-1), levels
+
+        nodes = [child for node in nodes for child in node]
+
+    return np.asarray(nodes), levels
+
+def save_to_binary_file(file_path, data):
+    '''
+    Save to binary file
+    Saves verts or faces data in binary format, see above.
+    @Param file_path, path to outputfile
+    @Param data, data to write to file
+    '''
+    values, levels = flatten_to_binary(data)
+
+    value_type = 1 if np.issubdtype(values.dtype, np.integer) else 0
+    values = values.astype(binary_value_types[value_type], copy=False)
+
+    header = [np.frombuffer(binary_magic, np.uint8),
+              np.array([binary_version], '<u2').view(np.uint8),
+              np.array([value_type, len(levels)], np.uint8)]
+    sizes = []
+    arrays = []
+    for level in levels:
+        if isinstance(level, np.ndarray):
+            sizes.extend([-1, len(level)])
+            arrays.append(level.astype('<i8'))
+        else:
+            sizes.extend([level, 0])
+    sizes.append(len(values))
+    header.append(np.array(sizes, '<i8').view(np.uint8))
+
+    with open_new_file(file_path+'.bin', 'wb') as f:
+        for array in header + arrays + [values]:
+            f.write(array.tobytes())
+
+    print("Created file : " + file_path + ".bin")
+
+def read_from_binary_file(file_path):
+    '''
+    Read from binary file
+    The arrays are memory mapped views of the file, nothing is copied.
+    @Param file_path, path to file
+    @Return values, levels as list of uniform size or offsets array per level
+    '''
+    buffer = np.memmap(file_path+'.bin', dtype=np.uint8, mode='r')
+    if bytes(buffer[:4]) != binary_magic:
+        raise ValueError("Not a floorplan binary file : " + file_path + ".bin")
+
+    version = int(buffer[4:6].view('<u2')[0])
+    if version > binary_version:
+        raise ValueError("Unsupported floorplan binary version " + str(version) + " : " + file_path + ".bin")
+
+    value_type = binary_value_types[buffer[6]]
+    depth = int(buffer[7])
+    sizes = np.frombuffer(buffer, '<i8', depth*2 + 1, 8)
+
+    offset = 8 + sizes.nbytes
+    levels = []
+    for i in range(depth):
+        if sizes[i*2] < 0:
+            levels.append(np.frombuffer(buffer, '<i8', sizes[i*2+1], offset))
+            offset += levels[-1].nbytes
+        else:
+            levels.append(int(sizes[i*2]))
+
+    values = np.frombuffer(buffer, value_type, sizes[-1], offset)
+    return values, levels
+
+def binary_to_list(values, levels, arrays=False):
+    '''
+    Binary to list
+    Rebuild nested lists, same as json data, from binary format arrays
+    @Param values, flat values
+    @Param levels, list of uniform size or offsets array per level
+    @Param arrays, keep innermost uniform levels as numpy array views instead of lists
+    @Return data
+    '''
+    # amount of lists on each level
+    amounts = [1]
+    for level in levels:
+        if isinstance(level, np.ndarray):
+            amounts.append(int(level[-1]))
+        else:
+            amounts.append(amounts[-1] * level)
+
+    # innermost uniform levels are reshaped by numpy
+    inner = len(levels)
+    while inner > 0 and not isinstance(levels[inner-1], np.ndarray):
+        inner -= 1
+    nodes = np.asarray(values).reshape([amounts[inner]] + levels[inner:])
+    if not arrays:
+        nodes = nodes.tolist()
+
+    for depth in reversed(range(inner)):
+        level = levels[depth]
+        if isinstance(level, np.ndarray):
+            nodes = [nodes[start:end] for start, end in zip(level[:-1], level[1:])]
+        else:
+            nodes = [nodes[i*level:(i+1)*level] for i in range(amounts[depth])]
+    return nodes[0]
+
 def clean_data_folder(folder):
     '''
     Remove old data files
@@ -88,29 +328,67 @@ def clean_data_folder(folder):
         for d in dirs:
             shutil.rmtree(os.path.join(root, d))
 
+# File in data folder with next free floorplan number, so the folder isn't listed every time
+floorplan_counter_file = ".next_floorplan"
+
 def create_new_floorplan_path(path):
     '''
     Creates next free name to floorplan data
-    @Param path, path to floorplan
+    Each call gets a new folder, also when several processes share the data folder.
+    Folders are created with os.mkdir, which fails if another process got there first.
+    @Param path, path to data folder
     @Return end path
     '''
-    res = 0
-    path = 'Data' + os.path.sep
-    for root, dirs, files in os.walk(path):
-        for dir in dirs:
-            try:
-                if(int(dir) is not None):
-                    res = int(dir) + 1
-            except:
-                continue
-
-    res = path + str(res) + os.path.sep
-    # create dir
-    if not os.path.exists(res):
-        os.makedirs(res)
+    if not path.endswith(os.path.sep) and not path.endswith("/"):
+        path += os.path.sep
+    os.makedirs(path, exist_ok=True)
+
+    res = read_floorplan_counter(path)
+    while True:
+        try:
+            os.mkdir(path + str(res))
+            break
+        except FileExistsError:
+            res += 1
+
+    write_floorplan_counter(path, res + 1)
 
+    return path + str(res) + os.path.sep
+
+def read_floorplan_counter(path):
+    '''
+    Read next free floorplan number
+    Only lists the data folder if the counter file is missing, such as after clean_data_folder
+    @Param path, path to data folder
+    @Return number
+    '''
+    try:
+        with open(path + floorplan_counter_file, 'r') as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        pass
+
+    res = 0
+    for dir in os.listdir(path):
+        if dir.isdigit():
+            res = max(res, int(dir) + 1)
     return res
 
+def write_floorplan_counter(path, res):
+    '''
+    Write next free floorplan number, replaced in one step so readers never see half a file
+    @Param path, path to data folder
+    @Param res, number
+    '''
+    fd, temp_path = tempfile.mkstemp(dir=path, prefix=floorplan_counter_file)
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(res))
+    try:
+        os.replace(temp_path, path + floorplan_counter_file)
+    except OSError:
+        # windows can't replace a file another process reads, the counter is only a hint
+        os.unlink(temp_path)
+
 
 def get_current_path():
     '''
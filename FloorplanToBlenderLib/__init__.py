@@ -14,7 +14,12 @@ IO...
 transform...
 dialog...
 execution...
+export...
+worker...
+cache...
+datastore...
+profiling...
 
 '''
 
-__all__ = ['detect', 'generate', 'IO', 'transform', 'dialog', 'execution']
+__all__ = ['detect', 'generate', 'IO', 'transform', 'dialog', 'execution', 'export', 'worker', 'cache', 'datastore', 'profiling']
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from . import datastore
+from . import detect
+from . import generate
+from . import IO
+from . import profiling
+from . import transform
+
+'''
+Cache
+This file contains a cache of generated data files, so the same floorplan image
+generated with the same settings is only detected once.
+
+Entries are folders in cache_path named by a hash of the image bytes, the generation
+settings and the library code. They hold the data files except transform and the shape.
+On a hit the files are hard linked into a new data folder, where a new transform is written,
+so data folders of cached floorplans look the same as generated ones. Data files are always
+replaced instead of rewritten, see IO.open_new_file, so a linked entry never changes.
+
+FloorplanToBlender3d
+Copyright (C) 2019 Daniel Westberg
+'''
+
+# Path to cache folder, outside of data folder so cleaning data keeps the cache
+cache_path = "Cache/"
+
+# Limits used by prune, total size in bytes and age in seconds since last use
+max_bytes = 1024 * 1024 * 1024
+max_age = 30 * 24 * 60 * 60
+
+# Increase to drop all entries when generated data changes in a way the code hash doesn't show
+cache_version = 1
+
+shape_file = "shape"
+
+def code_hash():
+    '''
+    Code hash
+    Hash of the library files used to generate data, changes with every library version
+    @Return hex digest
+    '''
+    h = hashlib.sha256()
+    for module in [detect, generate, IO, transform]:
+        with open(module.__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+library_hash = code_hash()
+
+def cache_key(imgpath, context):
+    '''
+    Cache key
+    @Param imgpath, path to image, encoded image bytes, decoded image or generate.FloorplanImage
+    @Param context, generate.GenerationContext
+    @Return hex digest of image and settings
+    '''
+    # tile size gives the same data
+    settings = {k: v for k, v in vars(context).items() if k not in ("path", "tile_size")}
+
+    h = hashlib.sha256()
+    h.update(json.dumps([cache_version, IO.binary_version, library_hash, settings], sort_keys=True).encode())
+    if isinstance(imgpath, generate.FloorplanImage):
+        imgpath = imgpath.img_path
+    if isinstance(imgpath, np.ndarray):
+        h.update(json.dumps([imgpath.shape, str(imgpath.dtype)]).encode())
+        h.update(np.ascontiguousarray(imgpath).data)
+    elif isinstance(imgpath, (bytes, bytearray, memoryview)):
+        h.update(imgpath)
+    else:
+        with open(str(imgpath), 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(block)
+    return h.hexdigest()
+
+def link_files(source, target, exclude=(), linked=None):
+    '''
+    Link files
+    Hard link all files of source folder into target folder, copy where links aren't supported
+    @Param source, path to folder
+    @Param target, path to folder
+    @Param exclude, names of files to skip
+    @Param linked, list to add paths of created files to
+    '''
+    for name in os.listdir(source):
+        # skip datastore metadata and leases
+        if name in exclude or name.startswith("."):
+            continue
+        # linked or copied to a new name and renamed, a file already in target may be linked elsewhere
+        temp_path = os.path.join(target, ".tmp-" + str(os.getpid()) + "-" + name)
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        try:
+            os.link(os.path.join(source, name), temp_path)
+        except OSError:
+            shutil.copy2(os.path.join(source, name), temp_path)
+        os.replace(temp_path, os.path.join(target, name))
+        if linked is not None:
+            linked.append(os.path.join(target, name))
+
+@profiling.profile
+def generate_mesh_files(imgpath, info, context):
+    '''
+    Cached generate.generate_mesh_files
+    @Param imgpath
+    @Param info, boolean if should be printed
+    @Param context, GenerationContext with path to save data in
+    @Return shape
+    '''
+    entry = os.path.join(cache_path, cache_key(imgpath, context))
+
+    linked = []
+    try:
+        with open(os.path.join(entry, shape_file + ".txt"), 'r') as f:
+            shape = json.load(f)
+        link_files(entry, context.path, [shape_file + ".txt"], linked)
+        # last use, see prune
+        os.utime(entry)
+        if info:
+            print("Cached data used : ", entry)
+        return shape
+    except OSError:
+        # not cached, or removed by prune while reading
+        for file_path in linked:
+            os.remove(file_path)
+
+    shape = generate.generate_mesh_files(imgpath, info, context)
+
+    # build entry next to it and rename, another process may add the same entry at once
+    os.makedirs(cache_path, exist_ok=True)
+    temp_entry = tempfile.mkdtemp(dir=cache_path, prefix=".new-")
+    link_files(context.path, temp_entry)
+    IO.save_to_file(os.path.join(temp_entry, shape_file), shape)
+    try:
+        os.rename(temp_entry, entry)
+    except OSError:
+        shutil.rmtree(temp_entry, ignore_errors=True)
+
+    return shape
+
+def generate_all_files(imgpath, info, position=None, rotation=None, context=None):
+    '''
+    Cached generate.generate_all_files
+    @Param imgpath
+    @Param info, boolean if should be printed
+    @Param position, vector of float
+    @Param rotation, vector of float
+    @Param context, GenerationContext, default settings if None
+    @Return path to generated file, shape
+    '''
+    if context is None:
+        context = generate.GenerationContext()
+
+    print(" ----- Generate ", IO.image_name(imgpath), " at pos ", position ," rot ",rotation," -----")
+
+    if context.path is None:
+        context = context.with_path(datastore.create_floorplan_path(generate.base_path))
+
+    shape = generate_mesh_files(imgpath, info, context)
+
+    generate.generate_transform_file(imgpath, info, position, rotation, shape, context)
+
+    return context.path, shape
+
+def prune(max_bytes=None, max_age=None):
+    '''
+    Prune cache
+    Remove entries not used within max_age, then least recently used ones until cache is within max_bytes,
+    see datastore.select_evictions
+    @Param max_bytes, module setting if None
+    @Param max_age, module setting if None
+    @Return amount of removed entries
+    '''
+    if max_bytes is None:
+        max_bytes = globals()["max_bytes"]
+    if max_age is None:
+        max_age = globals()["max_age"]
+
+    if not os.path.isdir(cache_path):
+        return 0
+
+    datastore.remove_temp_folders(cache_path)
+
+    entries = []
+    for entry in os.scandir(cache_path):
+        if entry.is_dir() and not entry.name.startswith("."):
+            entries.append((entry.stat().st_mtime, datastore.folder_size(entry.path), entry.path))
+
+    removed = 0
+    for path in datastore.select_evictions(entries, max_bytes, max_age):
+        temp_path = datastore.remove_folder(cache_path, path)
+        if temp_path is not None:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            removed += 1
+
+    return removed
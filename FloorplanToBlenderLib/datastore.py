@@ -0,0 +1,296 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+from . import IO
+
+'''
+Datastore
+This file contains functions keeping the data folder within a disk budget,
+instead of removing all generated data at start.
+
+Each floorplan folder has a metadata file with creation time, last access and size.
+Jobs using a folder hold a lease, a file in the folder naming the process.
+New folders get their lease before their metadata, folders without metadata are kept for a while.
+Folders are removed least recently used first, folders with a lease of a running process are kept.
+
+FloorplanToBlender3d
+Copyright (C) 2019 Daniel Westberg
+'''
+
+# Path to data folder
+data_path = "Data/"
+
+# Limits used by collect, total size in bytes and age in seconds since last access, None for no limit
+max_bytes = 1024 * 1024 * 1024
+max_age = None
+
+# Leases of processes on other computers can't be checked, they count as running for this long
+lease_timeout = 24 * 60 * 60
+
+# Folders without metadata younger than this are being created, collect keeps them
+creation_timeout = 60 * 60
+
+metadata_file = ".floorplan"
+lease_prefix = ".lease-"
+
+def folder_size(path):
+    '''
+    @Param path, path to folder
+    @Return size of files in folder in bytes
+    '''
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def write_json(file_path, data):
+    '''
+    Write json file in one step, so readers never see half a file
+    @Param file_path
+    @Param data
+    '''
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix=".tmp-")
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, file_path)
+
+def read_metadata(path):
+    '''
+    Read metadata of floorplan folder, created from the folder if missing
+    @Param path, path to floorplan folder
+    @Return dict with created, accessed and size
+    '''
+    try:
+        with open(os.path.join(path, metadata_file), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        modified = os.stat(path).st_mtime
+        return {"created": modified, "accessed": modified, "size": folder_size(path)}
+
+def update_metadata(path, size=False):
+    '''
+    Set last access of floorplan folder to now
+    @Param path, path to floorplan folder
+    @Param size, also measure size of folder
+    '''
+    metadata = read_metadata(path)
+    metadata["accessed"] = time.time()
+    if size:
+        metadata["size"] = folder_size(path)
+    write_json(os.path.join(path, metadata_file), metadata)
+
+def create_floorplan_path(path=None):
+    '''
+    Create floorplan folder, leased by this process, see IO.create_new_floorplan_path
+    @Param path, path to data folder, module setting if None
+    @Return path to floorplan folder
+    '''
+    if path is None:
+        path = data_path
+
+    res = IO.create_new_floorplan_path(path)
+    # lease before metadata, collect keeps folders without metadata, see being_created
+    write_json(os.path.join(res, lease_name()), lease_data())
+    now = time.time()
+    write_json(os.path.join(res, metadata_file), {"created": now, "accessed": now, "size": 0})
+    return res
+
+def lease_name():
+    '''
+    @Return name of lease file of this process
+    '''
+    return lease_prefix + socket.gethostname() + "-" + str(os.getpid())
+
+def lease_data():
+    '''
+    @Return content of lease file of this process
+    '''
+    return {"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}
+
+def lease(path):
+    '''
+    Lease floorplan folder, it isn't removed until released or this process stops
+    @Param path, path to floorplan folder
+    '''
+    write_json(os.path.join(path, lease_name()), lease_data())
+    update_metadata(path)
+
+def release(path):
+    '''
+    Release lease of this process and store size of folder
+    @Param path, path to floorplan folder
+    '''
+    try:
+        os.remove(os.path.join(path, lease_name()))
+    except FileNotFoundError:
+        pass
+    update_metadata(path, size=True)
+
+def process_alive(pid):
+    '''
+    Check if process of this computer is running
+    @Param pid
+    @Return boolean
+    '''
+    if os.name == 'nt':
+        # os.kill stops processes on windows
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def leased(path):
+    '''
+    Check if floorplan folder has a lease of a running process, leases of stopped ones are removed
+    @Param path, path to floorplan folder
+    @Return boolean
+    '''
+    result = False
+    for entry in os.scandir(path):
+        if not entry.name.startswith(lease_prefix):
+            continue
+        try:
+            with open(entry.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # being written
+            result = True
+            continue
+
+        if data["host"] == socket.gethostname():
+            alive = process_alive(data["pid"])
+        else:
+            alive = time.time() - data["time"] < lease_timeout
+
+        if alive:
+            result = True
+        else:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+    return result
+
+def being_created(path):
+    '''
+    Check if floorplan folder is being created, it has no metadata yet and may not have a lease yet
+    Older folders without metadata are from before the datastore, they can be removed
+    @Param path, path to floorplan folder
+    @Return boolean
+    '''
+    if os.path.exists(os.path.join(path, metadata_file)):
+        return False
+    return time.time() - os.stat(path).st_mtime < creation_timeout
+
+def select_evictions(folders, max_bytes=None, max_age=None, now=None):
+    '''
+    Select folders to remove
+    Folders not accessed within max_age, then least recently accessed until total size is within max_bytes
+    @Param folders, list of (last access, size, path)
+    @Param max_bytes, None for no limit
+    @Param max_age, None for no limit
+    @Param now, time to measure age from
+    @Return paths to remove, least recently accessed first
+    '''
+    if now is None:
+        now = time.time()
+
+    total = sum(size for accessed, size, path in folders)
+    res = []
+    for accessed, size, path in sorted(folders):
+        too_old = max_age is not None and now - accessed > max_age
+        too_large = max_bytes is not None and total > max_bytes
+        if not too_old and not too_large:
+            break
+        res.append(path)
+        total -= size
+    return res
+
+def remove_folder(root, path):
+    '''
+    Remove folder by renaming it first, so readers never see half removed folders
+    @Param root, folder containing path, temp folder is created here
+    @Param path, path to folder
+    @Return removed folder, or None if it couldn't be moved
+    '''
+    temp_path = tempfile.mkdtemp(dir=root, prefix=".old-")
+    try:
+        os.rename(path, os.path.join(temp_path, "folder"))
+    except OSError:
+        os.rmdir(temp_path)
+        return None
+    return temp_path
+
+def remove_temp_folders(root, age=24 * 60 * 60):
+    '''
+    Remove temp folders left by processes stopped while adding or removing folders
+    @Param root, path to folder
+    @Param age, minimal age in seconds of removed temp folders
+    '''
+    now = time.time()
+    for entry in os.scandir(root):
+        if entry.is_dir() and entry.name.startswith(".") and now - entry.stat().st_mtime > age:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def collect(max_bytes=None, max_age=None, path=None):
+    '''
+    Collect garbage
+    Remove least recently used floorplan folders until data folder is within limits, leased folders are kept
+    @Param max_bytes, module setting if None
+    @Param max_age, module setting if None
+    @Param path, path to data folder, module setting if None
+    @Return paths of removed folders
+    '''
+    if max_bytes is None:
+        max_bytes = globals()["max_bytes"]
+    if max_age is None:
+        max_age = globals()["max_age"]
+    if path is None:
+        path = data_path
+
+    if not os.path.isdir(path):
+        return []
+
+    remove_temp_folders(path)
+
+    folders = []
+    kept_size = 0
+    for entry in os.scandir(path):
+        if not entry.is_dir() or not entry.name.isdigit() or being_created(entry.path):
+            continue
+        metadata = read_metadata(entry.path)
+        if leased(entry.path):
+            kept_size += metadata["size"]
+        else:
+            folders.append((metadata["accessed"], metadata["size"], entry.path))
+
+    if max_bytes is not None:
+        max_bytes -= kept_size
+
+    removed = []
+    for folder in select_evictions(folders, max_bytes, max_age):
+        temp_path = remove_folder(path, folder)
+        if temp_path is None:
+            continue
+
+        # leased after it was checked, put it back
+        if leased(os.path.join(temp_path, "folder")):
+            os.rename(os.path.join(temp_path, "folder"), folder)
+            os.rmdir(temp_path)
+            continue
+
+        shutil.rmtree(temp_path, ignore_errors=True)
+        removed.append(folder)
+
+    return removed
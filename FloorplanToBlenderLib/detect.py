@@ -1,6 +1,8 @@
 import cv2
 import numpy as np
 
+from . import profiling
+
 # TODO: detect windows
 # TODO: detect doors
 # Calculate (actual) size of appartment
@@ -14,6 +16,7 @@ FloorplanToBlender3d
 Copyright (C) 2019 Daniel Westberg
 """
 
+@profiling.profile
 def wall_filter(gray):
     """
     Filter walls
@@ -27,7 +30,7 @@ def wall_filter(gray):
     kernel = np.ones((3,3),np.uint8)
     opening = cv2.morphologyEx(thresh,cv2.MORPH_OPEN,kernel, iterations = 2)
 
-    sure_bg = cv2.dilate(opening,kernel,iterations=3)
+    sure_bg = cv2.dilate(opening,kernel,iterations=wall_dilation)
 
     dist_transform = cv2.distanceTransform(opening,cv2.DIST_L2,5)
     ret, sure_fg = cv2.threshold(0.5*dist_transform,0.2*dist_transform.max(),255,0)
@@ -38,51 +41,441 @@ def wall_filter(gray):
     return unknown
 
 
-def detectPreciseBoxes(detect_img, output_img = None, color = [100,100,0]):
+# Gray level of the outside of floorplans, lighter pixels are outside, see detectOuterContours
+outer_contour_threshold = 230
+
+# Reach of the morphology in wall_filter, opening of 2 + 2 iterations and dilation of 3, with a 3x3 kernel.
+# Walls of the wall image are wall_dilation pixels thicker than in the image on each side
+opening_halo = 4
+wall_dilation = 3
+wall_filter_halo = opening_halo + wall_dilation
+
+# Wall thickness in pixels the room detection defaults are tuned for, about the walls of Images/example.png
+canonical_wall_thickness = 20
+
+# Walls thinner than this are removed by the opening of wall_filter
+min_wall_thickness = 6
+
+# Walls within this fraction of the wanted thickness aren't resampled, see wall_thickness_factor
+wall_thickness_tolerance = 0.5
+
+# Pyramid levels keep walls at least this thick, thinner walls lose door corners and rooms, see pyramid_levels
+pyramid_min_wall_thickness = 12
+
+def image_tiles(shape, tile_size, halo=0):
+    """
+    Split image into tiles
+    Help function for the tiled functions, tile_size is rounded up to an even number
+    @Param shape @mandatory shape of image
+    @Param tile_size @mandatory width and height of tiles
+    @Param halo pixels added around each tile, clipped at the image border
+    @Return list of (tile, tile with halo, tile within tile with halo) as pairs of slices
+    """
+    tile_size += tile_size % 2
+    res = []
+    for y in range(0, shape[0], tile_size):
+        for x in range(0, shape[1], tile_size):
+            core = (slice(y, min(y + tile_size, shape[0])), slice(x, min(x + tile_size, shape[1])))
+            outer = grow_tile(core, shape, halo)
+            inner = tuple(slice(c.start - o.start, c.stop - o.start) for c, o in zip(core, outer))
+            res.append((core, outer, inner))
+    return res
+
+def grow_tile(tile, shape, halo):
+    """
+    @Param tile @mandatory pair of slices
+    @Param shape @mandatory shape of image
+    @Param halo @mandatory pixels to add on each side
+    @Return pair of slices, clipped at the image border
+    """
+    return tuple(slice(max(t.start - halo, 0), min(t.stop + halo, size)) for t, size in zip(tile, shape))
+
+def otsu_threshold(hist):
+    """
+    Otsu threshold of a histogram, same as cv2.threshold with cv2.THRESH_OTSU on the image
+    @Param hist @mandatory pixel count of each gray level
+    @Return threshold
+    """
+    scale = 1.0 / hist.sum()
+    mu = 0.0
+    for i in range(256):
+        mu += i * float(hist[i])
+    mu *= scale
+
+    mu1 = q1 = 0.0
+    max_sigma = max_val = 0.0
+    eps = float(np.finfo(np.float32).eps)
+    for i in range(256):
+        p_i = float(hist[i]) * scale
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+        if min(q1, q2) < eps or max(q1, q2) > 1.0 - eps:
+            continue
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+        if sigma > max_sigma:
+            max_sigma = sigma
+            max_val = i
+    return max_val
+
+@profiling.profile
+def wall_filter_tiled(gray, tile_size=4096, out=None, halo=16):
+    """
+    Filter walls in tiles
+    Same result as wall_filter, with memory bounded by tile size, for very large scans.
+    The Otsu threshold comes from the histogram of all tiles and the distance max from a first pass.
+    A distance of a pixel is exact if its nearest background pixel is within halo, so the halo
+    is grown to the largest distance found and the first pass repeated when needed.
+    @Param gray @mandatory grayscale image, may be a numpy memmap
+    @Param tile_size width and height of tiles
+    @Param out image to write result in, such as a numpy memmap, created if None
+    @Param halo expected max distance, about half the wall thickness
+    @Return image of walls
+    """
+    if out is None:
+        out = np.empty(gray.shape, np.uint8)
+    tiles = image_tiles(gray.shape, tile_size)
+
+    hist = np.zeros(256, np.int64)
+    for core, outer, inner in tiles:
+        hist += np.bincount(gray[core].ravel(), minlength=256)
+    thresh_value = otsu_threshold(hist)
+
+    kernel = np.ones((3,3),np.uint8)
+
+    def filter_tile(core, halo):
+        # opening is exact within halo of the tile
+        outer = grow_tile(core, gray.shape, halo + opening_halo)
+        ret, thresh = cv2.threshold(gray[outer], thresh_value, 255, cv2.THRESH_BINARY_INV)
+        opening = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations = 2)
+
+        region = grow_tile(core, gray.shape, halo)
+        opening = opening[tuple(slice(r.start - o.start, r.stop - o.start) for r, o in zip(region, outer))]
+        inner = tuple(slice(c.start - r.start, c.stop - r.start) for c, r in zip(core, region))
+        dist_transform = cv2.distanceTransform(opening, cv2.DIST_L2, 5)
+        return opening, dist_transform, inner
+
+    halo = max(halo, wall_filter_halo - opening_halo)
+    while True:
+        dist_max = np.float32(0)
+        for core, outer, inner in tiles:
+            opening, dist_transform, inner = filter_tile(core, halo)
+            dist_max = max(dist_max, dist_transform[inner].max())
+        if dist_max <= halo:
+            break
+        halo = int(np.ceil(dist_max))
+
+    for core, outer, inner in tiles:
+        opening, dist_transform, inner = filter_tile(core, halo)
+        sure_bg = cv2.dilate(opening,kernel,iterations=wall_dilation)
+        ret, sure_fg = cv2.threshold(0.5*dist_transform[inner],0.2*dist_max,255,0)
+        out[core] = cv2.subtract(sure_bg[inner], np.uint8(sure_fg))
+
+    return out
+
+
+def downscale(gray, factor):
+    """
+    Downscale image for pyramid detection
+    Each pixel is the mean of a factor x factor block, rows and columns left over at the border are dropped,
+    so pixel (x, y) covers pixels x*factor to (x+1)*factor - 1 of the input, see refine_contours
+    @Param gray @mandatory grayscale image
+    @Param factor @mandatory integer factor
+    @Return downscaled image
+    """
+    height, width = gray.shape[0] // factor, gray.shape[1] // factor
+    return cv2.resize(gray[:height * factor, :width * factor], (width, height), interpolation=cv2.INTER_AREA)
+
+def resample(gray, factor):
+    """
+    Resample image by any factor, downscale is used for integer factors
+    @Param gray @mandatory grayscale image
+    @Param factor @mandatory factor to divide width and height by, upscales if less than 1
+    @Return resampled image
+    """
+    if factor == int(factor):
+        return downscale(gray, int(factor))
+    size = (max(int(round(gray.shape[1] / factor)), 1), max(int(round(gray.shape[0] / factor)), 1))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA if factor > 1 else cv2.INTER_LINEAR)
+
+def scale_contours(contours, factor):
+    """
+    Scale contours found on a resampled image to full resolution, see resample
+    @Param contours @mandatory list of contours
+    @Param factor @mandatory factor of resampled image
+    @Return list of contours, vertices at the middle of the pixels they were on
+    """
+    if factor == int(factor):
+        factor = int(factor)
+        return [contour * factor + factor // 2 for contour in contours]
+    return [np.rint(contour * factor + (factor - 1) / 2).astype(contour.dtype) for contour in contours]
+
+@profiling.profile
+def estimate_wall_thickness(gray, max_pixels=4000000):
+    """
+    Estimate wall thickness
+    Walls are the dark side of the Otsu threshold, the distance transform along their center lines
+    is half their thickness. The thickness covering most wall area wins, so thin lines of text,
+    doors and furniture don't count much.
+    @Param gray @mandatory grayscale image
+    @Param max_pixels estimate on image downscaled by a power of two to at most this many pixels
+    @Return thickness in pixels, None if there are no walls
+    """
+    factor = 1
+    while gray.shape[0] * gray.shape[1] > max_pixels * factor ** 2:
+        factor *= 2
+    if factor > 1:
+        gray = downscale(gray, factor)
+
+    ret, walls = cv2.threshold(gray,0,255,cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU)
+    dist_transform = cv2.distanceTransform(walls,cv2.DIST_L2,5)
+
+    # center lines, local max of distance
+    kernel = np.ones((3,3),np.uint8)
+    ridge = (dist_transform >= cv2.dilate(dist_transform, kernel)) & (dist_transform > 0)
+    dist = dist_transform[ridge]
+
+    # stroke of thickness t has distance (t + 1) / 2 at its center, weighted by area
+    hist = np.bincount(np.rint(2 * dist - 1).astype(int), weights=dist)
+    # single pixel lines and noise
+    hist[:2] = 0
+    if len(hist) == 0 or hist.max() == 0:
+        return None
+    return int(hist.argmax()) * factor
+
+def wall_thickness_factor(thickness, wall_thickness=None, tolerance=None):
+    """
+    Factor to resample an image by, so its walls get the wanted thickness
+    Thin walls are only upscaled to min_wall_thickness, upscaling further makes detection slower
+    without finding more
+    @Param thickness @mandatory estimated thickness, see estimate_wall_thickness, None if unknown
+    @Param wall_thickness wanted thickness, canonical_wall_thickness if None
+    @Param tolerance don't resample walls within this fraction of wanted thickness, wall_thickness_tolerance if None
+    @Return factor to divide width and height by, see resample
+    """
+    if wall_thickness is None:
+        wall_thickness = canonical_wall_thickness
+    if tolerance is None:
+        tolerance = wall_thickness_tolerance
+    if thickness is None:
+        return 1
+    factor = thickness / wall_thickness
+    if factor < 1:
+        factor = min(thickness / min_wall_thickness, 1)
+    if 1 / (1 + tolerance) <= factor <= 1 + tolerance:
+        return 1
+    # integer factors downscale in blocks, exact and fast
+    if factor > 1 and abs(factor - round(factor)) * wall_thickness < 1:
+        return int(round(factor))
+    return factor
+
+def pyramid_levels(thickness, levels, min_thickness=None):
+    """
+    Pyramid levels to detect on, fewer than wanted if walls would get too thin
+    @Param thickness @mandatory wall thickness of image before pyramid levels, see estimate_wall_thickness, None if unknown
+    @Param levels @mandatory wanted levels, image is downscaled by 2 ** levels
+    @Param min_thickness thickness walls keep, pyramid_min_wall_thickness if None
+    @Return levels
+    """
+    if min_thickness is None:
+        min_thickness = pyramid_min_wall_thickness
+    if thickness is None:
+        return levels
+    while levels > 0 and thickness / 2 ** levels < min_thickness:
+        levels -= 1
+    return levels
+
+@profiling.profile
+def refine_contours(contours, gray, factor, threshold, dark=True, band=None, offset=0, opening=True):
+    """
+    Refine contours found on a resampled image, see resample
+    Vertices are scaled to full resolution, then each coordinate is moved to the nearest
+    straight edge of the full resolution image within band pixels, if there is one.
+    The full resolution image is only read in a window around each vertex.
+    A vertex is moved at most band + offset pixels from where it was on the downscaled image.
+    @Param contours @mandatory list of contours, as from cv2.findContours on resampled image
+    @Param gray @mandatory full resolution grayscale image
+    @Param factor @mandatory factor of resampled image
+    @Param threshold @mandatory gray level splitting object and background
+    @Param dark object pixels are at most threshold, otherwise above it
+    @Param band search distance in full resolution pixels, factor if None
+    @Param offset pixels to move vertices from the edge out of the object, negative into it.
+    Such as wall_dilation for contours of wall_filter images, which grow by a fixed amount of pixels
+    @Param opening remove dark lines thinner than walls, as wall_filter does
+    @Return list of contours in full resolution coordinates
+    """
+    if band is None:
+        band = int(np.ceil(factor))
+    # edges shorter than this are noise or not straight
+    min_length = max(2, int(factor // 2))
+    height, width = gray.shape[:2]
+    kernel = np.ones((3,3),np.uint8)
+
+    def snap(obj, position, start):
+        # boundaries between columns, as object pixel next to background
+        left = (obj[:, :-1] & ~obj[:, 1:]).sum(axis=0)
+        right = (~obj[:, :-1] & obj[:, 1:]).sum(axis=0)
+        strength = np.maximum(left, right)
+        candidates = np.flatnonzero(strength >= min_length)
+        if len(candidates) == 0:
+            return position
+        # object pixel next to the edge, moved by offset away from the object
+        outward = np.where(right[candidates] > left[candidates], -1, 1)
+        columns = candidates + (outward < 0) + start + outward * offset
+        return columns[np.argmin(np.abs(columns - position))]
+
+    res = []
+    for contour in scale_contours(contours, factor):
+        points = contour.reshape(-1, 2)
+        refined = np.empty_like(points)
+        for i, (x, y) in enumerate(points):
+            x0, x1 = max(x - band, 0), min(x + band + 1, width)
+            y0, y1 = max(y - band, 0), min(y + band + 1, height)
+            if opening:
+                # read a larger window, so opening is exact in the window
+                outer = grow_tile((slice(y0, y1), slice(x0, x1)), gray.shape, opening_halo)
+                ret, walls = cv2.threshold(gray[outer], threshold, 255, cv2.THRESH_BINARY_INV)
+                walls = cv2.morphologyEx(walls, cv2.MORPH_OPEN, kernel, iterations = 2)
+                walls = walls[y0 - outer[0].start:y1 - outer[0].start, x0 - outer[1].start:x1 - outer[1].start] > 0
+            else:
+                walls = gray[y0:y1, x0:x1] <= threshold
+            obj = walls if dark else ~walls
+            refined[i, 0] = snap(obj, x, x0)
+            refined[i, 1] = snap(obj.T, y, y0)
+        res.append(refined.reshape(-1, 1, 2).astype(contour.dtype))
+    return res
+
+class ContourTree:
+    """
+    Contours of a binary image traced once, with their hierarchy, see cv2.findContours
+    Area, perimeter and bounding rectangle of all contours are computed on first use and kept,
+    so stages reading the same image, such as walls and noise removal, share one tracing of it.
+    """
+
+    def __init__(self, img, mode=cv2.RETR_TREE):
+        """
+        @Param img @mandatory binary image, objects are white
+        @Param mode retrieval mode, cv2.RETR_EXTERNAL if only outer contours are used
+        """
+        self.contours, hierarchy = cv2.findContours(img, mode, cv2.CHAIN_APPROX_SIMPLE)
+        # next, previous, first child and parent of each contour, -1 if there is none
+        self.hierarchy = hierarchy[0] if hierarchy is not None else np.empty((0, 4), np.int32)
+        self._areas = None
+        self._perimeters = None
+        self._rects = None
+
+    def __len__(self):
+        return len(self.contours)
+
+    @property
+    def outer(self):
+        """
+        Indices of outer contours, those without parent, in the order cv2.RETR_EXTERNAL finds them
+        """
+        return np.flatnonzero(self.hierarchy[:, 3] == -1)
+
+    def children(self, index):
+        """
+        @Param index @mandatory index of contour
+        @Return indices of contours of holes in it, or objects in a hole
+        """
+        return np.flatnonzero(self.hierarchy[:, 3] == index)
+
+    @property
+    def areas(self):
+        """
+        Area of each contour, see cv2.contourArea
+        """
+        if self._areas is None:
+            self._areas = np.array([cv2.contourArea(contour) for contour in self.contours])
+        return self._areas
+
+    @property
+    def perimeters(self):
+        """
+        Perimeter of each contour as closed curve, see cv2.arcLength
+        """
+        if self._perimeters is None:
+            self._perimeters = np.array([cv2.arcLength(contour, True) for contour in self.contours])
+        return self._perimeters
+
+    @property
+    def rects(self):
+        """
+        Bounding rectangle of each contour as (x, y, width, height)
+        """
+        if self._rects is None:
+            self._rects = np.array([cv2.boundingRect(contour) for contour in self.contours], np.int32).reshape(-1, 4)
+        return self._rects
+
+    def largest(self, indices=None):
+        """
+        @Param indices indices of contours to choose from, outer contours if None
+        @Return index of the first contour with the largest area, None if there are none
+        """
+        if indices is None:
+            indices = self.outer
+        if len(indices) == 0:
+            return None
+        return indices[np.argmax(self.areas[indices])]
+
+    def approx(self, index):
+        """
+        @Param index @mandatory index of contour
+        @Return contour simplified to within 0.1% of its perimeter, see cv2.approxPolyDP
+        """
+        epsilon = 0.001*self.perimeters[index]
+        return cv2.approxPolyDP(self.contours[index],epsilon,True)
+
+@profiling.profile
+def detectPreciseBoxes(detect_img, output_img = None, color = [100,100,0], contours = None):
     """
     Detect corners with boxes in image with high precision
     @Param detect_img image to detect from @mandatory
     @Param output_img image for output
     @Param color to set on output
+    @Param contours ContourTree of detect_img if already traced, such as by another stage
     @Return corners(list of boxes), output image
     @source https://stackoverflow.com/questions/50930033/drawing-lines-and-distance-to-them-on-image-opencv-python
     """
     res = []
 
-    contours, hierarchy = cv2.findContours(detect_img,cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_SIMPLE)
-    #area = sorted(contours, key=cv2.contourArea, reverse=True)
-
-    largest_contour_area = 0
-    for cnt in contours:
-        largest_contour_area = cv2.contourArea(cnt)
-        largest_contour = cnt
+    if contours is None:
+        contours = ContourTree(detect_img, cv2.RETR_EXTERNAL)
+    outer = contours.outer
+    profiling.count("contours", len(outer))
 
-        epsilon = 0.001*cv2.arcLength(largest_contour,True)
-        approx = cv2.approxPolyDP(largest_contour,epsilon,True)
+    for index in outer:
+        approx = contours.approx(index)
         if output_img is not None:
             final = cv2.drawContours(output_img, [approx], 0, color)
         res.append(approx)
 
     return res, output_img
 
-def remove_noise(img, noise_removal_threshold):
+@profiling.profile
+def remove_noise(img, noise_removal_threshold, contours=None):
     """
     Remove noise from image and return mask
     Help function for finding room
     @Param img @mandatory image to remove noise from
     @Param noise_removal_threshold @mandatory threshold for noise
+    @Param contours ContourTree of ~img if already traced, such as of the wall image
     @Return return new mask of image
     """
     img[img < 128] = 0
     img[img > 128] = 255
-    contours, _ = cv2.findContours(~img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours is None:
+        contours = ContourTree(~img, cv2.RETR_EXTERNAL)
     mask = np.zeros_like(img)
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if area > noise_removal_threshold:
-            cv2.fillPoly(mask, [contour], 255)
+    for index in contours.outer:
+        if contours.areas[index] > noise_removal_threshold:
+            cv2.fillPoly(mask, [contours.contours[index]], 255)
     return mask
 
+@profiling.profile
 def find_corners_and_draw_lines(img, corners_threshold, room_closing_max_length):
     """
     Finds corners and draw lines from them
@@ -101,24 +494,46 @@ def find_corners_and_draw_lines(img, corners_threshold, room_closing_max_length)
     # Draw lines to close the rooms off by adding a line between corners on the same x or y coordinate
     # This gets some false positives.
     # You could try to disallow drawing through other existing lines for example.
-    for y,row in enumerate(corners):
-        x_same_y = np.argwhere(row)
-        for x1, x2 in zip(x_same_y[:-1], x_same_y[1:]):
-
-            if x2[0] - x1[0] < room_closing_max_length:
-                color = 0
-                cv2.line(img, (x1[0], y), (x2[0], y), color, 1)
-
-    for x,col in enumerate(corners.T):
-        y_same_x = np.argwhere(col)
-        for y1, y2 in zip(y_same_x[:-1], y_same_x[1:]):
-            if y2[0] - y1[0] < room_closing_max_length:
-                color = 0
-                cv2.line(img, (x, y1[0]), (x, y2[0]), color, 1)
+    lines = list(find_corner_lines(corners, room_closing_max_length))
+    # same for columns, transpose back from (y, x) to (x, y) points
+    lines.extend(find_corner_lines(corners.T, room_closing_max_length)[:, :, ::-1])
+
+    if lines:
+        color = 0
+        cv2.polylines(img, np.ascontiguousarray(lines), False, color, 1)
     return img
 
+def find_corner_lines(corners, room_closing_max_length):
+    """
+    Find lines between corners on the same row
+    Help function for finding room, a corner is a blob of many pixels, so all corner pixels
+    on a row linked by gaps shorter than room_closing_max_length are collapsed into one line.
+    @Param corners @mandatory boolean corner image
+    @Param room_closing_max_length @mandatory threshold for room max size
+    @Return lines as int32 array of shape (lines, 2, 2) with (x, y) end points
+    """
+    # nonzero is sorted by row and then column
+    y, x = np.nonzero(corners)
+
+    # link each corner pixel with the next one on the same row
+    linked = (y[1:] == y[:-1]) & (x[1:] - x[:-1] < room_closing_max_length)
+
+    # a line runs from the first to the last pixel of every chain of links
+    before = np.concatenate(([False], linked[:-1]))
+    after = np.concatenate((linked[1:], [False]))
+    starts = np.flatnonzero(linked & ~before)
+    ends = np.flatnonzero(linked & ~after) + 1
+
+    lines = np.empty((len(starts), 2, 2), np.int32)
+    lines[:, 0, 0] = x[starts]
+    lines[:, 0, 1] = y[starts]
+    lines[:, 1, 0] = x[ends]
+    lines[:, 1, 1] = y[ends]
+    return lines
+
 
 
+@profiling.profile
 def mark_outside_black(img, mask):
     """
     Mark white background as black
@@ -127,18 +542,245 @@ def mark_outside_black(img, mask):
     @Return image, mask
     """
     # Mark the outside of the house as black
-    contours, _ = cv2.findContours(~img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    contour_sizes = [(cv2.contourArea(contour), contour) for contour in contours]
-    biggest_contour = max(contour_sizes, key=lambda x: x[0])[1]
+    contours = ContourTree(~img, cv2.RETR_EXTERNAL)
+    biggest = contours.largest()
+    # no walls, nothing to mark
+    if biggest is None:
+        return img, mask
+    biggest_contour = contours.contours[biggest]
     mask = np.zeros_like(mask)
     cv2.fillPoly(mask, [biggest_contour], 255)
     img[mask == 0] = 0
     return img, mask
 
 
+@profiling.profile
+def label_components(img, min_area, max_area=None):
+    """
+    Label connected components of image in a single pass
+    Help function for finding rooms, area and bounding box of every component
+    are gathered together with the labels so no per label scan of the image is needed.
+    @Param img @mandatory binary image, background is black
+    @Param min_area @mandatory minimal number of pixels of a kept component
+    @Param max_area maximal number of pixels of a kept component
+    @Return labels image, stats table (see cv2.connectedComponentsWithStats), list of kept labels
+    """
+    ret, labels, stats, centroids = cv2.connectedComponentsWithStats(img)
+    area = stats[:, cv2.CC_STAT_AREA]
+
+    keep = area >= min_area
+    if max_area is not None:
+        keep &= area <= max_area
+    # label 0 is the background, black pixels of the input image
+    keep[0] = False
+
+    return labels, stats, np.flatnonzero(keep)
+@profiling.profile
+def label_components_tiled(img, min_area, max_area=None, tile_size=4096, out=None):
+    """
+    Label connected components in tiles
+    Same result as label_components, with memory bounded by tile size apart from the labels image.
+    Tiles are labelled one at a time, labels touching across tile borders are merged with union find
+    and relabelled in the order cv2.connectedComponents gives, by first 2x2 block in raster order.
+    @Param img @mandatory binary image, background is black, may be a numpy memmap
+    @Param min_area @mandatory minimal number of pixels of a kept component
+    @Param max_area maximal number of pixels of a kept component
+    @Param tile_size width and height of tiles
+    @Param out int32 image to write labels in, such as a numpy memmap, created if None
+    @Return labels image, stats table (see cv2.connectedComponentsWithStats), list of kept labels
+    """
+    if out is None:
+        out = np.empty(img.shape, np.int32)
+    tiles = image_tiles(img.shape, tile_size)
+
+    # provisional labels of all tiles, as left, top, right, bottom, area and sort keys
+    parts = []
+    background = None
+    amount = 0
+    for core, outer, inner in tiles:
+        ret, labels, stats, centroids = cv2.connectedComponentsWithStats(np.ascontiguousarray(img[core]))
+        np.add(labels, amount, out=labels, where=labels > 0)
+        out[core] = labels
+
+        y, x = core[0].start, core[1].start
+        part = np.empty((ret - 1, 8), np.int64)
+        part[:, 0] = stats[1:, cv2.CC_STAT_LEFT] + x
+        part[:, 1] = stats[1:, cv2.CC_STAT_TOP] + y
+        part[:, 2] = part[:, 0] + stats[1:, cv2.CC_STAT_WIDTH]
+        part[:, 3] = part[:, 1] + stats[1:, cv2.CC_STAT_HEIGHT]
+        part[:, 4] = stats[1:, cv2.CC_STAT_AREA]
+        # tiles start on even rows, so first block row decides between tiles, then tile column and tile label
+        part[:, 5] = part[:, 1] // 2
+        part[:, 6] = x
+        part[:, 7] = np.arange(ret - 1)
+        parts.append(part)
+        amount += ret - 1
+
+        if stats[0, cv2.CC_STAT_AREA] > 0:
+            left, top, width, height, area = stats[0]
+            if background is None:
+                background = [left + x, top + y, left + x + width, top + y + height, 0]
+            background = [min(background[0], left + x), min(background[1], top + y),
+                          max(background[2], left + x + width), max(background[3], top + y + height),
+                          background[4] + area]
+        elif background is None:
+            empty_background = stats[0]
+
+    parts = np.concatenate(parts) if parts else np.empty((0, 8), np.int64)
+
+    # union labels of 8 connected pixels on both sides of tile borders
+    pairs = []
+    size = tile_size + tile_size % 2
+    for axis in (0, 1):
+        for start in range(size, img.shape[axis], size):
+            before = np.take(out, start - 1, axis)
+            after = np.take(out, start, axis)
+            for d in (-1, 0, 1):
+                a = before[max(-d, 0):len(before) - max(d, 0)]
+                b = after[max(d, 0):len(after) - max(-d, 0)]
+                linked = (a > 0) & (b > 0)
+                pairs.append(np.stack((a[linked], b[linked]), axis=1))
+
+    parent = np.arange(amount + 1)
+    def find(label):
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    if pairs:
+        for a, b in np.unique(np.concatenate(pairs), axis=0):
+            a, b = find(a), find(b)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+    while True:
+        roots = parent[parent]
+        if (roots == parent).all():
+            break
+        parent = roots
+    roots = parent[1:] - 1
+
+    # merge stats and order of provisional labels into their roots
+    rank = np.empty(amount, np.int64)
+    rank[np.lexsort((parts[:, 7], parts[:, 6], parts[:, 5]))] = np.arange(amount)
+    merged = np.full((amount, 6), np.iinfo(np.int64).max)
+    merged[:, 2:5] = 0
+    np.minimum.at(merged[:, 0], roots, parts[:, 0])
+    np.minimum.at(merged[:, 1], roots, parts[:, 1])
+    np.maximum.at(merged[:, 2], roots, parts[:, 2])
+    np.maximum.at(merged[:, 3], roots, parts[:, 3])
+    np.add.at(merged[:, 4], roots, parts[:, 4])
+    np.minimum.at(merged[:, 5], roots, rank)
+
+    components = np.flatnonzero(roots == np.arange(amount))
+    components = components[np.argsort(merged[components, 5])]
+
+    lut = np.zeros(amount + 1, np.int32)
+    final = np.zeros(amount, np.int32)
+    final[components] = np.arange(1, len(components) + 1)
+    lut[1:] = final[roots]
+    for core, outer, inner in tiles:
+        out[core] = lut[out[core]]
+
+    stats = np.empty((len(components) + 1, 5), np.int32)
+    if background is None:
+        stats[0] = empty_background
+    else:
+        stats[0] = [background[0], background[1], background[2] - background[0], background[3] - background[1], background[4]]
+    bounds = merged[components]
+    stats[1:, cv2.CC_STAT_LEFT] = bounds[:, 0]
+    stats[1:, cv2.CC_STAT_TOP] = bounds[:, 1]
+    stats[1:, cv2.CC_STAT_WIDTH] = bounds[:, 2] - bounds[:, 0]
+    stats[1:, cv2.CC_STAT_HEIGHT] = bounds[:, 3] - bounds[:, 1]
+    stats[1:, cv2.CC_STAT_AREA] = bounds[:, 4]
+
+    area = stats[:, cv2.CC_STAT_AREA]
+    keep = area >= min_area
+    if max_area is not None:
+        keep &= area <= max_area
+    keep[0] = False
+
+    return out, stats, np.flatnonzero(keep)
+
+
+class Components:
+    """
+    Compact collection of detected components, such as rooms
+    Holds one int32 label image and a stats table instead of a full size mask per component.
+    Behaves like the old list of boolean masks, masks are materialised when indexed or iterated.
+    """
+
+    def __init__(self, labels, stats, kept_labels):
+        """
+        @Param labels @mandatory int32 labels image
+        @Param stats @mandatory stats table of all labels, see cv2.connectedComponentsWithStats
+        @Param kept_labels @mandatory labels in labels image which are components
+        """
+        self.labels = labels
+        self.label_ids = np.asarray(kept_labels, dtype=np.int32)
+        self.stats = stats[self.label_ids]
+
+    def __len__(self):
+        return len(self.label_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.mask(i) for i in range(len(self))[index]]
+        return self.mask(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.mask(index)
+
+    @property
+    def areas(self):
+        """
+        Number of pixels of each component
+        """
+        return self.stats[:, cv2.CC_STAT_AREA]
+
+    @property
+    def bounding_boxes(self):
+        """
+        Bounding box of each component as (x, y, width, height)
+        """
+        return self.stats[:, :cv2.CC_STAT_AREA]
+
+    def mask(self, index):
+        """
+        Full size boolean mask of a component
+        @Param index @mandatory index of component
+        @Return boolean image
+        """
+        return self.labels == self.label_ids[index]
+
+    def roi_mask(self, index):
+        """
+        Boolean mask of a component cropped to its bounding box
+        @Param index @mandatory index of component
+        @Return boolean image, (x, y) offset of the crop
+        """
+        x, y, w, h = self.bounding_boxes[index]
+        return self.labels[y:y+h, x:x+w] == self.label_ids[index], (x, y)
+
+def color_components(labels, kept_labels, label_amount):
+    """
+    Color components with a lookup table
+    Every kept label gets a random color, the rest are black
+    @Param labels @mandatory labels image
+    @Param kept_labels @mandatory labels to color, in ascending order
+    @Param label_amount @mandatory number of labels in labels image
+    @Return colored RGB image
+    """
+    colors = np.zeros((label_amount, 3), np.uint8)
+    for label in kept_labels:
+        colors[label] = np.random.randint(0, 255, size=3)
+    return colors[labels]
+
+@profiling.profile
 def find_rooms(img, noise_removal_threshold=50, corners_threshold=0.01,
                room_closing_max_length=130,
-               gap_in_wall_min_threshold=5000):
+               gap_in_wall_min_threshold=5000, tile_size=None, wall_contours=None):
 
     """
     I have copied and changed this function some...
@@ -151,13 +793,15 @@ def find_rooms(img, noise_removal_threshold=50, corners_threshold=0.01,
     @param corners_threshold: Threshold to allow corners. Higher removes more of the house.
     @param room_closing_max_length: Maximum line length to add to close off open doors.
     @param gap_in_wall_threshold: Minimum number of pixels to identify component as room instead of hole in the wall.
-    @return: rooms: list of numpy arrays containing boolean masks for each detected room
+    @param tile_size: Label rooms in tiles of this size, see label_components_tiled, whole image if None.
+    @param wall_contours: ContourTree of the walls, ~img, shared with other stages. Traced if None.
+    @return: rooms: Components, label image of detected rooms, iterate or index it to get boolean masks
              colored_house: A colored version of the input image, where each room has a random color.
     """
     assert 0 <= corners_threshold <= 1
     # Remove noise left from door removal
 
-    mask = remove_noise(img, noise_removal_threshold)
+    mask = remove_noise(img, noise_removal_threshold, wall_contours)
     img = ~mask
 
     find_corners_and_draw_lines(img,corners_threshold,room_closing_max_length)
@@ -165,21 +809,17 @@ def find_rooms(img, noise_removal_threshold=50, corners_threshold=0.01,
     img, mask = mark_outside_black(img, mask)
 
     # Find the connected components in the house
-    ret, labels = cv2.connectedComponents(img)
-    img = cv2.cvtColor(img,cv2.COLOR_GRAY2RGB)
-    unique = np.unique(labels)
-    rooms = []
-    for label in unique:
-        component = labels == label
-        if img[component].sum() == 0 or np.count_nonzero(component) < gap_in_wall_min_threshold:
-            color = 0
-        else:
-            rooms.append(component)
-            color = np.random.randint(0, 255, size=3)
-        img[component] = color
+    if tile_size is None:
+        labels, stats, room_labels = label_components(img, gap_in_wall_min_threshold)
+    else:
+        labels, stats, room_labels = label_components_tiled(img, gap_in_wall_min_threshold, tile_size=tile_size)
+    rooms = Components(labels, stats, room_labels)
+    profiling.count("rooms", len(rooms))
+    img = color_components(labels, room_labels, len(stats))
     return rooms, img
 
 
+@profiling.profile
 def detectAndRemovePreciseBoxes(detect_img, output_img = None, color = [255, 255, 255]):
     """
     Remove contours of detected walls from image
@@ -192,22 +832,19 @@ def detectAndRemovePreciseBoxes(detect_img, output_img = None, color = [255, 255
 
     res = []
 
-    contours, hierarchy = cv2.findContours(detect_img,cv2.RETR_EXTERNAL,cv2.CHAIN_APPROX_SIMPLE)
-    #area = sorted(contours, key=cv2.contourArea, reverse=True)
+    contours = ContourTree(detect_img, cv2.RETR_EXTERNAL)
+    outer = contours.outer
+    profiling.count("contours", len(outer))
 
-    largest_contour_area = 0
-    for cnt in contours:
-        largest_contour_area = cv2.contourArea(cnt)
-        largest_contour = cnt
-
-        epsilon = 0.001*cv2.arcLength(largest_contour,True)
-        approx = cv2.approxPolyDP(largest_contour,epsilon,True)
+    for index in outer:
+        approx = contours.approx(index)
         if output_img is not None:
             cv2.drawContours( output_img,  [approx], -1, color, -1);
         res.append(approx)
 
     return res, output_img
 
+@profiling.profile
 def detectOuterContours(detect_img, output_img = None, color = [255, 255, 255]):
     """
     Get the outer side of floorplan, used to get ground
@@ -217,18 +854,13 @@ def detectOuterContours(detect_img, output_img = None, color = [255, 255, 255]):
     @Return approx, box
     @Source https://stackoverflow.com/questions/50930033/drawing-lines-and-distance-to-them-on-image-opencv-python
     """
-    ret, thresh = cv2.threshold(detect_img, 230, 255, cv2.THRESH_BINARY_INV)
-
-    contours, hierarchy = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    ret, thresh = cv2.threshold(detect_img, outer_contour_threshold, 255, cv2.THRESH_BINARY_INV)
 
-    largest_contour_area = 0
-    for cnt in contours:
-        if (cv2.contourArea(cnt) > largest_contour_area):
-            largest_contour_area = cv2.contourArea(cnt)
-            largest_contour = cnt
+    contours = ContourTree(thresh, cv2.RETR_EXTERNAL)
+    profiling.count("contours", len(contours))
 
-    epsilon = 0.001*cv2.arcLength(largest_contour,True)
-    approx = cv2.approxPolyDP(largest_contour,epsilon,True)
+    # each area is calculated once
+    approx = contours.approx(contours.largest())
     if output_img is not None:
         final = cv2.drawContours(output_img, [approx], 0, color)
     return approx, output_img
@@ -249,9 +881,10 @@ def rectContains(rect,pt):
 Currently none used code below here!, outcommented to avoid confusion with contributors.
 '''
 
+@profiling.profile
 def find_details(img, noise_removal_threshold=50, corners_threshold=0.01,
                room_closing_max_length=130, gap_in_wall_max_threshold=5000,
-               gap_in_wall_min_threshold=10):
+               gap_in_wall_min_threshold=10, wall_contours=None):
 
     """
     !!! Currently not used in IMPLEMENTATION !!!
@@ -265,13 +898,14 @@ def find_details(img, noise_removal_threshold=50, corners_threshold=0.01,
     @Param corners_threshold: Threshold to allow corners. Higher removes more of the house.
     @Param room_closing_max_length: Maximum line length to add to close off open doors.
     @Param gap_in_wall_threshold: Minimum number of pixels to identify component as room instead of hole in the wall.
-    @Return: rooms: list of numpy arrays containing boolean masks for each detected room
+    @Param wall_contours: ContourTree of the walls, ~img, shared with other stages. Traced if None.
+    @Return: rooms: Components, label image of detected details, iterate or index it to get boolean masks
              colored_house: A colored version of the input image, where each room has a random color.
     """
     assert 0 <= corners_threshold <= 1
     # Remove noise left from door removal
 
-    mask = remove_noise(img, noise_removal_threshold)
+    mask = remove_noise(img, noise_removal_threshold, wall_contours)
     img = ~mask
 
     find_corners_and_draw_lines(img,corners_threshold,room_closing_max_length)
@@ -279,18 +913,8 @@ def find_details(img, noise_removal_threshold=50, corners_threshold=0.01,
     img, mask = mark_outside_black(img, mask)
 
     # Find the connected components in the house
-    ret, labels = cv2.connectedComponents(img)
-    img = cv2.cvtColor(img,cv2.COLOR_GRAY2RGB)
-    unique = np.unique(labels)
-    details = []
-    for label in unique:
-        component = labels == label
-        if img[component].sum() == 0 or np.count_nonzero(component) < gap_in_wall_min_threshold or np.count_nonzero(component) > gap_in_wall_max_threshold:
-            color = 0
-        else:
-            details.append(component)
-            color = np.random.randint(0, 255, size=3)
-
-        img[component] = color
+    labels, stats, detail_labels = label_components(img, gap_in_wall_min_threshold, gap_in_wall_max_threshold)
+    details = Components(labels, stats, detail_labels)
+    img = color_components(labels, detail_labels, len(stats))
 
     return details, img
@@ -1,7 +1,9 @@
 import cv2
 import numpy as np
 
+from . import datastore
 from . import detect
+from . import generate
 from . import IO
 from . import transform
 
@@ -67,9 +69,9 @@ def dialog_example():
     print("")
     print("Generate datafiles in folder: Data")
     print("")
-    print("Clean datafiles")
+    print("Remove least recently used datafiles")
 
-    IO.clean_data_folder("Data/")
+    datastore.collect()
 
     # Ask how floorplans shall be structured
     if(len(image_paths) > 1):
@@ -103,6 +105,9 @@ def dialog_example():
      program_path # Send this as parameter to script
      ] +  data_paths)
 
+    for data_path in data_paths:
+        datastore.release(data_path)
+
     print("Project created at: " + program_path + "\\floorplan.blender")
     print("")
     print("Done, Have a nice day!")
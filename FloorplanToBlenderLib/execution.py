@@ -1,10 +1,13 @@
 import cv2
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 from . import detect
 from . import IO
 from . import transform
 from . import generate
+from . import cache
+from . import datastore
 
 '''
 Execution
@@ -14,15 +17,49 @@ FloorplanToBlender3d
 Copyright (C) 2019 Daniel Westberg
 '''
 
+# Amount of processes generating floorplans at once, None uses one per cpu
+max_workers = None
+
+# Reuse data of images generated before with the same settings, see cache
+use_cache = True
+
 def simple_single(image_path):
     '''
     Generate one simple floorplan
     @Param image_path path to image
     @Return path to generated files
     '''
-    fpath, fshape = generate.generate_all_files(image_path, True)
+    if use_cache:
+        fpath, fshape = cache.generate_all_files(image_path, True)
+    else:
+        fpath, fshape = generate.generate_all_files(image_path, True)
     return fpath
 
+def generate_mesh_files(image_paths, info=True):
+    '''
+    Generate mesh data of several floorplans at once
+    Phase one of multiple_simple and multiple_coord, the transforms are created when all shapes are known.
+    Data paths are created here in order, so they are the same as when generating one at a time.
+    @Param image_paths - list of path to images
+    @Param info - boolean if should be printed
+    @Return generation contexts with paths to image data, shapes
+    '''
+    contexts = [generate.GenerationContext(datastore.create_floorplan_path(generate.base_path)) for image_path in image_paths]
+    for image_path, context in zip(image_paths, contexts):
+        print(" ----- Generate ", IO.image_name(image_path), " in ", context.path, " -----")
+
+    generate_mesh_files = generate.generate_mesh_files
+    if use_cache:
+        generate_mesh_files = cache.generate_mesh_files
+
+    if len(image_paths) < 2:
+        shapes = list(map(generate_mesh_files, image_paths, [info]*len(image_paths), contexts))
+        return contexts, shapes
+
+    with ProcessPoolExecutor(max_workers) as executor:
+        shapes = list(executor.map(generate_mesh_files, image_paths, [info]*len(image_paths), contexts))
+    return contexts, shapes
+
 def multiple_simple(image_paths, horizontal=True):
     '''
     Generates several new appartments
@@ -31,25 +68,23 @@ def multiple_simple(image_paths, horizontal=True):
     @Return paths to image data
     '''
     # Generate data files
-    data_paths = list()
+    contexts, shapes = generate_mesh_files(image_paths)
+
     fshape = None
     # for each input image path!
-    for image_path in image_paths:
+    for image_path, context, shape in zip(image_paths, contexts, shapes):
         # Calculate positions and rotations here!
-
+        position = None
         if fshape is not None:
-            # Generate all data for imagepath
             if horizontal:
-                fpath, fshape = generate.generate_all_files(image_path, True, position=(0,fshape[1],0))
+                position = (0,fshape[1],0)
             else:
-                fpath, fshape = generate.generate_all_files(image_path, True, position=(fshape[0],0,0))
+                position = (fshape[0],0,0)
 
-        else:
-            fpath, fshape = generate.generate_all_files(image_path, True)
+        generate.generate_transform_file(image_path, True, position, None, shape, context)
+        fshape = shape
 
-        # add path to send to blender
-        data_paths.append(fpath)
-    return data_paths
+    return [context.path for context in contexts]
 
 def multiple_coord(image_paths):
     '''
@@ -58,22 +93,21 @@ def multiple_coord(image_paths):
     @Return paths to image data
     '''
     # Generate data files
-    data_paths = list()
+    contexts, shapes = generate_mesh_files([tup[0] for tup in image_paths])
+
     fshape = None
     # for each input image path!
-    for tup in image_paths:
+    for tup, context, shape in zip(image_paths, contexts, shapes):
         image_path = tup[0]
         pos = tup[1]
         # Calculate positions and rotations here!
-
+        position = None
         if pos is not None:
-            fpath, fshape = generate.generate_all_files(image_path, True, position=(pos[0],pos[1],pos[2]))
-        else:
-            if fshape is not None:
-                fpath, fshape = generate.generate_all_files(image_path, True, position=(fshape[0],fshape[1],fshape[2]))
-            else:
-                fpath, fshape = generate.generate_all_files(image_path, True)
+            position = (pos[0],pos[1],pos[2])
+        elif fshape is not None:
+            position = (fshape[0],fshape[1],fshape[2])
+
+        generate.generate_transform_file(image_path, True, position, None, shape, context)
+        fshape = shape
 
-        # add path to send to blender
-        data_paths.append(fpath)
-    return data_paths
+    return [context.path for context in contexts]
@@ -0,0 +1,577 @@
+import base64
+import json
+import math
+import os
+import struct
+import numpy as np
+
+from . import IO
+from . import profiling
+from . import transform
+
+'''
+Export
+This file contains functions for exporting generated data files as 3d models, without blender.
+The node hierarchy and transforms are the same as the blender script creates,
+see Blender/floorplan_to_3dObject_in_blender.py
+
+FloorplanToBlender3d
+Copyright (C) 2019 Daniel Westberg
+'''
+
+# Material colors, same as in the blender script
+default_color = (0.2, 0.3, 0.8, 1)
+wall_color = default_color
+room_color = default_color
+floor_color = (40, 1, 1, 1)
+
+# Convert from blender z up to y up in gltf and obj files, same as the blender exporters
+yup = True
+
+# Amount of verts or faces formatted at once when streaming obj, ply and stl files
+chunk_size = 65536
+
+@profiling.profile
+def export_floorplans(file_path, data_paths):
+    '''
+    Export floorplans
+    Create one 3d model file of generated floorplans, format is decided by file extension
+    @Param file_path, path to output file, .gltf, .glb, .obj, .ply or .stl
+    @Param data_paths, list of paths to generated data, as from generate.generate_all_files
+    '''
+    writers = {
+        ".gltf": write_gltf,
+        ".glb": write_gltf,
+        ".obj": write_obj,
+        ".ply": write_ply,
+        ".stl": write_stl,
+    }
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in writers:
+        raise ValueError("Can't export floorplans to " + file_path + ", unknown format " + extension)
+
+    nodes = [load_floorplan(data_path, i) for i, data_path in enumerate(data_paths)]
+    writers[extension](file_path, nodes)
+
+def euler_to_quaternion(rot):
+    '''
+    Euler to quaternion
+    @Param rot, euler angles in radians, blender XYZ order
+    @Return quaternion as numpy array (x, y, z, w)
+    '''
+    hx, hy, hz = (np.asarray(rot, dtype=np.float64) / 2).tolist()
+    cx, cy, cz = math.cos(hx), math.cos(hy), math.cos(hz)
+    sx, sy, sz = math.sin(hx), math.sin(hy), math.sin(hz)
+
+    # rotate around x, then y, then z
+    return np.array([
+        sx*cy*cz - cx*sy*sz,
+        cx*sy*cz + sx*cy*sz,
+        cx*cy*sz - sx*sy*cz,
+        cx*cy*cz + sx*sy*sz,
+    ])
+
+def quaternion_to_matrix(q):
+    '''
+    Quaternion to rotation matrix
+    @Param q, quaternion (x, y, z, w)
+    @Return 3x3 numpy array
+    '''
+    x, y, z, w = q
+    return np.array([
+        [1 - 2*(y*y + z*z), 2*(x*y - z*w), 2*(x*z + y*w)],
+        [2*(x*y + z*w), 1 - 2*(x*x + z*z), 2*(y*z - x*w)],
+        [2*(x*z - y*w), 2*(y*z + x*w), 1 - 2*(x*x + y*y)],
+    ])
+
+def create_node(name, translation=None, rotation=None, mesh=None):
+    '''
+    Create node, same as a blender object
+    @Param name
+    @Param translation, location relative to parent
+    @Param rotation, euler angles
+    @Param mesh, as from create_mesh or None
+    @Return node
+    '''
+    if translation is None:
+        translation = (0, 0, 0)
+    if rotation is None:
+        rotation = (0, 0, 0)
+
+    return {
+        "name": name,
+        "translation": np.asarray(translation, dtype=np.float64),
+        "rotation": euler_to_quaternion(rotation),
+        "mesh": mesh,
+        "children": [],
+    }
+
+def create_mesh(verts, faces, material):
+    '''
+    Create triangle mesh
+    @Param verts, (verts, 3) numpy array
+    @Param faces, list of faces or (faces, corners) numpy array of vert indices
+    @Param material, (name, color) tuple
+    @Return mesh, None if there are no triangles
+    '''
+    triangles = transform.triangulate_faces(verts, faces)
+    if len(triangles) == 0:
+        return None
+    return {"verts": verts, "triangles": triangles, "material": material}
+
+def create_mesh_node(name, verts, faces, material, pos=None, rot=None, cen=None):
+    '''
+    Create mesh node
+    Verts are moved to put the pivot point in center of mesh, same as create_custom_mesh in blender script
+    @Param name
+    @Param verts, corners, list or numpy array
+    @Param faces, buildorder
+    @Param material, (name, color) tuple
+    @Param pos, position [x, y, z]
+    @Param rot, euler angles
+    @Param cen, shape of floorplan
+    @Return node
+    '''
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+
+    center = np.zeros(3)
+    if len(verts):
+        center = verts.mean(axis=0)
+
+    parent_center = [0, 0, 0]
+    if cen is not None:
+        parent_center = [int(cen[0]/2), int(cen[1]/2), int(cen[2])]
+
+    translation = center - parent_center
+    if pos is not None:
+        translation += pos
+
+    mesh = create_mesh(verts - center, faces, material)
+    return create_node(name, translation, rot, mesh)
+
+def load_floorplan(data_path, name=0):
+    '''
+    Load floorplan
+    Read generated data files into a node hierarchy, Floorplan -> Walls, Floor, Rooms
+    @Param data_path, path to generated data
+    @Param name, number of floorplan
+    @Return floorplan node
+    '''
+    transform_data = IO.read_from_file(data_path + "transform")
+    rot = transform_data["rotation"]
+    pos = transform_data["position"]
+    cen = transform_data["shape"]
+
+    # rotate to fix mirrored floorplan
+    parent = create_node("Floorplan" + str(name), rotation=(0, math.pi, 0))
+
+    '''
+    Walls
+    '''
+    wall_material = ("Wall", wall_color)
+    if os.path.isfile(data_path + "wall_mesh_verts.bin") or os.path.isfile(data_path + "wall_mesh_verts.txt"):
+        verts = IO.read_from_file(data_path + "wall_mesh_verts", arrays=True)
+        faces = np.asarray(IO.read_from_file(data_path + "wall_mesh_faces", arrays=True)).reshape(-1, 4)
+        parent["children"].append(create_mesh_node("Walls", verts, faces, wall_material, pos, rot, cen))
+    else:
+        verts = IO.read_from_file(data_path + "wall_verts", arrays=True)
+        faces = IO.read_from_file(data_path + "wall_faces", arrays=True)
+
+        wall_parent = create_node("Walls")
+        wallcount = 0
+        for boxcount, box in enumerate(verts):
+            for wall in box:
+                name = "Box" + str(boxcount) + "Wall" + str(wallcount)
+                wall_parent["children"].append(create_mesh_node(name, wall, faces, wall_material, pos, rot, cen))
+                wallcount += 1
+        parent["children"].append(wall_parent)
+
+    '''
+    Floor
+    '''
+    verts = IO.read_from_file(data_path + "floor_verts", arrays=True)
+    faces = IO.read_from_file(data_path + "floor_faces", arrays=True)
+    parent["children"].append(create_mesh_node("Floor", verts, [faces], ("Floor", floor_color), pos, cen=cen))
+
+    '''
+    Rooms
+    '''
+    verts = IO.read_from_file(data_path + "rooms_verts", arrays=True)
+    faces = IO.read_from_file(data_path + "rooms_faces", arrays=True)
+
+    room_parent = create_node("Rooms")
+    for i in range(len(verts)):
+        room_parent["children"].append(create_mesh_node("Room" + str(i), verts[i], faces[i], ("Room", room_color), pos, rot, cen))
+    parent["children"].append(room_parent)
+
+    return parent
+
+def to_yup(vectors):
+    '''
+    To y up
+    Convert blender z up coordinates (x, y, z) to gltf y up (x, z, -y)
+    @Param vectors, (n, 3) or (n, 4) numpy array, quaternions have w last
+    @Return converted copy
+    '''
+    vectors = np.array(vectors, dtype=np.float64)
+    vectors[..., [1, 2]] = vectors[..., [2, 1]]
+    vectors[..., 2] *= -1
+    return vectors
+
+def walk_nodes(nodes):
+    '''
+    Walk nodes
+    Visit nodes depth first, parents before children
+    @Param nodes, list of root nodes
+    @Return generator of node, world rotation matrix, world translation
+    '''
+    stack = [(node, np.eye(3), np.zeros(3)) for node in reversed(nodes)]
+    while stack:
+        node, rotation, translation = stack.pop()
+        translation = rotation @ node["translation"] + translation
+        rotation = rotation @ quaternion_to_matrix(node["rotation"])
+
+        yield node, rotation, translation
+
+        stack.extend((child, rotation, translation) for child in reversed(node["children"]))
+
+def world_meshes(nodes):
+    '''
+    World meshes
+    Meshes of all nodes with verts moved to world space
+    @Param nodes, list of root nodes
+    @Return generator of name, (verts, 3) numpy array, (triangles, 3) numpy array, material
+    '''
+    for node, rotation, translation in walk_nodes(nodes):
+        mesh = node["mesh"]
+        if mesh is not None:
+            yield node["name"], mesh["verts"] @ rotation.T + translation, mesh["triangles"], mesh["material"]
+
+def mesh_amounts(nodes):
+    '''
+    Mesh amounts
+    @Param nodes, list of root nodes
+    @Return total amount of verts and triangles
+    '''
+    vert_amount = 0
+    triangle_amount = 0
+    for node, rotation, translation in walk_nodes(nodes):
+        if node["mesh"] is not None:
+            vert_amount += len(node["mesh"]["verts"])
+            triangle_amount += len(node["mesh"]["triangles"])
+    return vert_amount, triangle_amount
+
+def material_key(material):
+    '''
+    @Param material, (name, color) tuple
+    @Return hashable key of material
+    '''
+    name, color = material
+    return (name, tuple(float(c) for c in color))
+
+def material_names(nodes):
+    '''
+    Material names
+    Unique name of each material, same names get a number as in blender
+    @Param nodes, list of root nodes
+    @Return dict of (name, color) to unique name
+    '''
+    names = {}
+    for node, rotation, translation in walk_nodes(nodes):
+        if node["mesh"] is not None:
+            key = material_key(node["mesh"]["material"])
+            name = key[0]
+            if key not in names:
+                amount = sum(1 for other in names if other[0] == name)
+                names[key] = name if amount == 0 else name + "." + str(amount).zfill(3)
+    return names
+
+def write_chunks(f, data):
+    '''
+    Write chunks
+    Write numpy array to binary file a few rows at a time
+    @Param f, file opened in binary mode
+    @Param data, numpy array
+    '''
+    for start in range(0, len(data), chunk_size):
+        f.write(data[start:start + chunk_size].tobytes())
+
+def write_text_chunks(f, line, data):
+    '''
+    Write text chunks
+    Format each row of numpy array as line, a few rows at a time
+    @Param f, file opened in text mode
+    @Param line, format of one line, such as "v %.6f %.6f %.6f\n"
+    @Param data, (rows, values) numpy array
+    '''
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        f.write((line * len(chunk)) % tuple(chunk.reshape(-1).tolist()))
+
+'''
+OBJ, PLY and STL
+Meshes are written one at a time in world space, there is no node hierarchy in these formats.
+OBJ gets a .mtl file with the material colors, PLY stores them as vertex colors.
+PLY and STL stay z up, same as the blender exporters.
+'''
+def write_obj(file_path, nodes):
+    '''
+    Write obj and mtl file
+    @Param file_path, path to output file
+    @Param nodes, list of root nodes, as from load_floorplan
+    '''
+    names = material_names(nodes)
+    mtl_path = os.path.splitext(file_path)[0] + ".mtl"
+
+    with open(mtl_path, "w") as f:
+        f.write("# FloorplanToBlender3d\n")
+        for (name, color), unique_name in names.items():
+            r, g, b, a = np.clip(color, 0, 1).tolist()
+            f.write("newmtl %s\nKd %.6f %.6f %.6f\nd %.6f\n" % (unique_name, r, g, b, a))
+
+    # obj indices start at 1 and count verts of all previous objects
+    offset = 1
+    with open(file_path, "w") as f:
+        f.write("# FloorplanToBlender3d\nmtllib " + os.path.basename(mtl_path) + "\n")
+        for name, verts, triangles, material in world_meshes(nodes):
+            if yup:
+                verts = to_yup(verts)
+
+            f.write("o " + name + "\n")
+            write_text_chunks(f, "v %.6f %.6f %.6f\n", verts)
+            f.write("usemtl " + names[material_key(material)] + "\n")
+            write_text_chunks(f, "f %d %d %d\n", triangles + offset)
+            offset += len(verts)
+
+def write_ply(file_path, nodes):
+    '''
+    Write binary ply file
+    @Param file_path, path to output file
+    @Param nodes, list of root nodes, as from load_floorplan
+    '''
+    vert_amount, triangle_amount = mesh_amounts(nodes)
+
+    vert_type = np.dtype([("co", "<f4", 3), ("color", "u1", 3)])
+    face_type = np.dtype([("size", "u1"), ("indices", "<i4", 3)])
+
+    header = "\n".join([
+        "ply",
+        "format binary_little_endian 1.0",
+        "comment FloorplanToBlender3d",
+        "element vertex " + str(vert_amount),
+        "property float x",
+        "property float y",
+        "property float z",
+        "property uchar red",
+        "property uchar green",
+        "property uchar blue",
+        "element face " + str(triangle_amount),
+        "property list uchar int vertex_indices",
+        "end_header",
+    ]) + "\n"
+
+    with open(file_path, "wb") as f:
+        f.write(header.encode("ascii"))
+
+        # all verts come before all faces
+        for name, verts, triangles, material in world_meshes(nodes):
+            data = np.empty(len(verts), dtype=vert_type)
+            data["co"] = verts
+            data["color"] = np.round(np.clip(material[1][:3], 0, 1) * 255)
+            write_chunks(f, data)
+
+        offset = 0
+        for node, rotation, translation in walk_nodes(nodes):
+            mesh = node["mesh"]
+            if mesh is not None:
+                data = np.empty(len(mesh["triangles"]), dtype=face_type)
+                data["size"] = 3
+                data["indices"] = mesh["triangles"] + offset
+                write_chunks(f, data)
+                offset += len(mesh["verts"])
+
+def write_stl(file_path, nodes):
+    '''
+    Write binary stl file
+    @Param file_path, path to output file
+    @Param nodes, list of root nodes, as from load_floorplan
+    '''
+    vert_amount, triangle_amount = mesh_amounts(nodes)
+
+    triangle_type = np.dtype([("normal", "<f4", 3), ("verts", "<f4", (3, 3)), ("attribute", "<u2")])
+
+    with open(file_path, "wb") as f:
+        f.write(b"FloorplanToBlender3d".ljust(80, b" "))
+        f.write(struct.pack("<I", triangle_amount))
+
+        for name, verts, triangles, material in world_meshes(nodes):
+            data = np.zeros(len(triangles), dtype=triangle_type)
+            data["verts"] = verts[triangles]
+
+            normals = np.cross(data["verts"][:, 1] - data["verts"][:, 0], data["verts"][:, 2] - data["verts"][:, 0])
+            lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+            data["normal"] = normals / np.where(lengths == 0, 1, lengths)
+            write_chunks(f, data)
+
+'''
+glTF
+One buffer holds all vertex positions and triangle indices, each mesh has one primitive.
+Materials are plain base colors, shared by all meshes of the same class and color.
+'''
+gltf_float = 5126
+gltf_unsigned_int = 5125
+gltf_array_buffer = 34962
+gltf_element_array_buffer = 34963
+
+def create_gltf(nodes):
+    '''
+    Create gltf
+    @Param nodes, list of root nodes, as from load_floorplan
+    @Return gltf json document, binary buffer as list of bytes chunks
+    '''
+    document = {
+        "asset": {"version": "2.0", "generator": "FloorplanToBlender3d"},
+        "scene": 0,
+        "scenes": [{"name": "Scene", "nodes": []}],
+        "nodes": [],
+        "meshes": [],
+        "materials": [],
+        "accessors": [],
+        "bufferViews": [],
+    }
+    chunks = []
+    byte_length = 0
+    materials = {}
+
+    def add_accessor(data, accessor_type, component_type, target):
+        nonlocal byte_length
+        data = np.ascontiguousarray(data)
+        document["bufferViews"].append({
+            "buffer": 0,
+            "byteOffset": byte_length,
+            "byteLength": data.nbytes,
+            "target": target,
+        })
+        document["accessors"].append({
+            "bufferView": len(document["bufferViews"]) - 1,
+            "componentType": component_type,
+            "count": len(data),
+            "type": accessor_type,
+        })
+
+        # views are aligned to 4 bytes
+        padding = -data.nbytes % 4
+        chunks.append(data.tobytes() + b"\0" * padding)
+        byte_length += data.nbytes + padding
+        return len(document["accessors"]) - 1
+
+    def add_material(material):
+        key = material_key(material)
+        name = key[0]
+        if key not in materials:
+            materials[key] = len(document["materials"])
+            document["materials"].append({
+                "name": name,
+                "pbrMetallicRoughness": {
+                    # blender colors can be out of range
+                    "baseColorFactor": np.clip(key[1], 0, 1).tolist(),
+                    "metallicFactor": 0,
+                },
+            })
+        return materials[key]
+
+    def add_mesh(name, mesh):
+        verts = mesh["verts"]
+        if yup:
+            verts = to_yup(verts)
+        verts = verts.astype("<f4")
+
+        positions = add_accessor(verts, "VEC3", gltf_float, gltf_array_buffer)
+        document["accessors"][positions]["min"] = verts.min(axis=0).tolist()
+        document["accessors"][positions]["max"] = verts.max(axis=0).tolist()
+        indices = add_accessor(mesh["triangles"].astype("<u4").reshape(-1), "SCALAR", gltf_unsigned_int, gltf_element_array_buffer)
+
+        document["meshes"].append({
+            "name": name,
+            "primitives": [{
+                "attributes": {"POSITION": positions},
+                "indices": indices,
+                "material": add_material(mesh["material"]),
+            }],
+        })
+        return len(document["meshes"]) - 1
+
+    def add_node(node):
+        translation = node["translation"]
+        rotation = node["rotation"]
+        if yup:
+            translation = to_yup(translation)
+            rotation = to_yup(rotation)
+
+        gltf_node = {"name": node["name"]}
+        if translation.any():
+            gltf_node["translation"] = translation.tolist()
+        if not np.array_equal(rotation, [0, 0, 0, 1]):
+            gltf_node["rotation"] = rotation.tolist()
+        if node["mesh"] is not None:
+            gltf_node["mesh"] = add_mesh(node["name"], node["mesh"])
+
+        document["nodes"].append(gltf_node)
+        index = len(document["nodes"]) - 1
+
+        children = [add_node(child) for child in node["children"]]
+        if children:
+            gltf_node["children"] = children
+        return index
+
+    for node in nodes:
+        document["scenes"][0]["nodes"].append(add_node(node))
+
+    document["buffers"] = []
+    if byte_length:
+        document["buffers"].append({"byteLength": byte_length})
+
+    # empty lists and buffers are not allowed in gltf
+    for key in ["meshes", "materials", "accessors", "bufferViews", "buffers"]:
+        if not document[key]:
+            del document[key]
+
+    return document, chunks
+
+def write_gltf(file_path, nodes, binary=None):
+    '''
+    Write gltf
+    @Param file_path, path to output file
+    @Param nodes, list of root nodes, as from load_floorplan
+    @Param binary, write glb, decided by file extension if None
+    '''
+    if binary is None:
+        binary = file_path.lower().endswith(".glb")
+
+    document, chunks = create_gltf(nodes)
+
+    if not binary:
+        # embed buffer, same as blender GLTF_EMBEDDED
+        data = b"".join(chunks)
+        if data:
+            document["buffers"][0]["uri"] = "data:application/octet-stream;base64," + base64.b64encode(data).decode("ascii")
+        with open(file_path, "w") as f:
+            json.dump(document, f)
+        return
+
+    json_chunk = json.dumps(document, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    bin_length = sum(len(chunk) for chunk in chunks)
+    length = 12 + 8 + len(json_chunk)
+    if bin_length:
+        length += 8 + bin_length
+
+    with open(file_path, "wb") as f:
+        f.write(struct.pack("<4sII", b"glTF", 2, length))
+        f.write(struct.pack("<I4s", len(json_chunk), b"JSON"))
+        f.write(json_chunk)
+        if bin_length:
+            f.write(struct.pack("<I4s", bin_length, b"BIN\0"))
+            for chunk in chunks:
+                f.write(chunk)
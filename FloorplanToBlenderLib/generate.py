@@ -1,8 +1,13 @@
+import asyncio
+import copy
+import functools
 import cv2
 import numpy as np
 
+from . import datastore
 from . import detect
 from . import IO
+from . import profiling
 from . import transform
 
 '''
@@ -16,39 +21,363 @@ Copyright (C) 2019 Daniel Westberg
 # TODO: create big window implementation (nicer windows!)
 # TODO: write window and door detection and use the generators for them below!
 
-# Paths to save folder
+# Paths to save folder, path is used by generate_*_file functions called without context
 base_path = "Data/"
 path = "Data/"
 
-def generate_all_files(imgpath, info, position=None, rotation=None):
+# Save verts and faces in binary format, json when False, see IO.save_to_binary_file
+binary_files = True
+
+# Save all walls as one mesh, wall_mesh_verts and wall_mesh_faces, instead of one mesh per wall
+merge_walls = True
+
+class FloorplanImage:
+    '''
+    Floorplan image
+    Decodes a floorplan image once and lazily computes the intermediates shared
+    by the generate stages, so each one is calculated at most once per image.
+    Pass it instead of an image path to the generate_*_file functions.
+
+    In pyramid mode gray and the wall images are downscaled, detection runs on them
+    and refine brings found contours back to full resolution coordinates.
+    With wall_thickness the image is resampled the same way, so walls get that thickness.
+    '''
+
+    def __init__(self, img_path, tile_size=None, pyramid_levels=0, pyramid_refine=True, wall_thickness=None):
+        '''
+        @Param img_path, path to image, encoded image bytes or decoded image, see IO.read_image
+        @Param tile_size, filter walls in tiles of this size, see detect.wall_filter_tiled, whole image if None
+        @Param pyramid_levels, detect on image downscaled by 2 ** pyramid_levels, fewer levels are used
+        if walls would get thinner than detect.pyramid_min_wall_thickness
+        @Param pyramid_refine, refine contours at full resolution in pyramid mode, otherwise they are only scaled
+        and the image is decoded at reduced size directly, without decoding it at full resolution
+        @Param wall_thickness, resample image to walls of this thickness in pixels, before pyramid levels.
+        Not resampled if None
+        '''
+        self.img_path = img_path
+        self.tile_size = tile_size
+        self.pyramid_refine = pyramid_refine
+        self.wall_thickness = wall_thickness
+        self.pyramid_levels = pyramid_levels
+        self._settings_factor = None
+        self._factor = None
+        self._img = None
+        self._full_gray = None
+        self._gray = None
+        self._wall_threshold = None
+        self._wall_img = None
+        self._inverted_wall_img = None
+        self._wall_contours = None
+
+    def __str__(self):
+        return IO.image_name(self.img_path)
+
+    @property
+    def factor(self):
+        '''
+        Factor gray is resampled by, width and height of the full image divided by those of gray
+        '''
+        if self._factor is None:
+            self.find_factors()
+        return self._factor
+
+    @property
+    def settings_factor(self):
+        '''
+        Factor of pyramid levels used, pixel sizes of room detection settings are divided by this,
+        see GenerationContext
+        '''
+        if self._settings_factor is None:
+            self.find_factors()
+        return self._settings_factor
+
+    def find_factors(self):
+        '''
+        Estimate wall thickness if needed and find factor and settings_factor
+        '''
+        if self.wall_thickness is None and self.pyramid_levels == 0:
+            self._settings_factor = self._factor = 1
+            return
+
+        reduce = 2 ** self.pyramid_levels
+        if self.pyramid_refine or reduce not in IO.reduced_gray_flags:
+            reduce = 1
+            reduced = self.full_gray
+        else:
+            # estimate on the image decoded at reduced size, so it is never decoded at full resolution
+            reduced = IO.read_image(self.img_path, reduce=reduce)
+        thickness = detect.estimate_wall_thickness(reduced)
+        if thickness is not None:
+            thickness *= reduce
+
+        factor = 1
+        if self.wall_thickness is not None:
+            factor = detect.wall_thickness_factor(thickness, self.wall_thickness)
+
+        # walls too thin at the wanted level lose rooms
+        levels = detect.pyramid_levels(None if thickness is None else thickness / factor, self.pyramid_levels)
+        if levels != self.pyramid_levels:
+            print("Pyramid levels of " + str(self) + " reduced from " + str(self.pyramid_levels) + " to " + str(levels) +
+                  ", walls are " + str(thickness) + " pixels")
+
+        self._settings_factor = 2 ** levels
+        self._factor = factor * self._settings_factor
+        if reduce != 1:
+            # fewer levels or upscaled walls, decode at the largest reduced size within factor instead
+            if self._factor < reduce:
+                reduce = max((r for r in IO.reduced_gray_flags if r <= self._factor), default=1)
+                reduced = IO.read_image(self.img_path, reduce=reduce)
+            self._gray = detect.resample(reduced, self._factor / reduce)
+
+    @property
+    def img(self):
+        '''
+        Decoded BGR image
+        '''
+        if self._img is None:
+            self._img = IO.read_image(self.img_path, grayscale=False)
+        return self._img
+
+    @property
+    def full_gray(self):
+        '''
+        Full resolution grayscale image, decoded without a color image
+        '''
+        if self._full_gray is None:
+            self._full_gray = IO.read_image(self.img_path)
+        return self._full_gray
+
+    @property
+    def gray(self):
+        '''
+        Grayscale image to detect on, resampled in pyramid mode or to wall thickness
+        '''
+        # factor decodes gray at reduced size when it estimates wall thickness without refine
+        factor = self.factor
+        if self._gray is None:
+            if factor == 1:
+                self._gray = self.full_gray
+            elif self.pyramid_refine or self._full_gray is not None or factor not in IO.reduced_gray_flags:
+                self._gray = detect.resample(self.full_gray, factor)
+            else:
+                self._gray = IO.read_image(self.img_path, reduce=factor)
+        return self._gray
+
+    @property
+    def wall_threshold(self):
+        '''
+        Gray level splitting walls from the rest, Otsu threshold as in detect.wall_filter
+        '''
+        if self._wall_threshold is None:
+            self._wall_threshold = detect.otsu_threshold(np.bincount(self.gray.ravel(), minlength=256))
+        return self._wall_threshold
+
+    @property
+    def wall_img(self):
+        '''
+        Wall mask, see detect.wall_filter
+        '''
+        if self._wall_img is None:
+            if self.tile_size is None:
+                self._wall_img = detect.wall_filter(self.gray)
+            else:
+                self._wall_img = detect.wall_filter_tiled(self.gray, self.tile_size)
+        return self._wall_img
+
+    @property
+    def inverted_wall_img(self):
+        '''
+        Inverted wall mask, input to room and detail detection
+        Don't modify it, detect functions should get a copy!
+        '''
+        if self._inverted_wall_img is None:
+            self._inverted_wall_img = ~self.wall_img
+        return self._inverted_wall_img
+
+    @property
+    def wall_contours(self):
+        '''
+        Contour tree of the wall mask, traced once for walls and noise removal of room and detail detection
+        '''
+        if self._wall_contours is None:
+            self._wall_contours = detect.ContourTree(self.wall_img)
+        return self._wall_contours
+
+    def refine(self, contours, threshold, dark=True, offset=0, opening=True):
+        '''
+        Contours found on gray in full resolution coordinates, see detect.refine_contours
+        @Param contours, list of contours
+        @Param threshold, gray level splitting object and background
+        @Param dark, object pixels are at most threshold
+        @Param offset, pixels the contours are out of the edges of objects at full resolution
+        @Param opening, remove lines thinner than walls first
+        @Return list of contours
+        '''
+        if self.factor == 1:
+            return contours
+        if not self.pyramid_refine:
+            return detect.scale_contours(contours, self.factor)
+        # found contours are out of the edges by offset pixels of the downscaled image
+        band = int(np.ceil(self.factor * (abs(offset) + 2)))
+        return detect.refine_contours(contours, self.full_gray, self.factor, threshold, dark, band, offset, opening)
+
+class GenerationContext:
+    '''
+    Generation context
+    Output folder and settings of one floorplan generation.
+    It is passed to the generate functions instead of using the module global path,
+    so floorplans can be generated at the same time in threads or asyncio tasks.
+    OpenCV releases the GIL, so the detection stages of different threads run in parallel.
+    '''
+
+    def __init__(self, path=None, scale=100, wall_height=1, floor_height=1, room_height=0.999,
+                 binary_files=None, merge_walls=None, noise_removal_threshold=50, corners_threshold=0.01,
+                 room_closing_max_length=130, gap_in_wall_min_threshold=5000, tile_size=None, pyramid_levels=0,
+                 pyramid_refine=True, wall_thickness=detect.canonical_wall_thickness):
+        '''
+        @Param path, folder to save data in, generate_all_files creates a new one if None
+        @Param scale, pixel scale to 3d pos
+        @Param wall_height, height of walls
+        @Param floor_height, height of floor
+        @Param room_height, height of rooms, just below floor
+        @Param binary_files, save in binary format, module setting if None
+        @Param merge_walls, save all walls as one mesh, module setting if None
+        @Param noise_removal_threshold, corners_threshold, room_closing_max_length,
+        gap_in_wall_min_threshold, room detection settings, see detect.find_rooms
+        @Param tile_size, filter walls and label rooms in tiles of this size, for very large images.
+        Same result with less memory, whole image at once if None
+        @Param pyramid_levels, detect on image downscaled by 2 ** pyramid_levels and refine found
+        contours at full resolution, faster for high resolution scans. Fewer levels are used if
+        walls would get thinner than detect.pyramid_min_wall_thickness. Walls resampled to the default
+        wall_thickness are already close to it, so set wall_thickness None to use pyramid levels
+        @Param pyramid_refine, refine contours at full resolution in pyramid mode. When False the
+        image is only decoded at reduced size, faster for jpeg scans, vertices are off by up to a few
+        pixels of the downscaled image
+        @Param wall_thickness, resample image so walls are this thick in pixels, so detection takes
+        about the same time and works the same for any resolution. Pixel sizes of room detection
+        settings are then at that thickness, data is still in full resolution coordinates.
+        Oversized scans are downscaled, images with walls near this thickness aren't resampled.
+        Not resampled if None
+        '''
+        if binary_files is None:
+            binary_files = globals()["binary_files"]
+        if merge_walls is None:
+            merge_walls = globals()["merge_walls"]
+
+        self.path = path
+        self.scale = scale
+        self.wall_height = wall_height
+        self.floor_height = floor_height
+        self.room_height = room_height
+        self.binary_files = binary_files
+        self.merge_walls = merge_walls
+        self.noise_removal_threshold = noise_removal_threshold
+        self.corners_threshold = corners_threshold
+        self.room_closing_max_length = room_closing_max_length
+        self.gap_in_wall_min_threshold = gap_in_wall_min_threshold
+        self.tile_size = tile_size
+        self.pyramid_levels = pyramid_levels
+        self.pyramid_refine = pyramid_refine
+        self.wall_thickness = wall_thickness
+
+    def with_path(self, path):
+        '''
+        @Param path, folder to save data in
+        @Return copy of context saving data in path, the context itself is kept for other floorplans
+        '''
+        context = copy.copy(self)
+        context.path = path
+        return context
+
+def get_context(context):
+    '''
+    Get context
+    Context for generate functions called without one, saves to module global path
+    @Param context, GenerationContext or None
+    @Return GenerationContext
+    '''
+    if context is None:
+        return GenerationContext(path)
+    return context
+
+def get_floorplan_image(img_path, context=None):
+    '''
+    Get floorplan image
+    Wrap an image path in a FloorplanImage, already wrapped images are returned as is
+    @Param img_path, path to image or FloorplanImage
+    @Param context, GenerationContext with image settings
+    @Return FloorplanImage
+    '''
+    if isinstance(img_path, FloorplanImage):
+        return img_path
+    if context is None:
+        return FloorplanImage(img_path)
+    return FloorplanImage(img_path, context.tile_size, context.pyramid_levels, context.pyramid_refine,
+                          context.wall_thickness)
+
+@profiling.profile
+def generate_all_files(imgpath, info, position=None, rotation=None, context=None):
     '''
     Generate all data files
     @Param imgpath
     @Param info, boolean if should be printed
     @Param position, vector of float
     @Param rotation, vector of float
+    @Param context, GenerationContext, default settings if None
     @Return path to generated file, shape
     '''
-    global path
+    if context is None:
+        context = GenerationContext()
 
-    print(" ----- Generate ", imgpath, " at pos ", position ," rot ",rotation," -----")
+    print(" ----- Generate ", IO.image_name(imgpath), " at pos ", position ," rot ",rotation," -----")
 
     # Get path to save data
-    path = IO.create_new_floorplan_path(base_path)
+    if context.path is None:
+        context = context.with_path(datastore.create_floorplan_path(base_path))
+
+    shape = generate_mesh_files(imgpath, info, context)
+
+    transform = generate_transform_file(imgpath, info, position, rotation, shape, context)
+
+    return context.path, shape
+
+async def generate_all_files_async(imgpath, info, position=None, rotation=None, context=None, executor=None):
+    '''
+    Generate all data files in executor, see generate_all_files
+    @Param executor, concurrent.futures executor, default thread pool of event loop if None
+    @Return path to generated file, shape
+    '''
+    # get_running_loop needs python 3.7, get_event_loop gives the running loop in a coroutine
+    if hasattr(asyncio, "get_running_loop"):
+        loop = asyncio.get_running_loop()
+    else:
+        loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, functools.partial(generate_all_files, imgpath, info, position, rotation, context))
+
+@profiling.profile
+def generate_mesh_files(imgpath, info, context):
+    '''
+    Generate all data files except transform
+    Used to generate several floorplans at once, their positions depend on the shapes, see execution
+    @Param imgpath
+    @Param info, boolean if should be printed
+    @Param context, GenerationContext with path to save data in
+    @Return shape
+    '''
+    # Decode image once, shared by all stages below
+    image = get_floorplan_image(imgpath, context)
 
-    shape = generate_floor_file(imgpath, info)
-    new_shape = generate_walls_file(imgpath, info)
+    shape = generate_floor_file(image, info, context)
+    new_shape = generate_walls_file(image, info, context)
     shape = validate_shape(shape, new_shape)
-    new_shape = generate_rooms_file(imgpath, info)
+    new_shape = generate_rooms_file(image, info, context)
     shape = validate_shape(shape, new_shape)
 
     #verts, height = generate_big_windows_file(imgpath, info)
     #verts, height = generate_small_windows_file(imgpath, info)
     #verts, height = generate_doors_file(imgpath, info)
 
-    transform = generate_transform_file(imgpath, info, position, rotation, shape)
-
-    return path, shape
+    return shape
 
 def validate_shape(old_shape, new_shape):
     '''
@@ -71,30 +400,18 @@ def get_shape(verts, scale):
     @Param scale to use
     @Return rescaled boxes
     '''
-    if len(verts) == 0:
+    box = transform.verts_bounding_box(verts)
+    if box is None:
         return [0,0,0]
 
-    posList = transform.verts_to_poslist(verts)
-    high = [0,0,0]
-    low = posList[0]
-
-    for pos in posList:
-        if pos[0] > high[0]:
-            high[0] = pos[0]
-        if pos[1] > high[1]:
-            high[1] = pos[1]
-        if pos[2] > high[2]:
-            high[2] = pos[2]
-        if pos[0] < low[0]:
-            low[0] = pos[0]
-        if pos[1] < low[1]:
-            low[1] = pos[1]
-        if pos[2] < low[2]:
-            low[2] = pos[2]
+    low, high = box
+    # shape is measured from origin or lower
+    high = np.maximum(high, 0)
 
-    return [high[0] - low[0],high[1] - low[1],high[2] - low[2]]
+    return (high - low).tolist()
 
-def generate_transform_file(imgpath, info, position, rotation, shape):
+@profiling.profile
+def generate_transform_file(imgpath, info, position, rotation, shape, context=None):
     '''
     Generate transform of file
     A transform contains information about an objects position, rotation.
@@ -103,8 +420,11 @@ def generate_transform_file(imgpath, info, position, rotation, shape):
     @Param position, position vector
     @Param rotation, rotation vector
     @Param shape
+    @Param context, GenerationContext
     @Return transform
     '''
+    context = get_context(context)
+
     #create map
     transform = {}
     if position is None:
@@ -122,44 +442,47 @@ def generate_transform_file(imgpath, info, position, rotation, shape):
     else:
         transform["shape"] = shape
 
-    IO.save_to_file(path+"transform", transform)
+    IO.save_to_file(context.path+"transform", transform)
 
     return transform
 
-def generate_rooms_file(img_path, info):
+@profiling.profile
+def generate_rooms_file(img_path, info, context=None):
     '''
     Generate room data files
-    @Param img_path path to image
+    @Param img_path path to image or FloorplanImage
     @Param info, boolean if should be printed
+    @Param context, GenerationContext
     @Return shape
     '''
     # Read floorplan image
-    img = cv2.imread(img_path)
-
-    # grayscale image
-    gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
+    context = get_context(context)
+    image = get_floorplan_image(img_path, context)
 
     # create verts (points 3d), points to use in mesh creations
     verts = []
     # create faces for each plane, describe order to create mesh points
     faces = []
 
-    # Height of waLL
-    height = 0.999
+    # Height of rooms
+    height = context.room_height
 
     # Scale pixel value to 3d pos
-    scale = 100
+    scale = context.scale
 
-    gray = detect.wall_filter(gray)
+    gray = image.inverted_wall_img
 
-    gray = ~gray
-
-    rooms, colored_rooms = detect.find_rooms(gray.copy())
+    # lengths and areas are in pixels of the image detected on
+    factor = image.settings_factor
+    rooms, colored_rooms = detect.find_rooms(gray.copy(), context.noise_removal_threshold / factor**2, context.corners_threshold,
+                                             context.room_closing_max_length / factor, context.gap_in_wall_min_threshold / factor**2,
+                                             context.tile_size, image.wall_contours)
 
     gray_rooms =  cv2.cvtColor(colored_rooms,cv2.COLOR_BGR2GRAY)
 
     # get box positions for rooms
     boxes, gray_rooms = detect.detectPreciseBoxes(gray_rooms, gray_rooms)
+    boxes = image.refine(boxes, image.wall_threshold, dark=False, offset=-detect.wall_dilation)
 
     #Create verts
     room_count = 0
@@ -176,26 +499,42 @@ def generate_rooms_file(img_path, info):
             count += 1
         faces.append([(temp)])
 
+    profiling.count("verts", sum(len(room) for room in verts))
+
     if(info):
         print("Number of rooms detected : ", room_count)
 
-    IO.save_to_file(path+"rooms_verts", verts)
-    IO.save_to_file(path+"rooms_faces", faces)
+    IO.save_to_file(context.path+"rooms_verts", verts, context.binary_files)
+    IO.save_to_file(context.path+"rooms_faces", faces, context.binary_files)
 
     return get_shape(verts, scale)
 
-def generate_small_windows_file(img_path, info):
+def find_details(image):
+    '''
+    Find details
+    Details such as windows and doors, with the default settings of detect.find_details
+    in pixels of the full resolution image
+    @Param image, FloorplanImage
+    @Return details, colored image, see detect.find_details
+    '''
+    # lengths and areas are in pixels of the image detected on
+    factor = image.settings_factor
+    return detect.find_details(image.inverted_wall_img.copy(), noise_removal_threshold=50 / factor**2,
+                               room_closing_max_length=130 / factor, gap_in_wall_max_threshold=5000 / factor**2,
+                               gap_in_wall_min_threshold=10 / factor**2, wall_contours=image.wall_contours)
+
+@profiling.profile
+def generate_small_windows_file(img_path, info, context=None):
     '''
     Generate small windows data file
-    @Param img_path, path to image
+    @Param img_path, path to image or FloorplanImage
     @Param info, boolean if should be printed
+    @Param context, GenerationContext
     @Return shape
     '''
     # Read floorplan image
-    img = cv2.imread(img_path)
-
-    # grayscale image
-    gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
+    context = get_context(context)
+    image = get_floorplan_image(img_path, context)
 
     # create verts (points 3d), points to use in mesh creations
     verts = []
@@ -206,18 +545,15 @@ def generate_small_windows_file(img_path, info):
     height = 1
 
     # Scale pixel value to 3d pos
-    scale = 100
-
-    gray = detect.wall_filter(gray)
-
-    gray = ~gray
+    scale = context.scale
 
-    rooms, colored_rooms = detect.find_details(gray.copy())
+    rooms, colored_rooms = find_details(image)
 
     gray_rooms =  cv2.cvtColor(colored_rooms,cv2.COLOR_BGR2GRAY)
 
     # get box positions for rooms
     boxes, gray_rooms = detect.detectPreciseBoxes(gray_rooms, gray_rooms)
+    boxes = image.refine(boxes, image.wall_threshold, dark=False, offset=-detect.wall_dilation)
 
     windows = []
     #do a split here, objects next to outside ground are windows, rest are doors or extra space
@@ -249,23 +585,23 @@ def generate_small_windows_file(img_path, info):
         print("Windows created : ", window_amount)
 
 
-    IO.save_to_file(path+"windows_verts", verts)
-    IO.save_to_file(path+"windows_faces", faces)
+    IO.save_to_file(context.path+"windows_verts", verts, context.binary_files)
+    IO.save_to_file(context.path+"windows_faces", faces, context.binary_files)
 
     return get_shape(verts, scale)
 
-def generate_doors_file(img_path, info):
+@profiling.profile
+def generate_doors_file(img_path, info, context=None):
     '''
     Generate door data file
-    @Param img_path
+    @Param img_path, path to image or FloorplanImage
     @Param info, boolean if should be print
+    @Param context, GenerationContext
     @Return shape
     '''
     # Read floorplan image
-    img = cv2.imread(img_path)
-
-    # grayscale image
-    gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
+    context = get_context(context)
+    image = get_floorplan_image(img_path, context)
 
     # create verts (points 3d), points to use in mesh creations
     verts = []
@@ -276,18 +612,15 @@ def generate_doors_file(img_path, info):
     height = 1
 
     # Scale pixel value to 3d pos
-    scale = 100
-
-    gray = detect.wall_filter(gray)
+    scale = context.scale
 
-    gray = ~gray
-
-    rooms, colored_rooms = detect.find_details(gray.copy())
+    rooms, colored_rooms = find_details(image)
 
     gray_rooms =  cv2.cvtColor(colored_rooms,cv2.COLOR_BGR2GRAY)
 
     # get box positions for rooms
     boxes, gray_rooms = detect.detectPreciseBoxes(gray_rooms, gray_rooms)
+    boxes = image.refine(boxes, image.wall_threshold, dark=False, offset=-detect.wall_dilation)
 
     doors = []
 
@@ -307,37 +640,38 @@ def generate_doors_file(img_path, info):
     if(info):
         print("Doors created : ", door_amount)
 
-    IO.save_to_file(path+"doors_verts", verts)
-    IO.save_to_file(path+"doors_faces", faces)
+    IO.save_to_file(context.path+"doors_verts", verts, context.binary_files)
+    IO.save_to_file(context.path+"doors_faces", faces, context.binary_files)
 
     return get_shape(verts, scale)
 
-def generate_floor_file(img_path, info):
+@profiling.profile
+def generate_floor_file(img_path, info, context=None):
     '''
     Generate floor data file
-    @Param img_path, path to image
+    @Param img_path, path to image or FloorplanImage
     @Param info, boolean if should be printed
+    @Param context, GenerationContext
     @Return shape
     '''
     # Read floorplan image
-    img = cv2.imread(img_path)
-
-    # grayscale image
-    gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
+    context = get_context(context)
+    image = get_floorplan_image(img_path, context)
 
     # detect outer Contours (simple floor or roof solution)
-    contour, img = detect.detectOuterContours(gray)
+    contour, img = detect.detectOuterContours(image.gray)
+    contour = image.refine([contour], detect.outer_contour_threshold, opening=False)[0]
 
     # create verts (points 3d), points to use in mesh creations
     verts = []
     # create faces for each plane, describe order to create mesh points
     faces = []
 
-    # Height of waLL
-    height = 1
+    # Height of floor
+    height = context.floor_height
 
     # Scale pixel value to 3d pos
-    scale = 100
+    scale = context.scale
 
     #Create verts
     verts = transform.scale_point_to_vector(contour, scale, height)
@@ -349,32 +683,32 @@ def generate_floor_file(img_path, info):
         count += 1
 
 
+    profiling.count("verts", len(verts))
+
     if(info):
         print("Approximated apartment size : ", cv2.contourArea(contour))
 
-    IO.save_to_file(path+"floor_verts", verts)
-    IO.save_to_file(path+"floor_faces", faces)
+    IO.save_to_file(context.path+"floor_verts", verts, context.binary_files)
+    IO.save_to_file(context.path+"floor_faces", faces, context.binary_files)
 
     return get_shape(verts, scale)
 
-def generate_walls_file(img_path, info):
+@profiling.profile
+def generate_walls_file(img_path, info, context=None):
     '''
     Generate wall data file for floorplan
-    @Param img_path, path to input file
+    @Param img_path, path to input file or FloorplanImage
     @Param info, boolean if data should be printed
+    @Param context, GenerationContext
     @Return shape
     '''
     # Read floorplan image
-    img = cv2.imread(img_path)
+    context = get_context(context)
+    image = get_floorplan_image(img_path, context)
 
-    # grayscale image
-    gray = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
-
-    # create wall image (filter out small objects from image)
-    wall_img = detect.wall_filter(gray)
-
-    # detect walls
-    boxes, img = detect.detectPreciseBoxes(wall_img)
+    # detect walls, on wall image (filter out small objects from image)
+    boxes, img = detect.detectPreciseBoxes(image.wall_img, contours=image.wall_contours)
+    boxes = image.refine(boxes, image.wall_threshold, offset=detect.wall_dilation)
 
     # create verts (points 3d), points to use in mesh creations
     verts = []
@@ -382,19 +716,36 @@ def generate_walls_file(img_path, info):
     faces = []
 
     # Height of waLL
-    wall_height = 1
+    wall_height = context.wall_height
 
     # Scale pixel value to 3d pos
-    scale = 100
+    scale = context.scale
+
+    if context.merge_walls:
+        # Convert boxes to one mesh
+        verts, faces = transform.create_wall_mesh(boxes, wall_height, scale)
+        wall_amount = len(faces)
+    else:
+        # Convert boxes to verts and faces, as (walls, 4, 3) array
+        walls, offsets, faces = transform.create_nx4_verts_array(boxes, wall_height, scale)
+        wall_amount = len(walls)
 
-    # Convert boxes to verts and faces
-    verts, faces, wall_amount = transform.create_nx4_verts_and_faces(boxes, wall_height, scale)
+    profiling.count("walls", wall_amount)
+    profiling.count("verts", len(verts) if context.merge_walls else wall_amount * 4)
 
     if(info):
         print("Walls created : ", wall_amount)
 
     # One solution to get data to blender is to write and read from file.
-    IO.save_to_file(path+"wall_verts", verts)
-    IO.save_to_file(path+"wall_faces", faces)
+    if context.merge_walls:
+        IO.save_to_file(context.path+"wall_mesh_verts", verts, context.binary_files)
+        IO.save_to_file(context.path+"wall_mesh_faces", faces, context.binary_files)
+        return get_shape(verts, scale)
 
-    return get_shape(verts, scale)
+    # split into one array of walls per box
+    verts = np.split(walls, offsets[1:-1])
+
+    IO.save_to_file(context.path+"wall_verts", verts, context.binary_files)
+    IO.save_to_file(context.path+"wall_faces", faces, context.binary_files)
+
+    return get_shape(walls, scale)
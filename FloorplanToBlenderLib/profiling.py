@@ -0,0 +1,254 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+'''
+Profiling
+This file contains instrumentation of the generate pipeline, telling where a job spends its time.
+Functions decorated with profile and code in stage blocks are measured when profiling is enabled:
+wall time, cpu time of the thread, peak memory and counts such as walls or rooms.
+When disabled, which is the default, a measured call only checks the enabled flag.
+
+Example usage:
+
+profiling.enable()
+generate.generate_all_files(image_path, False)
+profiling.save_report("report.json")
+profiling.save_trace("trace.json") # open in chrome://tracing or ui.perfetto.dev
+
+Memory is measured with tracemalloc, it is shared by all threads of the process.
+Stages in other processes, such as execution.generate_mesh_files, are not recorded.
+
+FloorplanToBlender3d
+Copyright (C) 2019 Daniel Westberg
+'''
+
+enabled = False
+
+# Measure peak memory, tracemalloc slows down allocations
+trace_memory = False
+
+# Finished stages, in order they ended
+records = []
+
+start_time = 0
+local = threading.local()
+
+# tracemalloc.reset_peak needs python 3.9, without it stage peaks are found from
+# changes of the process peak, see Stage.observe
+can_reset_peak = hasattr(tracemalloc, "reset_peak")
+
+# time.thread_time needs python 3.7, process time also counts other threads
+if hasattr(time, "thread_time"):
+    cpu_time = time.thread_time
+else:
+    cpu_time = time.process_time
+
+def enable(memory=True):
+    '''
+    Enable profiling, earlier records are removed
+    @Param memory, measure peak memory of stages
+    '''
+    global enabled, trace_memory, start_time
+    reset()
+    start_time = time.perf_counter()
+    trace_memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    enabled = True
+
+def disable():
+    '''
+    Disable profiling, records are kept
+    '''
+    global enabled
+    enabled = False
+    if trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def reset():
+    '''
+    Remove records
+    '''
+    del records[:]
+
+class Stage:
+    '''
+    Stage
+    Measures one block of code, use as context manager
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+
+    def __enter__(self):
+        stack = getattr(local, "stack", None)
+        if stack is None:
+            stack = local.stack = []
+        self.depth = len(stack)
+
+        if trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # keep peak of outer stage before starting a new one
+            if stack:
+                stack[-1].observe(current, peak)
+            self.memory_start = current
+            self.peak = current
+            self.peak_start = peak
+            if can_reset_peak:
+                tracemalloc.reset_peak()
+        else:
+            self.memory_start = None
+
+        stack.append(self)
+        self.cpu = cpu_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        cpu = cpu_time() - self.cpu
+        local.stack.pop()
+
+        record = {
+            "name": self.name,
+            "thread": threading.get_ident(),
+            "depth": self.depth,
+            "start": self.start - start_time,
+            "wall": end - self.start,
+            "cpu": cpu,
+            "memory": None,
+            "counts": self.counts,
+        }
+
+        if self.memory_start is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            self.observe(current, peak)
+            record["memory"] = self.peak - self.memory_start
+            if local.stack:
+                local.stack[-1].peak = max(local.stack[-1].peak, self.peak)
+
+        records.append(record)
+        return False
+
+    def observe(self, current, peak):
+        '''
+        Update peak memory of stage from tracemalloc.get_traced_memory
+        Without reset_peak the process peak only belongs to this stage
+        when it grew after the stage started
+        @Param current, traced memory now
+        @Param peak, traced peak
+        '''
+        self.peak = max(self.peak, current)
+        if can_reset_peak or peak > self.peak_start:
+            self.peak = max(self.peak, peak)
+
+    def count(self, name, amount):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+class NullStage:
+    '''
+    Stage used when profiling is disabled
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def count(self, name, amount):
+        pass
+
+null_stage = NullStage()
+
+def stage(name):
+    '''
+    Stage
+    Measure block of code, with profiling.stage("blender"): ...
+    @Param name, name of stage
+    @Return context manager
+    '''
+    if not enabled:
+        return null_stage
+    return Stage(name)
+
+def profile(function):
+    '''
+    Profile
+    Decorator measuring each call of function as a stage named module.function
+    @Param function
+    @Return wrapped function
+    '''
+    name = function.__module__.rsplit(".", 1)[-1] + "." + function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        with Stage(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+def count(name, amount):
+    '''
+    Count
+    Add amount to a count of the innermost running stage, such as count("walls", len(walls))
+    @Param name, name of count
+    @Param amount
+    '''
+    if not enabled:
+        return
+    stack = getattr(local, "stack", None)
+    if stack:
+        stack[-1].count(name, amount)
+
+def report():
+    '''
+    Report
+    @Return dict with all stages, and a summary per stage name
+    '''
+    summary = {}
+    for record in records:
+        total = summary.setdefault(record["name"], {"calls": 0, "wall": 0.0, "cpu": 0.0, "memory": None, "counts": {}})
+        total["calls"] += 1
+        total["wall"] += record["wall"]
+        total["cpu"] += record["cpu"]
+        if record["memory"] is not None:
+            total["memory"] = max(total["memory"] or 0, record["memory"])
+        for name, amount in record["counts"].items():
+            total["counts"][name] = total["counts"].get(name, 0) + amount
+
+    return {"stages": sorted(records, key=lambda record: record["start"]), "summary": summary}
+
+def save_report(file_path):
+    '''
+    Save report as json
+    @Param file_path, path to output file
+    '''
+    with open(file_path, "w") as f:
+        json.dump(report(), f, indent=1)
+
+def save_trace(file_path):
+    '''
+    Save stages in chrome trace event format
+    @Param file_path, path to output file
+    '''
+    events = []
+    for record in records:
+        events.append({
+            "name": record["name"],
+            "cat": record["name"].split(".")[0],
+            "ph": "X",
+            "ts": record["start"] * 1e6,
+            "dur": record["wall"] * 1e6,
+            "pid": os.getpid(),
+            "tid": record["thread"],
+            "args": {"cpu": record["cpu"], "memory": record["memory"], "counts": record["counts"]},
+        })
+    with open(file_path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
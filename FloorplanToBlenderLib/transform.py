@@ -2,6 +2,8 @@ import cv2
 import numpy as np
 from itertools import *
 
+from . import profiling
+
 '''
 Transform
 This file contains functions for transforming data between different formats.
@@ -13,22 +15,60 @@ Copyright (C) 2019 Daniel Westberg
 def recursive_loop_element(thelist, res):
     '''
     Recursive loop element
-    A recursive function transforming any sized array to a one dimentional array
+    Transforming any sized array to a one dimentional array, see flatten
+    Kept for old callers, it no longer recurses
     @Param thelist, incoming list
     @Param res, resulting list
     '''
-    if not thelist:
-        return res
-    else:
-        if isinstance(thelist[0], int):
-            res.append(thelist[0])
-            return recursive_loop_element(thelist[1:], res)
-        elif isinstance(thelist[0], float):
-            res.append(thelist[0])
-            return recursive_loop_element(thelist[1:], res)
+    res.extend(flatten(thelist).tolist())
+    return res
+
+def flatten(thelist):
+    '''
+    Flatten
+    Transform any sized, also ragged, nested lists or numpy arrays to a one dimentional array.
+    Walks the nesting with a stack of iterators, so deep or long lists are no problem
+    and numpy arrays are added in one piece.
+    @Param thelist, incoming list
+    @Return one dimentional numpy array, in same order as thelist
+    '''
+    pieces = []
+    numbers = []
+    stack = [iter((thelist,))]
+    while stack:
+        for element in stack[-1]:
+            if isinstance(element, np.ndarray):
+                if numbers:
+                    pieces.append(np.asarray(numbers))
+                    numbers = []
+                pieces.append(element.reshape(-1))
+            elif isinstance(element, (list, tuple)):
+                if element and not isinstance(element[0], (list, tuple, np.ndarray)):
+                    # list of numbers, such as a position
+                    numbers.extend(element)
+                    continue
+                # continue with this list, the current one is resumed when it is done
+                stack.append(iter(element))
+                break
+            else:
+                numbers.append(element)
         else:
-            res.extend( recursive_loop_element(thelist[0], []))
-            return  recursive_loop_element(thelist[1:], res)
+            stack.pop()
+
+    if numbers:
+        pieces.append(np.asarray(numbers))
+    if not pieces:
+        return np.zeros(0)
+    return np.concatenate(pieces)
+
+def verts_to_array(verts):
+    '''
+    Verts to array
+    Convert any verts array, such as walls, floor or rooms, to an array of positions
+    @Param verts of undecided size
+    @Return (positions, 3) numpy array
+    '''
+    return flatten(verts).reshape(-1, 3)
 
 def verts_to_poslist(verts):
     '''
@@ -37,14 +77,19 @@ def verts_to_poslist(verts):
     @Param verts of undecided size
     @Return res, list of position
     '''
-    list_of_elements = recursive_loop_element(verts, [])
+    return verts_to_array(verts).tolist()
 
-    res = []
-    i = 0
-    while(i < len(list_of_elements)-1):
-        res.append([list_of_elements[i],list_of_elements[i+1],list_of_elements[i+2]])
-        i+= 3
-    return res
+def verts_bounding_box(verts):
+    '''
+    Verts bounding box
+    Lowest and highest value on each axis of any verts array
+    @Param verts of undecided size
+    @Return low, high as numpy arrays of 3 values, None if there are no positions
+    '''
+    positions = verts_to_array(verts)
+    if len(positions) == 0:
+        return None
+    return positions.min(axis=0), positions.max(axis=0)
 
 def scale_point_to_vector(boxes, scale = 1, height = 0):
     '''
@@ -76,6 +121,7 @@ def write_verts_on_2d_image(boxes, blank_image):
     cv2.imshow('show image',blank_image)
     cv2.waitKey(0)
 
+@profiling.profile
 def create_nx4_verts_and_faces(boxes, height = 1, scale = 1, ground = 0):
     '''
     Create verts and faces
@@ -86,39 +132,182 @@ def create_nx4_verts_and_faces(boxes, height = 1, scale = 1, ground = 0):
     Use the result by looping over boxes in verts, and create mesh for each box with same face and pos
     See create_custom_mesh in floorplan code
     '''
-    wall_counter = 0
-    verts = []
+    walls, offsets, faces = create_nx4_verts_array(boxes, height, scale, ground)
 
-    for box in boxes:
-        box_verts = []
-        for index in range(0, len(box) ):
-            temp_verts = []
-            # Get current
-            curr = box[index][0];
+    walls = walls.tolist()
+    verts = [walls[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
 
-            # is last, link to first
-            if(len(box)-1 >= index+1):
-                next = box[index+1][0];
-            else:
-                next = box[0][0]; # link to first pos
+    return verts, faces, len(walls)
 
-            # Create all 3d poses for each wall
-            temp_verts.extend([(curr[0]/scale, curr[1]/scale, ground)])
-            temp_verts.extend([(curr[0]/scale, curr[1]/scale, height)])
-            temp_verts.extend([(next[0]/scale, next[1]/scale, ground)])
-            temp_verts.extend([(next[0]/scale, next[1]/scale, height)])
+def link_box_corners(boxes, scale = 1):
+    '''
+    Link box corners
+    Stack corners of all boxes and link each one with the next corner of its box, last links to first
+    @Param boxes, list of contours as from detect.detectPreciseBoxes
+    @Param scale,
+    @Return corners - as (corners, 2) scaled numpy array, next - index of next corner,
+    offsets - first corner of each box and corner amount last
+    '''
+    sizes = [len(box) for box in boxes]
+    offsets = np.zeros(len(boxes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+
+    if offsets[-1] == 0:
+        return np.zeros((0, 2)), np.zeros(0, dtype=np.int64), offsets
 
-            # add wall verts to verts
-            box_verts.extend([temp_verts])
+    corners = np.concatenate([np.reshape(box, (-1, 2)) for box in boxes]) / scale
 
-            # wall counter
-            wall_counter += 1
+    next = np.arange(1, offsets[-1] + 1)
+    next[offsets[1:] - 1] = offsets[:-1]
 
-        verts.extend([box_verts])
+    return corners, next, offsets
+
+@profiling.profile
+def create_nx4_verts_array(boxes, height = 1, scale = 1, ground = 0):
+    '''
+    Create verts and faces as one contiguous array
+    Each corner of a box is linked with the next one, last links to first, to create a wall.
+    @Param boxes, list of contours as from detect.detectPreciseBoxes
+    @Param height,
+    @Param scale,
+    @Param ground,
+    @Return verts - as (walls, 4, 3) numpy array, offsets - first wall of each box and wall amount last,
+    faces - as array to use on all walls
+    '''
+    curr, next, offsets = link_box_corners(boxes, scale)
+    wall_amount = len(curr)
 
     faces = [(0, 1, 3, 2)]
-    return verts, faces, wall_counter
 
+    verts = np.empty((wall_amount, 4, 3))
+    verts[:, 0:2, :2] = curr[:, np.newaxis]
+    verts[:, 2:4, :2] = curr[next][:, np.newaxis]
+    verts[:, 0::2, 2] = ground
+    verts[:, 1::2, 2] = height
+
+    return verts, offsets, faces
+
+@profiling.profile
+def create_wall_mesh(boxes, height = 1, scale = 1, ground = 0):
+    '''
+    Create one merged mesh of all walls
+    Each corner of a box gets a ground and a top vert, shared by the two walls next to it.
+    @Param boxes, list of contours as from detect.detectPreciseBoxes
+    @Param height,
+    @Param scale,
+    @Param ground,
+    @Return verts - as (verts, 3) numpy array, faces - as (walls, 4) numpy array of vert indices
+    '''
+    points, next, offsets = link_box_corners(boxes, scale)
+    curr = np.arange(len(points))
+
+    verts = np.empty((len(points) * 2, 3))
+    verts[0::2, :2] = points
+    verts[1::2, :2] = points
+    verts[0::2, 2] = ground
+    verts[1::2, 2] = height
+
+    # same order as faces of create_nx4_verts_and_faces
+    faces = np.stack((curr*2, curr*2 + 1, next*2 + 1, next*2), axis=1)
+
+    # a box of one corner has no wall
+    faces = faces[curr != next]
+
+    return verts, faces
+
+@profiling.profile
+def triangulate_faces(verts, faces):
+    '''
+    Triangulate faces
+    @Param verts, (verts, 3) numpy array
+    @Param faces, list of faces or (faces, corners) numpy array of vert indices
+    @Return (triangles, 3) numpy array of vert indices, same winding as faces
+    '''
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+
+    if isinstance(faces, np.ndarray) and faces.ndim == 2 and faces.shape[1] in (3, 4):
+        # walls are rectangles, split all of them at once
+        if faces.shape[1] == 3:
+            return faces
+        return np.stack((faces[:, [0, 1, 2]], faces[:, [0, 2, 3]]), axis=1).reshape(-1, 3)
+
+    triangles = []
+    for face in faces:
+        face = np.asarray(face).reshape(-1)
+        if len(face) >= 3:
+            triangles.append(face[triangulate_polygon(verts[face])])
+
+    if not triangles:
+        return np.zeros((0, 3), dtype=np.int64)
+    return np.concatenate(triangles)
+
+def triangulate_polygon(points):
+    '''
+    Triangulate polygon with ear clipping
+    Works for concave polygons, such as floor and room outlines
+    @Param points, (corners, 2) or (corners, 3) numpy array, 3d polygons are projected on their main plane
+    @Return (corners - 2, 3) numpy array of corner indices, same winding as points
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    if points.shape[1] == 3:
+        # drop the axis the polygon faces, see Newell's method
+        following = np.roll(points, -1, axis=0)
+        normal = np.sum(np.cross(points, following), axis=0)
+        points = np.delete(points, np.argmax(np.abs(normal)), axis=1)
+
+    x = points[:, 0]
+    y = points[:, 1]
+
+    # clip ears of counter clockwise polygon, turn back clockwise ones when done
+    area = np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+    clockwise = area < 0
+    remaining = np.arange(len(points))
+    if clockwise:
+        remaining = remaining[::-1]
+
+    triangles = []
+    while len(remaining) > 3:
+        prev = np.roll(remaining, 1)
+        next = np.roll(remaining, -1)
+        turn = (x[remaining] - x[prev]) * (y[next] - y[remaining]) - (y[remaining] - y[prev]) * (x[next] - x[remaining])
+
+        # only reflex corners can be inside an ear
+        reflex = remaining[turn <= 0]
+
+        candidates = np.flatnonzero(turn > 0)
+        ear = None
+        for index in candidates:
+            a, b, c = prev[index], remaining[index], next[index]
+            others = reflex[(reflex != a) & (reflex != b) & (reflex != c)]
+            if len(others) == 0 or not np.any(points_in_triangle(points[others], points[a], points[b], points[c])):
+                ear = index
+                break
+
+        if ear is None:
+            # degenerate polygon, clip the sharpest corner to keep going
+            ear = np.argmax(turn)
+
+        triangles.append((prev[ear], remaining[ear], next[ear]))
+        remaining = np.delete(remaining, ear)
+
+    triangles.append(tuple(remaining))
+
+    triangles = np.array(triangles, dtype=np.int64)
+    if clockwise:
+        triangles = triangles[:, ::-1]
+    return triangles
+
+def points_in_triangle(points, a, b, c):
+    '''
+    Check which points are strictly inside counter clockwise triangle a, b, c
+    @Param points, (points, 2) numpy array
+    @Return boolean numpy array
+    '''
+    def side(p, q):
+        return (q[0] - p[0]) * (points[:, 1] - p[1]) - (q[1] - p[1]) * (points[:, 0] - p[0])
+    return (side(a, b) > 0) & (side(b, c) > 0) & (side(c, a) > 0)
+
+@profiling.profile
 def create_verts(boxes, height, scale):
     '''
     Simplified converts 2d poses to 3d poses, and adds a height position
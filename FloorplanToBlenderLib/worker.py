@@ -0,0 +1,213 @@
+import json
+import os
+import queue
+import subprocess
+import threading
+
+'''
+Worker
+This file contains a client for long running blender processes,
+so blender is started once and reused for many models instead of once per model.
+See worker in Blender/floorplan_to_3dObject_in_blender.py for the job format.
+
+Example usage:
+
+with worker.BlenderWorkerPool(blender_install_path, program_path, size=2) as pool:
+    for data_path in data_paths:
+        pool.build(output_path, [data_path], ["gltf", "blend"])
+
+FloorplanToBlender3d
+Copyright (C) 2019 Daniel Westberg
+'''
+
+# Same as worker_reply in blender script
+worker_reply = "FLOORPLAN_WORKER_REPLY "
+
+blender_script_path = "Blender" + os.path.sep + "floorplan_to_3dObject_in_blender.py"
+
+class BlenderWorker:
+    '''
+    Blender worker
+    One blender process building models, one job at a time
+    '''
+
+    def __init__(self, blender_install_path, program_path):
+        '''
+        @Param blender_install_path, path to blender executable
+        @Param program_path, path to FloorplanToBlender3d, data paths are relative to it
+        '''
+        self.program_path = program_path
+        self.process = subprocess.Popen([
+            blender_install_path,
+            '-noaudio', # this is a dockerfile ubuntu hax fix
+            '--background',
+            '--python',
+            program_path + os.path.sep + blender_script_path,
+            '--',
+            'worker',
+        ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True, cwd=program_path)
+
+        # wait until blender is started
+        try:
+            self.read_reply()
+        except Exception:
+            self.process.kill()
+            self.close()
+            raise
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def read_reply(self):
+        '''
+        Read reply, skip other output from blender
+        @Return reply
+        '''
+        for line in self.process.stdout:
+            if line.startswith(worker_reply):
+                return json.loads(line[len(worker_reply):])
+        raise RuntimeError("Blender worker stopped, exit code " + str(self.process.wait()))
+
+    def build(self, output_path, data_paths, formats=("gltf", "blend")):
+        '''
+        Build model of floorplans
+        @Param output_path, folder to put output in
+        @Param data_paths, list of paths to generated data
+        @Param formats, any of gltf, glb, obj and blend
+        @Return list of created files
+        '''
+        job = {
+            "program_path": self.program_path,
+            "output_path": output_path,
+            "data_paths": list(data_paths),
+            "formats": list(formats),
+        }
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+
+        reply = self.read_reply()
+        if not reply["ok"]:
+            raise RuntimeError("Blender worker failed to build " + str(data_paths) + "\n" + reply["error"])
+        return reply["files"]
+
+    def close(self):
+        '''
+        Stop blender
+        '''
+        if self.alive:
+            try:
+                self.process.stdin.write(json.dumps({"quit": True}) + "\n")
+                self.process.stdin.close()
+            except OSError:
+                pass
+        self.process.wait()
+        self.process.stdout.close()
+
+class BlenderWorkerPool:
+    '''
+    Blender worker pool
+    Starts up to size workers when needed and reuses them for later jobs,
+    build can be called from several threads at once.
+    '''
+
+    def __init__(self, blender_install_path, program_path, size=1):
+        '''
+        @Param blender_install_path, path to blender executable
+        @Param program_path, path to FloorplanToBlender3d
+        @Param size, max amount of blender processes
+        '''
+        self.blender_install_path = blender_install_path
+        self.program_path = program_path
+        self.size = size
+        self.idle = queue.Queue()
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def acquire(self):
+        '''
+        Get idle worker, start a new one if there is room
+        @Return worker
+        '''
+        while True:
+            # None in idle queue means a stopped worker left room for a new one
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                worker = None
+            if worker is not None:
+                return worker
+
+            with self.lock:
+                start = len(self.workers) < self.size
+                if start:
+                    # reserve place before starting, blender is slow to start
+                    self.workers.append(None)
+
+            if start:
+                return self.start_worker()
+
+            worker = self.idle.get()
+            if worker is not None:
+                return worker
+
+    def start_worker(self):
+        '''
+        Start worker in reserved place
+        @Return worker
+        '''
+        try:
+            worker = BlenderWorker(self.blender_install_path, self.program_path)
+        except Exception:
+            with self.lock:
+                self.workers.remove(None)
+            self.idle.put(None)
+            raise
+
+        with self.lock:
+            self.workers[self.workers.index(None)] = worker
+        return worker
+
+    def release(self, worker):
+        '''
+        Return worker to pool, stopped workers are replaced next time one is needed
+        @Param worker
+        '''
+        if worker.alive:
+            self.idle.put(worker)
+            return
+
+        worker.close()
+        with self.lock:
+            self.workers.remove(worker)
+        self.idle.put(None)
+
+    def build(self, output_path, data_paths, formats=("gltf", "blend")):
+        '''
+        Build model of floorplans on a worker
+        @Param output_path, folder to put output in
+        @Param data_paths, list of paths to generated data
+        @Param formats, any of gltf, glb, obj and blend
+        @Return list of created files
+        '''
+        worker = self.acquire()
+        try:
+            return worker.build(output_path, data_paths, formats)
+        finally:
+            self.release(worker)
+
+    def close(self):
+        '''
+        Stop all workers
+        '''
+        with self.lock:
+            workers = [worker for worker in self.workers if worker is not None]
+            self.workers = []
+        for worker in workers:
+            worker.close()
@@ -0,0 +1,252 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import cv2
+import numpy as np
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+'''
+Benchmark
+Headless benchmark of the generate pipeline on synthetic floorplans.
+Every detect, transform, IO and generate stage of generate_all_files is timed, see profiling,
+results are added to a history file and compared with the previous run of the same case.
+
+Example usage:
+
+python benchmark.py --sizes 1000,4000,20000 --rooms 12
+
+FloorplanToBlender3d
+Copyright (C) 2019 Daniel Westberg
+'''
+
+history_path = os.path.dirname(os.path.realpath(__file__)) + os.path.sep + "benchmark_history.json"
+
+# Slower by this fraction than the previous run is a regression
+regression_threshold = 0.2
+
+# Ignore changes of stages faster than this, in seconds
+min_time = 0.001
+
+def synthetic_floorplan(size, rooms=8, wall_thickness=None, doors=True, openings=0, noise=0.0, seed=0):
+    '''
+    Synthetic floorplan
+    Draws an apartment split into rooms, black walls on white background
+    @Param size, width of image in pixels, height is 3/4 of it
+    @Param rooms, amount of rooms
+    @Param wall_thickness, in pixels, 1% of size if None
+    @Param doors, boolean, cut a door with a swing arc in each inner wall
+    @Param openings, amount of windows in outer walls
+    @Param noise, fraction of pixels flipped to black or white
+    @Param seed, for random room layout
+    @Return grayscale image
+    '''
+    random = np.random.RandomState(seed)
+    width, height = size, size * 3 // 4
+    if wall_thickness is None:
+        wall_thickness = max(3, size // 100)
+    margin = size // 10
+
+    img = np.full((height, width), 255, np.uint8)
+
+    # split largest room along its longer side until there are enough rooms
+    boxes = [(margin, margin, width - margin, height - margin)]
+    walls = []
+    while len(boxes) < rooms:
+        boxes.sort(key=lambda box: (box[2] - box[0]) * (box[3] - box[1]))
+        x0, y0, x1, y1 = boxes.pop()
+        if x1 - x0 >= y1 - y0:
+            x = int(x0 + (x1 - x0) * random.uniform(0.35, 0.65))
+            boxes += [(x0, y0, x, y1), (x, y0, x1, y1)]
+            walls.append(((x, y0), (x, y1)))
+        else:
+            y = int(y0 + (y1 - y0) * random.uniform(0.35, 0.65))
+            boxes += [(x0, y0, x1, y), (x0, y, x1, y1)]
+            walls.append(((x0, y), (x1, y)))
+
+    cv2.rectangle(img, (margin, margin), (width - margin, height - margin), 0, wall_thickness)
+    for start, end in walls:
+        cv2.line(img, start, end, 0, wall_thickness)
+
+    door_width = max(4 * wall_thickness, size // 40)
+    if doors:
+        for (x0, y0), (x1, y1) in walls:
+            horizontal = y0 == y1
+            length = (x1 - x0) if horizontal else (y1 - y0)
+            if length < 3 * door_width:
+                continue
+            offset = random.randint(door_width, length - 2 * door_width)
+            if horizontal:
+                start = (x0 + offset, y0)
+                cv2.rectangle(img, (start[0], y0 - wall_thickness), (start[0] + door_width, y0 + wall_thickness), 255, -1)
+                cv2.ellipse(img, start, (door_width, door_width), 0, 0, 90, 0, 1)
+            else:
+                start = (x0, y0 + offset)
+                cv2.rectangle(img, (x0 - wall_thickness, start[1]), (x0 + wall_thickness, start[1] + door_width), 255, -1)
+                cv2.ellipse(img, start, (door_width, door_width), 0, 0, 90, 0, 1)
+
+    # windows, gap in outer wall with thin lines along it
+    for i in range(openings):
+        x = random.randint(margin + door_width, width - margin - 2 * door_width)
+        y = margin if i % 2 == 0 else height - margin
+        cv2.rectangle(img, (x, y - wall_thickness), (x + door_width, y + wall_thickness), 255, -1)
+        cv2.line(img, (x, y - wall_thickness // 2), (x + door_width, y - wall_thickness // 2), 0, 1)
+        cv2.line(img, (x, y + wall_thickness // 2), (x + door_width, y + wall_thickness // 2), 0, 1)
+
+    if noise > 0:
+        flip = random.random_sample(img.shape) < noise
+        img[flip] = random.choice([0, 255], size=int(flip.sum())).astype(np.uint8)
+
+    return img
+
+def git_commit():
+    '''
+    @Return current git commit, None outside of git
+    '''
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.realpath(__file__)),
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_case(img_path, repeat=3, memory=False, tile_size=None, pyramid_levels=0, normalize=False):
+    '''
+    Run generate_all_files and time each stage
+    @Param img_path, path to image
+    @Param repeat, amount of runs, fastest time of each stage is kept
+    @Param memory, also measure peak memory, slows down the run
+    @Param tile_size, see generate.GenerationContext
+    @Param pyramid_levels, see generate.GenerationContext
+    @Param normalize, resample to detect.canonical_wall_thickness, see generate.GenerationContext
+    @Return dict of stages with time, peak memory and counts
+    '''
+    stages = {}
+    for i in range(repeat):
+        with tempfile.TemporaryDirectory() as path:
+            wall_thickness = detect.canonical_wall_thickness if normalize else None
+            context = generate.GenerationContext(path + os.path.sep, tile_size=tile_size, pyramid_levels=pyramid_levels,
+                                                 wall_thickness=wall_thickness)
+            profiling.enable(memory)
+            try:
+                generate.generate_all_files(img_path, False, context=context)
+            finally:
+                profiling.disable()
+
+            for name, total in profiling.report()["summary"].items():
+                stage = stages.setdefault(name, {"calls": total["calls"], "time": total["wall"], "memory": total["memory"], "counts": total["counts"]})
+                stage["time"] = min(stage["time"], total["wall"])
+    profiling.reset()
+    return stages
+
+def compare(previous, current):
+    '''
+    Compare two runs
+    @Param previous, run from history
+    @Param current, run
+    @Return list of (case, stage, previous time, current time) slower than regression_threshold
+    '''
+    res = []
+    for case, result in current["cases"].items():
+        old_result = previous["cases"].get(case)
+        if old_result is None:
+            continue
+        for name, stage in result["stages"].items():
+            old_stage = old_result["stages"].get(name)
+            if old_stage is None or max(stage["time"], old_stage["time"]) < min_time:
+                continue
+            if stage["time"] > old_stage["time"] * (1 + regression_threshold):
+                res.append((case, name, old_stage["time"], stage["time"]))
+    return res
+
+def read_history(file_path):
+    '''
+    @Param file_path, path to history file
+    @Return list of runs, oldest first
+    '''
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+def benchmark(sizes, rooms=8, wall_thickness=None, doors=True, openings=2, noise=0.0, repeat=3, memory=False, file_path=None,
+              tile_size=None, pyramid_levels=0, normalize=False):
+    '''
+    Benchmark
+    Run all cases and add result to history
+    @Param sizes, list of image widths in pixels
+    @Param file_path, path to history file, not saved if None
+    @Return run, regressions compared with previous run
+    '''
+    run = {
+        "time": datetime.datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "cases": {},
+    }
+
+    with tempfile.TemporaryDirectory() as path:
+        for size in sizes:
+            img = synthetic_floorplan(size, rooms, wall_thickness, doors, openings, noise)
+            img_path = path + os.path.sep + str(size) + ".png"
+            cv2.imwrite(img_path, img)
+
+            case = str(size) + "px_" + str(rooms) + "rooms"
+            if tile_size is not None:
+                case += "_tiles" + str(tile_size)
+            if pyramid_levels:
+                case += "_pyramid" + str(pyramid_levels)
+            if normalize:
+                case += "_normalized"
+            stages = run_case(img_path, repeat, memory, tile_size, pyramid_levels, normalize)
+            run["cases"][case] = {"size": size, "rooms": rooms, "noise": noise, "stages": stages}
+
+            print(case, "total %.3fs" % stages["generate.generate_all_files"]["time"])
+
+    history = read_history(file_path) if file_path is not None else []
+    previous = history[-1] if history else {"cases": {}}
+    regressions = compare(previous, run)
+
+    if file_path is not None:
+        history.append(run)
+        with open(file_path, 'w') as f:
+            json.dump(history, f, indent=1)
+
+    return run, regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark generate on synthetic floorplans')
+    parser.add_argument('-s', '--sizes', default='1000,2000,4000',
+                        help='Comma separated image widths in pixels, such as 1000,20000.')
+    parser.add_argument('-r', '--rooms', type=int, default=8, help='Amount of rooms.')
+    parser.add_argument('-t', '--wall-thickness', type=int, default=None, help='Wall thickness in pixels, 1%% of width by default.')
+    parser.add_argument('--no-doors', action='store_true', help='Inner walls without doors.')
+    parser.add_argument('--openings', type=int, default=2, help='Amount of windows in outer walls.')
+    parser.add_argument('-n', '--noise', type=float, default=0.0, help='Fraction of noise pixels.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case, fastest is kept.')
+    parser.add_argument('--memory', action='store_true', help='Measure peak memory of stages.')
+    parser.add_argument('--tile-size', type=int, default=None, help='Filter walls and label rooms in tiles of this size.')
+    parser.add_argument('--pyramid-levels', type=int, default=0, help='Detect on image downscaled by 2 ** levels.')
+    parser.add_argument('--normalize', action='store_true', help='Resample images to the canonical wall thickness.')
+    parser.add_argument('--history', default=history_path, help='Json file runs are added to.')
+    args = parser.parse_args()
+
+    run, regressions = benchmark([int(size) for size in args.sizes.split(',')], args.rooms, args.wall_thickness,
+                                 not args.no_doors, args.openings, args.noise, args.repeat, args.memory, args.history,
+                                 args.tile_size, args.pyramid_levels, args.normalize)
+
+    for case, name, old_time, new_time in regressions:
+        print("Regression", case, name, "%.4fs -> %.4fs" % (old_time, new_time))
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,101 @@
+import pytest
+import numpy as np
+import sys
+import os
+from concurrent.futures import ProcessPoolExecutor
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+
+def test_binary_file_round_trip(tmp_path):
+    '''
+    Ragged verts, such as walls of boxes, and ragged faces, such as rooms
+    '''
+    walls = [[[(0.5,0,0),(0.5,0,1),(1,0,0),(1,0,1)]]*3, [[(2,2,0),(2,2,1),(3,2,0),(3,2,1)]]]
+    rooms_faces = [[(0,1,2)], [(0,1,2,3,4)]]
+    floor_faces = [0,1,2,3]
+
+    for data in [walls, rooms_faces, floor_faces, []]:
+        file_path = str(tmp_path / "data")
+        IO.save_to_file(file_path, data, binary=True)
+
+        assert not os.path.exists(file_path + ".txt")
+        assert IO.read_from_file(file_path) == json_round_trip(data)
+
+def test_binary_file_is_flat(tmp_path):
+    file_path = str(tmp_path / "wall_verts")
+    walls = [np.ones((3,4,3)), np.zeros((1,4,3))]
+    IO.save_to_binary_file(file_path, walls)
+
+    values, levels = IO.read_from_binary_file(file_path)
+
+    assert values.dtype == np.float32
+    assert levels[0] == 2
+    assert list(levels[1]) == [0, 3, 4]
+    assert levels[2:] == [4, 3]
+    assert values.reshape(-1,4,3).shape == (4,4,3)
+
+def test_json_file_fallback(tmp_path):
+    file_path = str(tmp_path / "transform")
+    IO.save_to_file(file_path, {"position": (0,1,0)})
+
+    assert IO.read_from_file(file_path) == {"position": [0,1,0]}
+
+def json_round_trip(data):
+    '''
+    Tuples become lists, same as json
+    '''
+    if isinstance(data, (list, tuple)):
+        return [json_round_trip(d) for d in data]
+    return data
+
+def create_floorplan_paths(path, amount):
+    return [IO.create_new_floorplan_path(path) for i in range(amount)]
+
+def test_create_new_floorplan_path(tmp_path):
+    path = str(tmp_path / "Data") + os.path.sep
+    os.makedirs(path + "3")
+
+    # counter file is missing, continues after existing folders
+    assert IO.create_new_floorplan_path(path) == path + "4" + os.path.sep
+    assert IO.create_new_floorplan_path(path) == path + "5" + os.path.sep
+
+    # counter behind, folder taken by someone else
+    os.makedirs(path + "6")
+    assert IO.create_new_floorplan_path(path) == path + "7" + os.path.sep
+
+    IO.clean_data_folder(path)
+    assert IO.create_new_floorplan_path(path) == path + "0" + os.path.sep
+
+def test_create_new_floorplan_path_in_processes(tmp_path):
+    path = str(tmp_path) + os.path.sep
+
+    with ProcessPoolExecutor(4) as executor:
+        paths = [p for ps in executor.map(create_floorplan_paths, [path]*8, [10]*8) for p in ps]
+
+    assert len(set(paths)) == 80
+    assert all(os.path.isdir(p) for p in paths)
+
+def test_read_image():
+    images = os.path.dirname(os.path.realpath(__file__)) + "/../Images/"
+    img_path = images + "example.png"
+    with open(img_path, "rb") as f:
+        data = f.read()
+
+    gray = IO.read_image(img_path)
+    color = IO.read_image(img_path, grayscale=False)
+    assert gray.ndim == 2 and color.shape == gray.shape + (3,)
+    assert np.array_equal(IO.read_image(data), gray)
+    assert np.array_equal(IO.read_image(gray), gray)
+    assert IO.read_image(color).shape == gray.shape
+
+    reduced = IO.read_image(data, reduce=2)
+    # decoders round partial border blocks differently
+    assert all(abs(a - b / 2) < 1 for a, b in zip(reduced.shape, gray.shape))
+    assert IO.read_image(gray, reduce=2).shape == (gray.shape[0] // 2, gray.shape[1] // 2)
+
+    with pytest.raises(ValueError):
+        IO.read_image(b"not an image")
@@ -0,0 +1,38 @@
+import pytest
+import sys
+import os
+import json
+import cv2
+import numpy as np
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+import benchmark
+
+
+def test_synthetic_floorplan_rooms():
+    img = benchmark.synthetic_floorplan(800, rooms=6, openings=2)
+    assert img.shape == (600, 800)
+
+    rooms, colored = detect.find_rooms(~detect.wall_filter(img))
+    assert len(rooms) == 6
+
+def test_benchmark_history(tmp_path):
+    file_path = str(tmp_path / "history.json")
+    run, regressions = benchmark.benchmark([500], rooms=4, repeat=1, file_path=file_path)
+
+    stages = run["cases"]["500px_4rooms"]["stages"]
+    assert stages["detect.find_rooms"]["counts"]["rooms"] == 4
+    assert stages["generate.generate_all_files"]["time"] > 0
+    assert regressions == []
+
+    # slower stage of same case shows up
+    slow = json.loads(json.dumps(run))
+    slow["cases"]["500px_4rooms"]["stages"]["detect.find_rooms"]["time"] += 1
+    assert [r[:2] for r in benchmark.compare(run, slow)] == [("500px_4rooms", "detect.find_rooms")]
+
+    benchmark.benchmark([500], rooms=4, repeat=1, file_path=file_path)
+    assert len(benchmark.read_history(file_path)) == 2
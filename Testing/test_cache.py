@@ -0,0 +1,71 @@
+import pytest
+import sys
+import os
+import time
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+
+images = os.path.dirname(os.path.realpath(__file__)) + "/../Images/"
+
+def test_cache_hit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    generated = []
+    generate_mesh_files = generate.generate_mesh_files
+    monkeypatch.setattr(generate, "generate_mesh_files", lambda *args: generated.append(args) or generate_mesh_files(*args))
+
+    first_path, first_shape = cache.generate_all_files(images + "example.png", False)
+    second_path, second_shape = cache.generate_all_files(images + "example.png", False, position=(1,2,3))
+    other_path, other_shape = cache.generate_all_files(images + "example.png", False, context=generate.GenerationContext(scale=50))
+
+    # detection only runs for new image or settings
+    assert len(generated) == 2
+    assert first_path != second_path
+    assert first_shape == second_shape
+    assert sorted(os.listdir(first_path)) == sorted(os.listdir(second_path))
+    assert IO.read_from_file(first_path + "wall_mesh_verts") == IO.read_from_file(second_path + "wall_mesh_verts")
+    assert IO.read_from_file(second_path + "transform")["position"] == [1,2,3]
+    assert other_shape != first_shape
+
+def test_cache_entry_unchanged_by_rewrite(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first_path, first_shape = cache.generate_all_files(images + "example.png", False)
+    second_path, second_shape = cache.generate_all_files(images + "example.png", False)
+    verts = IO.read_from_file(first_path + "wall_mesh_verts")
+
+    # generate another floorplan into the folder linked to the cache entry
+    generate.generate_all_files(images + "example2.png", False, context=generate.GenerationContext(second_path))
+    assert IO.read_from_file(second_path + "wall_mesh_verts") != verts
+
+    third_path, third_shape = cache.generate_all_files(images + "example.png", False)
+    assert IO.read_from_file(third_path + "wall_mesh_verts") == verts
+    assert IO.read_from_file(first_path + "wall_mesh_verts") == verts
+
+def test_prune(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, size, age in [("old", 10, 100), ("large", 100, 10), ("new", 10, 0)]:
+        os.makedirs(cache.cache_path + name)
+        with open(cache.cache_path + name + "/data.bin", "wb") as f:
+            f.write(b"0" * size)
+        os.utime(cache.cache_path + name, (time.time() - age, time.time() - age))
+
+    assert cache.prune(max_bytes=1000, max_age=50) == 1
+    assert sorted(os.listdir(cache.cache_path)) == ["large", "new"]
+
+    # least recently used first
+    assert cache.prune(max_bytes=50, max_age=50) == 1
+    assert os.listdir(cache.cache_path) == ["new"]
+
+def test_cache_key_ignores_tile_size():
+    # tiles don't change the data, so cached data is shared
+    assert cache.cache_key(images + "example.png", generate.GenerationContext(tile_size=200)) == \
+        cache.cache_key(images + "example.png", generate.GenerationContext())
+
+def test_cache_key_of_encoded_image():
+    with open(images + "example.png", "rb") as f:
+        data = f.read()
+
+    assert cache.cache_key(data, generate.GenerationContext()) == cache.cache_key(images + "example.png", generate.GenerationContext())
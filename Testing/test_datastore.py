@@ -0,0 +1,115 @@
+import pytest
+import sys
+import os
+import time
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+
+def create_folder(path, size, accessed):
+    folder = datastore.create_floorplan_path(path)
+    with open(folder + "floor_verts.bin", "wb") as f:
+        f.write(b"0" * size)
+    datastore.release(folder)
+
+    metadata = datastore.read_metadata(folder)
+    metadata["accessed"] = time.time() - accessed
+    datastore.write_json(folder + datastore.metadata_file, metadata)
+    return folder
+
+def test_collect_least_recently_used(tmp_path):
+    path = str(tmp_path) + os.path.sep
+    old = create_folder(path, 100, 30)
+    large = create_folder(path, 300, 20)
+    new = create_folder(path, 100, 10)
+
+    assert datastore.read_metadata(new)["size"] >= 100
+
+    # within budget
+    assert datastore.collect(max_bytes=10000, path=path) == []
+
+    # sizes include metadata files
+    removed = datastore.collect(max_bytes=650, path=path)
+    assert [folder + os.path.sep for folder in removed] == [old]
+
+    removed = datastore.collect(max_age=15, path=path)
+    assert [folder + os.path.sep for folder in removed] == [large]
+    assert [folder for folder in os.listdir(path) if folder.isdigit()] == [os.path.basename(new[:-1])]
+
+def test_collect_keeps_leased_folders(tmp_path):
+    path = str(tmp_path) + os.path.sep
+    running = create_folder(path, 100, 30)
+    stopped = create_folder(path, 100, 20)
+
+    # lease of this process, still running
+    datastore.lease(running)
+    metadata = datastore.read_metadata(running)
+    metadata["accessed"] = time.time() - 30
+    datastore.write_json(running + datastore.metadata_file, metadata)
+
+    # lease of a process that has stopped
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    datastore.write_json(stopped + datastore.lease_prefix + "stopped", {"host": datastore.socket.gethostname(), "pid": process.pid, "time": time.time()})
+
+    removed = datastore.collect(max_bytes=0, path=path)
+
+    assert [folder + os.path.sep for folder in removed] == [stopped]
+    assert os.path.isdir(running)
+
+    datastore.release(running)
+    assert datastore.collect(max_bytes=0, path=path) == [running[:-1]]
+
+def test_created_folder_is_leased(tmp_path, monkeypatch):
+    path = str(tmp_path) + os.path.sep
+    # leased folder keeps the budget below zero
+    running = create_folder(path, 100, 30)
+    datastore.lease(running)
+
+    create_new_floorplan_path = IO.create_new_floorplan_path
+    def create_while_collecting(path):
+        assert datastore.collect(max_bytes=0, path=path) == []
+        res = create_new_floorplan_path(path)
+        # no metadata or lease yet
+        assert datastore.collect(max_bytes=0, path=path) == []
+        return res
+    monkeypatch.setattr(IO, "create_new_floorplan_path", create_while_collecting)
+
+    folder = datastore.create_floorplan_path(path)
+    assert datastore.leased(folder)
+    assert datastore.read_metadata(folder)["size"] == 0
+
+    # an empty folder of another process is never replaced
+    monkeypatch.undo()
+    os.mkdir(path + "3")
+    with open(path + IO.floorplan_counter_file, "w") as f:
+        f.write("3")
+    assert datastore.create_floorplan_path(path) == path + "4" + os.path.sep
+    assert os.listdir(path + "3") == []
+
+def create_paths(path, amount, leased):
+    res = []
+    for i in range(amount):
+        if leased:
+            folder = datastore.create_floorplan_path(path)
+            # collect of other processes never removed it
+            datastore.update_metadata(folder)
+        else:
+            folder = IO.create_new_floorplan_path(path)
+        res.append(folder)
+    datastore.collect(max_bytes=0, path=path)
+    return res
+
+def test_create_leased_and_plain_folders_in_processes(tmp_path):
+    path = str(tmp_path) + os.path.sep
+
+    with ProcessPoolExecutor(4) as executor:
+        paths = [p for ps in executor.map(create_paths, [path]*8, [10]*8, [True, False]*4) for p in ps]
+
+    # no folder is given to two jobs
+    assert len(set(paths)) == 80
@@ -0,0 +1,152 @@
+import pytest
+import cv2
+import numpy as np
+import sys
+import os
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+example_image_path = os.path.dirname(os.path.realpath(__file__)) + "/../Images/example.png"
+
+
+def rooms_image():
+    '''
+    Binary image with two rooms separated by a wall, and one small hole
+    '''
+    img = np.zeros((100,200), np.uint8)
+    img[10:90, 10:95] = 255
+    img[10:90, 105:190] = 255
+    img[50:52, 98:100] = 255
+    return img
+
+def test_label_components():
+    labels, stats, kept = detect.label_components(rooms_image(), 100)
+
+    assert len(kept) == 2
+    assert list(stats[kept, cv2.CC_STAT_AREA]) == [80*85, 80*85]
+
+def test_components_behave_like_mask_list():
+    img = rooms_image()
+    labels, stats, kept = detect.label_components(img, 100)
+    rooms = detect.Components(labels, stats, kept)
+
+    masks = list(rooms)
+    assert len(rooms) == len(masks) == 2
+    assert masks[0].dtype == bool and masks[0].shape == img.shape
+    assert masks[0].sum() == rooms.areas[0]
+    assert (rooms[-1] == masks[1]).all()
+
+    roi, (x, y) = rooms.roi_mask(1)
+    assert (x, y) == (105, 10)
+    assert roi.shape == (80, 85) and roi.all()
+
+def test_find_rooms_on_example():
+    gray = cv2.cvtColor(cv2.imread(example_image_path), cv2.COLOR_BGR2GRAY)
+    gray = ~detect.wall_filter(gray)
+
+    rooms, colored_rooms = detect.find_rooms(gray.copy())
+
+    assert len(rooms) > 0
+    assert colored_rooms.shape == gray.shape + (3,)
+    # every room is colored, everything else is black
+    colored = colored_rooms.any(axis=2)
+    assert (colored == np.isin(rooms.labels, rooms.label_ids)).all()
+
+def test_tiled_wall_filter_and_labels():
+    gray = cv2.imread(example_image_path, cv2.IMREAD_GRAYSCALE)
+    walls = detect.wall_filter(gray)
+    labels, stats, kept = detect.label_components(~walls, 100)
+
+    for tile_size in [64, 251]:
+        assert (detect.wall_filter_tiled(gray, tile_size, halo=1) == walls).all()
+
+        tiled_labels, tiled_stats, tiled_kept = detect.label_components_tiled(~walls, 100, tile_size=tile_size)
+        assert (tiled_labels == labels).all()
+        assert (tiled_stats == stats).all()
+        assert (tiled_kept == kept).all()
+
+def test_tiled_labels_merge_across_tiles():
+    # one ring crossing four tiles and separate dots, labelled in raster order
+    img = np.zeros((40, 40), np.uint8)
+    cv2.rectangle(img, (5, 5), (30, 30), 255, 1)
+    img[1, 35] = img[38, 2] = 255
+    img[20, 9] = img[21, 10] = 255
+
+    labels, stats, kept = detect.label_components(img, 1)
+    tiled_labels, tiled_stats, tiled_kept = detect.label_components_tiled(img, 1, tile_size=10)
+    assert len(stats) == 5
+    assert (tiled_labels == labels).all()
+    assert (tiled_stats == stats).all()
+
+def test_refine_contours():
+    # dark box, found on image downscaled by 4 and refined at full resolution
+    gray = np.full((200, 300), 255, np.uint8)
+    gray[41:151, 63:230] = 0
+
+    small = detect.downscale(gray, 4)
+    assert small.shape == (50, 75)
+    contours, hierarchy = cv2.findContours(np.uint8(small < 128) * 255, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    refined = detect.refine_contours(contours, gray, 4, 128, opening=False)
+    assert sorted(map(tuple, refined[0].reshape(-1, 2))) == [(63, 41), (63, 150), (229, 41), (229, 150)]
+
+    # out of the box by offset
+    refined = detect.refine_contours(contours, gray, 4, 128, band=8, offset=3)
+    assert sorted(map(tuple, refined[0].reshape(-1, 2))) == [(60, 38), (60, 153), (232, 38), (232, 153)]
+
+def test_estimate_wall_thickness():
+    img = np.full((400,600), 255, np.uint8)
+    for thickness in [9, 25]:
+        img[:] = 255
+        cv2.rectangle(img, (50,50), (550,350), 0, -1)
+        cv2.rectangle(img, (50+thickness,50+thickness), (550-thickness,350-thickness), 255, -1)
+        # text and door arcs don't count much
+        cv2.putText(img, "Kitchen", (200,200), cv2.FONT_HERSHEY_SIMPLEX, 1, 0, 2)
+        cv2.ellipse(img, (300,300), (40,40), 0, 0, 90, 0, 1)
+        assert abs(detect.estimate_wall_thickness(img) - thickness) <= 1
+        assert abs(detect.estimate_wall_thickness(img, max_pixels=100000) - thickness) <= 2
+
+    assert detect.estimate_wall_thickness(np.full((10,10), 255, np.uint8)) is None
+
+    assert detect.wall_thickness_factor(22, 20) == 1
+    assert detect.wall_thickness_factor(80, 20) == 4
+    assert detect.wall_thickness_factor(50, 20) == 2.5
+    # thin walls are only upscaled to survive wall_filter
+    assert detect.wall_thickness_factor(12, 20) == 1
+    assert detect.wall_thickness_factor(2, 20) == 2 / detect.min_wall_thickness
+
+def test_contour_tree():
+    img = np.zeros((100,200), np.uint8)
+    cv2.rectangle(img, (10,10), (90,90), 255, -1)
+    cv2.rectangle(img, (30,30), (70,70), 0, -1)
+    cv2.rectangle(img, (120,10), (150,40), 255, -1)
+
+    tree = detect.ContourTree(img)
+    assert len(tree) == 3
+    external, _ = cv2.findContours(img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    assert all(np.array_equal(tree.contours[i], contour) for i, contour in zip(tree.outer, external))
+
+    largest = tree.largest()
+    assert tree.areas[largest] == 80 * 80
+    assert tree.perimeters[largest] == 4 * 80
+    assert list(tree.rects[largest]) == [10, 10, 81, 81]
+    # hole, traced along the object pixels around it
+    assert len(tree.children(largest)) == 1
+    assert tree.areas[tree.children(largest)[0]] > 40 * 40
+
+    # shared tree gives the same walls and noise mask as tracing again
+    boxes, _ = detect.detectPreciseBoxes(img)
+    shared, _ = detect.detectPreciseBoxes(img, contours=tree)
+    assert all(np.array_equal(a, b) for a, b in zip(boxes, shared))
+    assert np.array_equal(detect.remove_noise(~img, 1000), detect.remove_noise(~img, 1000, tree))
+
+def test_mark_outside_black_without_walls():
+    img = np.full((50, 60), 255, np.uint8)
+    mask = np.zeros_like(img)
+
+    result, result_mask = detect.mark_outside_black(img.copy(), mask)
+    assert (result == img).all()
+    assert (result_mask == mask).all()
@@ -0,0 +1,58 @@
+import pytest
+import sys
+import os
+import asyncio
+import numpy as np
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+
+images = os.path.dirname(os.path.realpath(__file__)) + "/../Images/"
+
+def test_multiple_simple_positions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    image_paths = [images + "example.png", images + "example2.png", images + "example3.png"]
+
+    data_paths = execution.multiple_simple(image_paths, horizontal=False)
+
+    assert data_paths == ["Data" + os.path.sep + str(i) + os.path.sep for i in range(3)]
+    transforms = [IO.read_from_file(data_path + "transform") for data_path in data_paths]
+    assert transforms[0]["position"] == [0,0,0]
+    # each floorplan is placed after the one before it
+    assert transforms[1]["position"] == [transforms[0]["shape"][0],0,0]
+    assert transforms[2]["position"] == [transforms[1]["shape"][0],0,0]
+
+    # same data as when generated one at a time
+    path, shape = generate.generate_all_files(image_paths[1], False)
+    assert shape == transforms[1]["shape"]
+    assert IO.read_from_file(path + "floor_verts") == IO.read_from_file(data_paths[1] + "floor_verts")
+
+def test_generate_in_threads(tmp_path):
+    image_paths = [images + "example.png", images + "example2.png", images + "example3.png"] * 2
+    contexts = [generate.GenerationContext(str(tmp_path) + os.path.sep + str(i) + os.path.sep, scale=50) for i in range(len(image_paths))]
+    for context in contexts:
+        os.makedirs(context.path)
+
+    async def generate_all():
+        return await asyncio.gather(*[generate.generate_all_files_async(image_path, False, context=context)
+                                      for image_path, context in zip(image_paths, contexts)])
+
+    # asyncio.run needs python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(generate_all())
+    finally:
+        loop.close()
+
+    # every floorplan in its own folder, same as generated alone
+    assert [path for path, shape in results] == [context.path for context in contexts]
+    for i in range(3):
+        assert results[i][1] == results[i+3][1]
+        assert IO.read_from_file(contexts[i].path + "wall_mesh_verts") == IO.read_from_file(contexts[i+3].path + "wall_mesh_verts")
+
+    # settings of context are used
+    path, shape = generate.generate_all_files(image_paths[0], False, context=generate.GenerationContext(str(tmp_path) + os.path.sep, scale=100))
+    assert np.allclose(np.array(results[0][1][:2]) / 2, shape[:2])
@@ -0,0 +1,129 @@
+import pytest
+import numpy as np
+import sys
+import json
+import math
+import struct
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+
+boxes = [np.array([[[0,0]],[[100,0]],[[100,100]],[[0,100]]], np.int32)]
+
+def create_data(data_path, merge_walls=True):
+    '''
+    Data files of one square room with walls around it
+    '''
+    if merge_walls:
+        verts, faces = transform.create_wall_mesh(boxes, 1, 100)
+        IO.save_to_file(data_path + "wall_mesh_verts", verts, True)
+        IO.save_to_file(data_path + "wall_mesh_faces", faces, True)
+    else:
+        walls, offsets, faces = transform.create_nx4_verts_array(boxes, 1, 100)
+        IO.save_to_file(data_path + "wall_verts", [walls], True)
+        IO.save_to_file(data_path + "wall_faces", faces, True)
+
+    square = transform.scale_point_to_vector(boxes[0], 100, 1)
+    IO.save_to_file(data_path + "floor_verts", square, True)
+    IO.save_to_file(data_path + "floor_faces", [0,1,2,3], True)
+    IO.save_to_file(data_path + "rooms_verts", [transform.scale_point_to_vector(boxes[0], 100, 0.999)], True)
+    IO.save_to_file(data_path + "rooms_faces", [[(0,1,2,3)]], True)
+    IO.save_to_file(data_path + "transform", {"position": (0,0,0), "rotation": (0,0,0), "shape": (1,1,1)})
+
+def read_glb(file_path):
+    with open(file_path, "rb") as f:
+        data = f.read()
+    magic, version, length = struct.unpack("<4sII", data[:12])
+    json_length, = struct.unpack("<I", data[12:16])
+
+    assert magic == b"glTF" and version == 2 and length == len(data)
+    return json.loads(data[20:20+json_length]), data[28+json_length:]
+
+def test_load_floorplan_hierarchy(tmp_path):
+    data_path = str(tmp_path) + "/"
+    create_data(data_path, merge_walls=False)
+
+    floorplan = export.load_floorplan(data_path)
+
+    assert floorplan["name"] == "Floorplan0"
+    assert np.allclose(floorplan["rotation"], export.euler_to_quaternion((0, math.pi, 0)))
+    assert [child["name"] for child in floorplan["children"]] == ["Walls", "Floor", "Rooms"]
+    walls, floor, rooms = floorplan["children"]
+    assert [wall["name"] for wall in walls["children"]] == ["Box0Wall0", "Box0Wall1", "Box0Wall2", "Box0Wall3"]
+    # pivot in center of mesh, moved by half shape
+    assert floor["translation"].tolist() == [0.5, 0.5, 0]
+    assert floor["mesh"]["verts"].mean(axis=0).tolist() == [0, 0, 0]
+    assert len(rooms["children"][0]["mesh"]["triangles"]) == 2
+
+def test_write_glb(tmp_path):
+    data_path = str(tmp_path) + "/"
+    create_data(data_path)
+
+    export.export_floorplans(str(tmp_path / "floorplan.glb"), [data_path, data_path])
+    document, buffer = read_glb(str(tmp_path / "floorplan.glb"))
+
+    assert len(document["scenes"][0]["nodes"]) == 2
+    assert [node["name"] for node in document["nodes"][:5]] == ["Floorplan0", "Walls", "Floor", "Rooms", "Room0"]
+    assert len(document["materials"]) == 3
+    assert document["buffers"][0]["byteLength"] == len(buffer)
+
+    walls = document["meshes"][document["nodes"][1]["mesh"]]["primitives"][0]
+    positions = document["accessors"][walls["attributes"]["POSITION"]]
+    indices = document["accessors"][walls["indices"]]
+    assert positions["count"] == 8
+    assert indices["count"] == 4 * 2 * 3
+    # y up, walls go from ground to height
+    assert positions["max"][1] - positions["min"][1] == 1
+
+def test_write_obj_ply_stl(tmp_path):
+    data_path = str(tmp_path) + "/"
+    create_data(data_path)
+    # 8 wall verts, 4 floor verts and 4 room verts, 8 wall triangles, 2 floor and 2 room triangles
+    verts, triangles = 16, 12
+
+    export.export_floorplans(str(tmp_path / "floorplan.obj"), [data_path])
+    with open(str(tmp_path / "floorplan.obj")) as f:
+        lines = f.read().splitlines()
+    assert sum(line.startswith("v ") for line in lines) == verts
+    assert sum(line.startswith("f ") for line in lines) == triangles
+    # floor indices continue after the wall verts
+    assert min(int(i) for line in lines if line.startswith("f ") for i in line.split()[1:]) == 1
+    assert max(int(i) for line in lines if line.startswith("f ") for i in line.split()[1:]) == verts
+    assert (tmp_path / "floorplan.mtl").exists()
+
+    export.export_floorplans(str(tmp_path / "floorplan.ply"), [data_path])
+    with open(str(tmp_path / "floorplan.ply"), "rb") as f:
+        data = f.read()
+    header, body = data.split(b"end_header\n")
+    assert b"element vertex 16" in header and b"element face 12" in header
+    assert len(body) == verts * 15 + triangles * 13
+
+    export.export_floorplans(str(tmp_path / "floorplan.stl"), [data_path])
+    with open(str(tmp_path / "floorplan.stl"), "rb") as f:
+        data = f.read()
+    assert struct.unpack("<I", data[80:84])[0] == triangles
+    assert len(data) == 84 + triangles * 50
+
+    # floor is mirrored by the floorplan rotation, z up
+    floor = np.frombuffer(data[84:], dtype=np.dtype([("normal", "<f4", 3), ("verts", "<f4", (3, 3)), ("attribute", "<u2")]))[8:10]
+    assert np.allclose(floor["verts"][..., 0].min(), -1) and np.allclose(floor["verts"][..., 0].max(), 0)
+    assert np.allclose(floor["verts"][..., 2], 0)
+
+def test_write_in_chunks(tmp_path, monkeypatch):
+    data_path = str(tmp_path) + "/"
+    create_data(data_path)
+
+    (tmp_path / "small").mkdir()
+    (tmp_path / "large").mkdir()
+
+    for extension in [".obj", ".ply"]:
+        monkeypatch.setattr(export, "chunk_size", 3)
+        export.export_floorplans(str(tmp_path / "small" / "floorplan") + extension, [data_path])
+        monkeypatch.setattr(export, "chunk_size", 65536)
+        export.export_floorplans(str(tmp_path / "large" / "floorplan") + extension, [data_path])
+
+        small = (tmp_path / "small" / "floorplan").with_suffix(extension).read_bytes()
+        assert small == (tmp_path / "large" / "floorplan").with_suffix(extension).read_bytes()
@@ -0,0 +1,158 @@
+import pytest
+import sys
+import os
+import cv2
+import numpy as np
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+from benchmark import synthetic_floorplan
+
+images = os.path.dirname(os.path.realpath(__file__)) + "/../Images/"
+
+def generate_upscaled(tmp_path, name, upscale, levels):
+    '''
+    Generate example image upscaled without interpolation, room detection settings and scale
+    are upscaled the same, so data is the same as of the example itself
+    @Return FloorplanImage, path to data, shape
+    '''
+    img = IO.read_image(images + name)
+    img = cv2.resize(img, None, fx=upscale, fy=upscale, interpolation=cv2.INTER_NEAREST)
+    context = generate.GenerationContext(str(tmp_path / (name + str(upscale) + "_" + str(levels))) + os.path.sep,
+                                         scale=100 * upscale, noise_removal_threshold=50 * upscale**2,
+                                         room_closing_max_length=130 * upscale, gap_in_wall_min_threshold=5000 * upscale**2,
+                                         pyramid_levels=levels, wall_thickness=None)
+    os.makedirs(context.path)
+    image = generate.get_floorplan_image(img, context)
+    path, shape = generate.generate_all_files(image, False, context=context)
+    return image, path, shape
+
+def test_pyramid_generation(tmp_path):
+    image, path, shape = generate_upscaled(tmp_path, "example.png", 1, 0)
+    rooms = IO.read_from_file(path + "rooms_verts")
+    walls = IO.read_from_file(path + "wall_mesh_verts")
+    assert len(rooms) == 4
+
+    # image upscaled by 2 ** levels is the example again on the pyramid level
+    for levels in [1, 2]:
+        image, path, pyramid_shape = generate_upscaled(tmp_path, "example.png", 2 ** levels, levels)
+        assert image.settings_factor == 2 ** levels
+        assert len(IO.read_from_file(path + "rooms_verts")) == len(rooms)
+        assert len(IO.read_from_file(path + "wall_mesh_verts")) == len(walls)
+        assert np.allclose(pyramid_shape, shape, atol=0.05)
+
+def test_pyramid_levels_of_thin_walls(tmp_path):
+    image, path, shape = generate_upscaled(tmp_path, "example3.png", 1, 0)
+    rooms = IO.read_from_file(path + "rooms_verts")
+
+    # walls of about 5 pixels are too thin for any level, detected at full resolution instead
+    for levels in [1, 2]:
+        image, path, pyramid_shape = generate_upscaled(tmp_path, "example3.png", 1, levels)
+        assert image.settings_factor == 1
+        assert IO.read_from_file(path + "rooms_verts") == rooms
+        assert pyramid_shape == shape
+
+def test_tiled_generation_same_data(tmp_path):
+    paths = []
+    for tile_size in [None, 200]:
+        context = generate.GenerationContext(str(tmp_path / str(tile_size)) + os.path.sep, tile_size=tile_size)
+        os.makedirs(context.path)
+        generate.generate_all_files(images + "example.png", False, context=context)
+        paths.append(context.path)
+
+    for name in os.listdir(paths[0]):
+        with open(paths[0] + name, "rb") as f, open(paths[1] + name, "rb") as g:
+            assert f.read() == g.read(), name
+
+def test_generate_from_memory(tmp_path):
+    with open(images + "example.png", "rb") as f:
+        data = f.read()
+
+    paths = []
+    for img in [images + "example.png", data, IO.read_image(data, grayscale=False)]:
+        context = generate.GenerationContext(str(tmp_path / str(len(paths))) + os.path.sep)
+        os.makedirs(context.path)
+        generate.generate_all_files(img, False, context=context)
+        paths.append(context.path)
+
+    for path in paths[1:]:
+        for name in os.listdir(paths[0]):
+            with open(paths[0] + name, "rb") as f, open(path + name, "rb") as g:
+                assert f.read() == g.read(), name
+
+def test_wall_thickness_normalisation(tmp_path):
+    img_path = str(tmp_path / "floorplan.png")
+    size, wall_thickness = 4000, 40
+    cv2.imwrite(img_path, synthetic_floorplan(size, rooms=8, wall_thickness=wall_thickness, openings=2))
+
+    context = generate.GenerationContext(str(tmp_path) + os.path.sep)
+    image = generate.get_floorplan_image(img_path, context)
+    path, shape = generate.generate_all_files(image, False, context=context)
+
+    # walls detected at canonical thickness by default, data in original pixel space
+    assert image.factor > 1.5
+    assert abs(detect.estimate_wall_thickness(image.gray) - detect.canonical_wall_thickness) <= 2
+    assert len(IO.read_from_file(path + "rooms_verts")) == 8
+
+    # outer wall of synthetic plan is drawn at a margin of a tenth of the image, height is 3/4 of width
+    margin = size // 10
+    outer = np.array([size - 2 * margin, size * 3 // 4 - 2 * margin]) + wall_thickness
+    assert np.allclose(shape[:2], outer / context.scale, atol=0.1)
+
+def test_pyramid_details(tmp_path, monkeypatch):
+    # detail settings are checked on level 2, walls of 20 pixels are otherwise too thin for it
+    monkeypatch.setattr(detect, "pyramid_min_wall_thickness", 4)
+    img_path = str(tmp_path / "floorplan.png")
+    # many rooms, so rooms are small enough to pass as details if thresholds were in downscaled pixels
+    cv2.imwrite(img_path, synthetic_floorplan(2000, rooms=30, openings=2))
+
+    amounts = []
+    for levels in [0, 2]:
+        context = generate.GenerationContext(str(tmp_path / str(levels)) + os.path.sep, pyramid_levels=levels)
+        os.makedirs(context.path)
+        image = generate.get_floorplan_image(img_path, context)
+        assert image.settings_factor == 2 ** levels
+
+        # doors and windows are made from these details
+        details, colored = generate.find_details(image)
+        areas = details.areas * image.settings_factor**2
+        assert 0 < areas.max() < 5000
+        amounts.append(len(details))
+
+        generate.generate_small_windows_file(image, False, context)
+        windows = IO.read_from_file(context.path + "windows_verts")
+        # low and high piece of each window
+        assert len(windows) == 2 * len(details)
+
+    assert abs(amounts[0] - amounts[1]) <= amounts[0] // 4
+
+def test_wall_thickness_without_refine(tmp_path):
+    img_path = str(tmp_path / "floorplan.png")
+    cv2.imwrite(img_path, synthetic_floorplan(4000, rooms=8, wall_thickness=40, openings=2))
+
+    context = generate.GenerationContext(str(tmp_path) + os.path.sep, pyramid_levels=2, pyramid_refine=False)
+    image = generate.get_floorplan_image(img_path, context)
+    path, shape = generate.generate_all_files(image, False, context=context)
+
+    # thickness is estimated on the image decoded at reduced size, walls at canonical thickness
+    # are too thin for pyramid levels
+    assert image._full_gray is None
+    assert image.settings_factor == 1
+    assert image.factor > 1.5
+    assert len(IO.read_from_file(path + "rooms_verts")) == 8
+
+def test_context_reused_for_several_floorplans(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    context = generate.GenerationContext(scale=50)
+
+    first_path, first_shape = generate.generate_all_files(images + "example.png", False, context=context)
+    second_path, second_shape = generate.generate_all_files(images + "example2.png", False, context=context)
+
+    # each floorplan gets its own folder, the shared context is left as it was
+    assert context.path is None
+    assert first_path != second_path
+    assert IO.read_from_file(first_path + "transform")["shape"] == first_shape
+    assert IO.read_from_file(second_path + "transform")["shape"] == second_shape
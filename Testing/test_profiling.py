@@ -0,0 +1,73 @@
+import pytest
+import sys
+import os
+import json
+import time
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+
+images = os.path.dirname(os.path.realpath(__file__)) + "/../Images/"
+
+@pytest.fixture
+def profile():
+    profiling.enable()
+    yield
+    profiling.disable()
+    profiling.reset()
+
+def test_disabled():
+    profiling.reset()
+    with profiling.stage("outer") as stage:
+        stage.count("walls", 1)
+    profiling.count("walls", 1)
+    transform.create_wall_mesh([])
+    assert profiling.records == []
+
+def test_generate_report(tmp_path, profile):
+    context = generate.GenerationContext(str(tmp_path) + os.path.sep)
+    generate.generate_all_files(images + "example.png", False, context=context)
+
+    summary = profiling.report()["summary"]
+    assert summary["generate.generate_all_files"]["calls"] == 1
+    assert summary["IO.read_image"]["calls"] == 1
+    assert summary["detect.find_rooms"]["counts"]["rooms"] > 0
+    assert summary["detect.detectPreciseBoxes"]["counts"]["contours"] > 0
+    assert summary["generate.generate_walls_file"]["counts"]["walls"] > 0
+    assert summary["IO.save_to_file"]["calls"] > 1
+
+    stages = {record["name"]: record for record in profiling.records}
+    outer = stages["generate.generate_all_files"]
+    assert outer["depth"] == 0
+    assert stages["detect.find_rooms"]["depth"] > 0
+    # peak of outer stage includes peaks of stages inside it
+    assert outer["memory"] >= max(record["memory"] for record in profiling.records)
+    assert outer["wall"] >= stages["generate.generate_mesh_files"]["wall"]
+
+    profiling.save_report(str(tmp_path / "report.json"))
+    profiling.save_trace(str(tmp_path / "trace.json"))
+    with open(str(tmp_path / "trace.json")) as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == len(profiling.records)
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+
+def test_without_reset_peak_or_thread_time(monkeypatch, profile):
+    # python before 3.9 has no tracemalloc.reset_peak, before 3.7 no time.thread_time
+    monkeypatch.setattr(profiling, "can_reset_peak", False)
+    monkeypatch.setattr(profiling, "cpu_time", time.process_time)
+
+    with profiling.stage("outer"):
+        with profiling.stage("inner"):
+            data = bytearray(1 << 20)
+        del data
+        with profiling.stage("small"):
+            small = bytearray(1 << 10)
+
+    stages = {record["name"]: record for record in profiling.records}
+    assert stages["inner"]["memory"] >= 1 << 20
+    assert stages["small"]["memory"] < 1 << 20
+    assert stages["outer"]["memory"] >= stages["inner"]["memory"]
+    assert all(record["cpu"] >= 0 for record in profiling.records)
@@ -0,0 +1,78 @@
+import pytest
+import numpy as np
+import sys
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+
+# two boxes as contours from cv2, a square and a triangle
+boxes = [np.array([[[0,0]],[[100,0]],[[100,100]],[[0,100]]], np.int32),
+         np.array([[[200,0]],[[300,0]],[[300,100]]], np.int32)]
+
+def test_create_nx4_verts_array():
+    verts, offsets, faces = transform.create_nx4_verts_array(boxes, height=2, scale=100)
+
+    assert verts.shape == (7,4,3)
+    assert list(offsets) == [0,4,7]
+    assert faces == [(0,1,3,2)]
+    # first wall of square
+    assert verts[0].tolist() == [[0,0,0],[0,0,2],[1,0,0],[1,0,2]]
+    # last wall of triangle links back to its first corner
+    assert verts[6].tolist() == [[3,1,0],[3,1,2],[2,0,0],[2,0,2]]
+
+def test_create_nx4_verts_and_faces_list_api():
+    verts, faces, wall_amount = transform.create_nx4_verts_and_faces(boxes, height=2, scale=100)
+    array, offsets, faces = transform.create_nx4_verts_array(boxes, height=2, scale=100)
+
+    assert wall_amount == 7
+    assert [len(box) for box in verts] == [4,3]
+    assert verts[1] == array[4:].tolist()
+
+def test_verts_bounding_box_of_ragged_verts():
+    # walls as array, rooms as ragged lists, more positions than the recursion limit
+    walls = np.ones((2000,4,3))
+    rooms = [[(0.5,2,1)]*3, [(4,-1,0.999)]*5000]
+
+    low, high = transform.verts_bounding_box([walls, rooms])
+
+    assert low.tolist() == [0.5,-1,0.999]
+    assert high.tolist() == [4,2,1]
+    assert len(transform.verts_to_poslist(rooms)) == 5003
+    assert transform.verts_bounding_box([[], []]) is None
+
+def test_get_shape():
+    assert generate.get_shape([[(1,1,0),(3,2,1)]], 100) == [2,1,1]
+    assert generate.get_shape([], 100) == [0,0,0]
+
+def test_create_wall_mesh_shares_verts():
+    verts, faces = transform.create_wall_mesh(boxes, height=2, scale=100)
+    walls, offsets, wall_faces = transform.create_nx4_verts_array(boxes, height=2, scale=100)
+
+    assert verts.shape == (14,3)
+    assert faces.shape == (7,4)
+    # same walls as one mesh per wall
+    assert (verts[faces] == walls[:, list(wall_faces[0])]).all()
+
+def test_triangulate_concave_polygon():
+    # L shaped room, clockwise
+    room = np.array([[0,0],[0,3],[1,3],[1,1],[4,1],[4,0]])
+
+    triangles = transform.triangulate_polygon(room)
+
+    a, b, c = room[triangles[:,0]], room[triangles[:,1]], room[triangles[:,2]]
+    areas = (b[:,0]-a[:,0])*(c[:,1]-a[:,1]) - (b[:,1]-a[:,1])*(c[:,0]-a[:,0])
+    assert triangles.shape == (4,3)
+    # same winding as room, covering all of it
+    assert (areas < 0).all()
+    assert areas.sum() == -12
+
+def test_triangulate_wall_faces():
+    verts, faces = transform.create_wall_mesh(boxes, height=2, scale=100)
+
+    triangles = transform.triangulate_faces(verts, faces)
+
+    assert triangles.shape == (14,3)
+    assert triangles[:2].tolist() == [[0,1,3],[0,3,2]]
@@ -0,0 +1,50 @@
+import pytest
+import sys
+import stat
+try:
+    sys.path.insert(0,'..')
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+except ImportError:
+    from FloorplanToBlenderLib import * # floorplan to blender lib
+
+
+# Stands in for blender running the worker, replies with its process id
+fake_blender = '''#!{python}
+import json, os, sys
+print("Blender 2.93 (fake)", flush=True)
+print("{reply}" + json.dumps({{"ok": True, "ready": True}}), flush=True)
+for line in sys.stdin:
+    job = json.loads(line)
+    if job.get("quit"):
+        break
+    print("Info: building", flush=True)
+    if job["data_paths"] == ["fail"]:
+        reply = {{"ok": False, "error": "no data"}}
+    else:
+        reply = {{"ok": True, "files": [str(os.getpid())]}}
+    print("{reply}" + json.dumps(reply), flush=True)
+'''
+
+def create_fake_blender(tmp_path):
+    blender_path = tmp_path / "blender"
+    blender_path.write_text(fake_blender.format(python=sys.executable, reply=worker.worker_reply))
+    blender_path.chmod(blender_path.stat().st_mode | stat.S_IEXEC)
+    return str(blender_path)
+
+def test_worker_pool_reuses_blender(tmp_path):
+    blender_path = create_fake_blender(tmp_path)
+
+    with worker.BlenderWorkerPool(blender_path, str(tmp_path), size=2) as pool:
+        first = pool.build(str(tmp_path), ["Data/0/"])
+        second = pool.build(str(tmp_path), ["Data/1/"], ["glb"])
+
+        with pytest.raises(RuntimeError):
+            pool.build(str(tmp_path), ["fail"])
+        third = pool.build(str(tmp_path), ["Data/2/"])
+
+        # one job at a time only needs one blender
+        assert first == second == third
+        assert len(pool.workers) == 1
+        process = pool.workers[0].process
+
+    assert process.poll() == 0
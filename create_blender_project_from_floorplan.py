@@ -57,9 +57,9 @@ if __name__ == "__main__":
         exit(0)
 
     print("\nGenerate datafiles in folder: Data\n")
-    print("Clean datafiles")
+    print("Remove least recently used datafiles")
 
-    IO.clean_data_folder("Data" + os.path.sep)
+    datastore.collect()
 
     # Generate data files
     data_paths = list()
@@ -77,6 +77,8 @@ if __name__ == "__main__":
     else:
         data_paths = [execution.simple_single(image_paths[0])]
 
+    # Keep cache of generated data within its limits
+    cache.prune()
 
     print("\nCreates blender project\n")
 
@@ -91,6 +93,9 @@ if __name__ == "__main__":
         ] + data_paths
     )
 
+    for data_path in data_paths:
+        datastore.release(data_path)
+
     print("Project created at: " + program_path + os.path.sep + 'Target' + os.path.sep + 'floorplan.blend\n')
     print("Done, Have a nice day!")
 
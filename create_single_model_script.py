@@ -2,7 +2,7 @@ import os
 import argparse
 from subprocess import check_output
 
-from FloorplanToBlenderLib import IO, execution
+from FloorplanToBlenderLib import IO, execution, export, cache, datastore, profiling
 
 
 if __name__ == '__main__':
@@ -26,31 +26,59 @@ if __name__ == '__main__':
     parser.add_argument('-m', '--mode', default=default_mode,
                         help='Mode. Default value is taken from config.ini.')
 
+    parser.add_argument('-e', '--export-formats', default='gltf,blend',
+                        help='Comma separated output formats, gltf, glb, obj, ply, stl or blend. Blender is only started for blend.')
+
+    parser.add_argument('-p', '--profile', action='store_true',
+                        help='Measure time and memory of each stage, saved as profile.json and profile_trace.json in the output folder.')
+
     args = parser.parse_args()
 
+    if args.profile:
+        profiling.enable()
+
     # Set other paths (don't need to change these)
     program_path = os.path.dirname(os.path.realpath(__file__))
     blender_script_path = 'Blender' + os.path.sep + 'floorplan_to_3dObject_in_blender.py'
 
-    IO.clean_data_folder('Data' + os.path.sep)
+    # Remove least recently used data, keeps data of running jobs
+    datastore.collect()
 
     data_path = execution.simple_single(args.image_path)
 
+    # Keep cache of generated data within its limits
+    cache.prune()
+
     if not os.path.exists(args.output_folder):
         os.mkdir(args.output_folder)
 
     output_path = program_path + os.path.sep + args.output_folder
 
-    # Create blender project
-    check_output([
-        args.blender_install_path,
-        '-noaudio', # this is a dockerfile ubuntu hax fix
-        '--background',
-        '--python',
-        blender_script_path,
-        program_path, # Send this as parameter to script
-        output_path,
-        data_path,
-    ])
+    formats = args.export_formats.split(',')
+
+    # Create blender project, blender also exports gltf
+    if 'blend' in formats:
+        formats = [f for f in formats if f not in ('blend', 'gltf')]
+        with profiling.stage('blender'):
+            check_output([
+                args.blender_install_path,
+                '-noaudio', # this is a dockerfile ubuntu hax fix
+                '--background',
+                '--python',
+                blender_script_path,
+                program_path, # Send this as parameter to script
+                output_path,
+                data_path,
+            ])
+
+    # Other formats are written without blender
+    for f in formats:
+        export.export_floorplans(output_path + os.path.sep + 'floorplan.' + f, [program_path + os.path.sep + data_path])
+
+    datastore.release(data_path)
+
+    if args.profile:
+        profiling.save_report(output_path + os.path.sep + 'profile.json')
+        profiling.save_trace(output_path + os.path.sep + 'profile_trace.json')
 
     print('\nFiles created at:', output_path)